@@ -0,0 +1,207 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Write reproducible tar archives of package and build set trees. The
+# members are written in sorted order with the same modification time and
+# no owner so the same tree always gives the same archive. The tar stream
+# is piped to a compressor command, which can be a parallel compressor,
+# or is compressed by Python if there is no command.
+#
+# The build scripts run this as a command so it only uses the standard
+# library.
+#
+
+from __future__ import print_function
+
+import getopt
+import os
+import subprocess
+import sys
+import tarfile
+import time
+
+#
+# The compressor commands for each format in the order they are preferred.
+# The commands read the tar stream on stdin and write to stdout.
+#
+formats = {
+    'bz2': ['%{__lbzip2} -c', '%{__pbzip2} -c', '%{__bzip2} -c'],
+    'xz': ['%{__xz} -T0 -c'],
+    'zst': ['%{__zstd} -T0 -q -c']
+}
+
+
+def compressor(fmt, config, found):
+    """Return the first compressor command for the format the host has
+    or None. The found function checks an executable."""
+    for command in formats[fmt]:
+        command = config.expand(command)
+        if found(command.split()[0]) is not None:
+            return command
+    return None
+
+
+class _counter:
+    """Count the bytes written to a file object. Writes after closing are
+    dropped as a failed tar stream flushes when it is deleted."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes = 0
+        self.closed = False
+
+    def write(self, data):
+        if not self.closed:
+            self.bytes += len(data)
+            self.fileobj.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.fileobj.close()
+
+
+def _members(src, arcname):
+    yield src, arcname
+    if os.path.isdir(src) and not os.path.islink(src):
+        for name in sorted(os.listdir(src)):
+            for member in _members(os.path.join(src, name),
+                                   arcname + '/' + name):
+                yield member
+
+
+def _python_compressor(fmt, output):
+    if fmt == 'bz2':
+        import bz2
+        return bz2.BZ2File(output, 'w')
+    if fmt == 'xz':
+        import lzma
+        return lzma.LZMAFile(output, 'w')
+    raise IOError('no compressor for format: %s' % (fmt))
+
+
+def write(output, roots, fmt, command=None, mtime=0):
+    """Write the roots, a list of source and archive name pairs, to the
+    output archive. Return the number of tar bytes and the seconds taken."""
+    start = time.time()
+    proc = None
+    out = None
+    if command is not None:
+        out = open(output, 'wb')
+        proc = subprocess.Popen(command.split(),
+                                stdin=subprocess.PIPE,
+                                stdout=out)
+        sink = _counter(proc.stdin)
+    else:
+        sink = _counter(_python_compressor(fmt, output))
+    ok = False
+    try:
+        tar = tarfile.open(fileobj=sink, mode='w|', format=tarfile.GNU_FORMAT)
+        for src, arcname in roots:
+            for name, member_name in _members(src, arcname):
+                info = tar.gettarinfo(name, member_name)
+                if info is None:
+                    continue
+                info.uid = 0
+                info.gid = 0
+                info.uname = ''
+                info.gname = ''
+                info.mtime = mtime
+                if info.isreg():
+                    with open(name, 'rb') as f:
+                        tar.addfile(info, f)
+                else:
+                    tar.addfile(info)
+        tar.close()
+        ok = True
+    finally:
+        failure = None
+        try:
+            sink.close()
+        except (IOError, OSError) as err:
+            failure = err
+        if proc is not None:
+            exit_code = proc.wait()
+            out.close()
+            if exit_code != 0:
+                failure = IOError('compressor failed: %s: exit code %d' %
+                                  (command, exit_code))
+        if not ok or failure is not None:
+            if os.path.exists(output):
+                os.remove(output)
+        if ok and failure is not None:
+            raise failure
+    return sink.bytes, time.time() - start
+
+
+def report(output, size, seconds, command=None):
+    """A line reporting the archive's throughput."""
+    mb = 1024.0 * 1024.0
+    if command is None:
+        method = 'python'
+    else:
+        method = os.path.basename(command.split()[0])
+    return 'archive: %s: %0.1fMB in %0.2fs (%0.1fMB/s, %s) -> %0.1fMB' % \
+        (os.path.basename(output), size / mb, seconds,
+         size / mb / max(seconds, 0.001), method,
+         os.stat(output).st_size / mb)
+
+
+def run(args):
+    try:
+        opts, args = getopt.getopt(args[1:], 'c:f:m:o:')
+    except getopt.GetoptError as err:
+        print('error: archive: %s' % (err), file=sys.stderr)
+        return 2
+    fmt = 'bz2'
+    command = None
+    mtime = 0
+    output = None
+    for o, a in opts:
+        if o == '-c':
+            command = a
+        elif o == '-f':
+            fmt = a
+        elif o == '-m':
+            mtime = int(a)
+        elif o == '-o':
+            output = a
+    if output is None or len(args) == 0 or fmt not in formats:
+        print('usage: archive.py -o output [-f bz2|xz|zst] [-c compressor] ' \
+              '[-m mtime] dir[=arcname] ...', file=sys.stderr)
+        return 2
+    roots = []
+    for arg in args:
+        if '=' in arg:
+            roots += [tuple(arg.split('=', 1))]
+        else:
+            roots += [(arg, arg)]
+    try:
+        size, seconds = write(output, roots, fmt, command, mtime)
+    except (tarfile.TarError, IOError, OSError) as err:
+        print('error: archive: %s: %s' % (output, err), file=sys.stderr)
+        return 1
+    print(report(output, size, seconds, command))
+    sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
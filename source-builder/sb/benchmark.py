@@ -0,0 +1,395 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Benchmarks of the tree operations a build performs on a synthetic tree
+# shaped like an installed GCC tool prefix: a few large executables, many
+# small headers in deep directories, a library tree per multilib and the
+# links the tools install.
+#
+# The http benchmark fetches many small patches from a local server that
+# delays each new connection as a TCP and TLS handshake to a remote host
+# would.
+#
+# The trace benchmark measures the cost of trace messages with tracing off,
+# parsing every config file in the tree and a dry run of a build set.
+#
+# Run from the source-builder directory:
+#
+#  $ python -m sb.benchmark [-s scale] [-d dir] [-m macros] [-b bset] \
+#        copy-tree get-size http trace
+#
+
+from __future__ import print_function
+
+import copy
+import getopt
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import http.server as http_server
+    import socketserver
+    import urllib.request as urllib_request
+except ImportError:
+    import BaseHTTPServer as http_server
+    import SocketServer as socketserver
+    import urllib2 as urllib_request
+
+from . import build
+from . import config
+from . import error
+from . import expandcheck
+from . import httpclient
+from . import log
+from . import options
+from . import path
+from . import setbuilder
+
+_target = 'sparc-rtems7'
+_version = '13.3.0'
+
+
+def _write(name, size, block):
+    d = os.path.dirname(name)
+    if not os.path.isdir(d):
+        os.makedirs(d)
+    with open(name, 'wb') as f:
+        while size > 0:
+            f.write(block[:size])
+            size -= len(block)
+
+
+def gcc_prefix(root, scale=1):
+    """Create a tree shaped like an installed GCC prefix. Return the number
+    of files and bytes written."""
+    block = os.urandom(64 * 1024)
+    files = 0
+    size = 0
+    tools = [
+        'addr2line', 'ar', 'as', 'c++', 'c++filt', 'cpp', 'g++', 'gcc',
+        'gcc-ar', 'gcc-nm', 'gcc-ranlib', 'gcov', 'gdb', 'gprof', 'ld',
+        'ld.bfd', 'nm', 'objcopy', 'objdump', 'ranlib', 'readelf', 'size',
+        'strings', 'strip'
+    ]
+    for tool in tools:
+        name = os.path.join(root, 'bin', '%s-%s' % (_target, tool))
+        _write(name, 2 * 1024 * 1024 * scale, block)
+        os.chmod(name, 0o755)
+        files += 1
+        size += 2 * 1024 * 1024 * scale
+    os.symlink('%s-gcc' % (_target),
+               os.path.join(root, 'bin', '%s-gcc-%s' % (_target, _version)))
+    libexec = os.path.join(root, 'libexec', 'gcc', _target, _version)
+    for tool in ['cc1', 'cc1plus', 'lto1', 'collect2', 'lto-wrapper']:
+        _write(os.path.join(libexec, tool), 24 * 1024 * 1024 * scale, block)
+        files += 1
+        size += 24 * 1024 * 1024 * scale
+    plugin = os.path.join(root, 'lib', 'gcc', _target, _version, 'plugin',
+                          'include')
+    for d in range(0, 40 * scale):
+        for h in range(0, 30):
+            _write(os.path.join(plugin, 'dir-%d' % (d), 'header-%d.h' % (h)),
+                   6 * 1024, block)
+            files += 1
+            size += 6 * 1024
+    include = os.path.join(root, _target, 'include')
+    for d in range(0, 20 * scale):
+        for h in range(0, 50):
+            _write(os.path.join(include, 'sys-%d' % (d), 'header-%d.h' % (h)),
+                   3 * 1024, block)
+            files += 1
+            size += 3 * 1024
+    for m in range(0, 16 * scale):
+        multilib = os.path.join(root, 'lib', 'gcc', _target, _version,
+                                'multilib-%d' % (m))
+        for lib, lib_size in [('libgcc.a', 1024 * 1024),
+                              ('libgcov.a', 256 * 1024),
+                              ('crtbegin.o', 4096), ('crtend.o', 2048)]:
+            _write(os.path.join(multilib, lib), lib_size, block)
+            files += 1
+            size += lib_size
+        lib = os.path.join(root, _target, 'lib', 'multilib-%d' % (m))
+        for l, lib_size in [('libc.a', 4 * 1024 * 1024),
+                            ('libm.a', 1024 * 1024),
+                            ('libstdc++.a', 6 * 1024 * 1024)]:
+            _write(os.path.join(lib, l), lib_size, block)
+            files += 1
+            size += lib_size
+        os.symlink('libstdc++.a', os.path.join(lib, 'libstdc++.so'))
+    for page in range(0, 60):
+        _write(
+            os.path.join(root, 'share', 'man', 'man1',
+                         '%s-page-%d.1' % (_target, page)), 8 * 1024, block)
+        files += 1
+        size += 8 * 1024
+    return files, size
+
+
+def _time(label, files, size, function):
+    start = time.time()
+    function()
+    seconds = time.time() - start
+    mb = size / (1024.0 * 1024.0)
+    print('%-24s %8.2fs %8.1fMB/s %8.0f files/s' % \
+          (label, seconds, mb / max(seconds, 0.001),
+           files / max(seconds, 0.001)))
+
+
+def copy_tree(root, files, size):
+    """Copy the tree with shutil's copy as the reference and then with each
+    path.copy_tree mode, and copy over an existing copy."""
+    src = os.path.join(root, 'prefix')
+    runs = [('shutil.copytree', None, None, True),
+            ('copy, 1 worker', 'copy', 1, True),
+            ('copy, %d workers' % (path.copy_tree_workers), 'copy', None, True),
+            ('copy, existing', 'copy', None, False),
+            ('hardlink', 'hardlink', None, True),
+            ('reflink', 'reflink', None, True)]
+    dst = None
+    for label, mode, workers, fresh in runs:
+        if fresh:
+            if dst is not None:
+                shutil.rmtree(os.path.dirname(dst))
+            dst = os.path.join(tempfile.mkdtemp(prefix='copy-', dir=root),
+                               'prefix')
+        if mode is None:
+            function = lambda: shutil.copytree(src, dst, symlinks=True)
+        else:
+            function = lambda: path.copy_tree(src, dst, mode, workers)
+        _time(label, files, size, function)
+    shutil.rmtree(os.path.dirname(dst))
+
+
+def get_size(root, files, size):
+    """Measure the tree with one and many threads and with the directory
+    sizes cached."""
+    src = os.path.join(root, 'prefix')
+    workers = path.get_size_workers
+    try:
+        path.get_size_workers = 1
+        _time('get_size, 1 worker', files, size, lambda: path.get_size(src))
+    finally:
+        path.get_size_workers = workers
+    _time('get_size, %d workers' % (workers), files, size,
+          lambda: path.get_size(src))
+    path.get_sizes([src], cache=True)
+    _time('get_sizes, cached', files, size,
+          lambda: path.get_sizes([src], cache=True))
+    path.forget_size(src)
+
+
+class _patch_server(socketserver.ThreadingMixIn, http_server.HTTPServer):
+    daemon_threads = True
+
+
+class _patch_handler(http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    connect_delay = 0.03
+    patch = b'-' * 4096
+
+    def setup(self):
+        time.sleep(self.connect_delay)
+        http_server.BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.patch)))
+        self.end_headers()
+        self.wfile.write(self.patch)
+
+    def log_message(self, *args):
+        pass
+
+
+def http(root, files, size):
+    """Fetch small patches from a local server with a new connection for
+    each as urllib does and with the pooled client, one at a time and with
+    a thread for each connection to the host."""
+    server = _patch_server(('127.0.0.1', 0), _patch_handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base = 'http://127.0.0.1:%d/patches/' % (server.server_address[1])
+    patches = 200
+    patch_size = len(_patch_handler.patch)
+
+    def _urllib(url):
+        f = urllib_request.urlopen(url)
+        f.read()
+        f.close()
+
+    def _pooled(url):
+        f = httpclient.urlopen(url)
+        f.read()
+        f.close()
+
+    def _fetch(fetch, threads):
+        urls = [base + 'patch-%d.diff' % (p) for p in range(0, patches)]
+        workers = [
+            threading.Thread(target=lambda u=urls[t::threads]: \
+                             [fetch(url) for url in u])
+            for t in range(0, threads)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    connections = httpclient.host_connections
+    try:
+        for threads in [1, 4]:
+            httpclient.host_connections = threads
+            httpclient.close()
+            _time('urllib, %d thread(s)' % (threads), patches,
+                  patches * patch_size, lambda: _fetch(_urllib, threads))
+            _time('pooled, %d thread(s)' % (threads), patches,
+                  patches * patch_size, lambda: _fetch(_pooled, threads))
+    finally:
+        httpclient.host_connections = connections
+        httpclient.close()
+        server.shutdown()
+        server.server_close()
+    for host, requests, connects in httpclient.stats():
+        print('pooled: %s: %d requests, %d connections' % \
+              (host, requests, connects))
+
+
+def _seconds(label, count, function):
+    """Time the function with its output discarded."""
+    stdout = sys.stdout
+    start = time.time()
+    try:
+        with open(os.devnull, 'w') as null:
+            sys.stdout = null
+            function()
+    finally:
+        sys.stdout = stdout
+    seconds = time.time() - start
+    print('%-24s %8.2fs %8.0f/s' % \
+          (label, seconds, count / max(seconds, 0.001)))
+
+
+def trace(root, files, size):
+    """Time trace messages of the defaults with tracing off rendered before
+    the call and deferred by the call, parsing every config file in the
+    tree and a dry run of a build set."""
+    top = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    cwd = os.getcwd()
+    tracing = log.tracing
+    try:
+        os.chdir(path.host(path.join(top, 'rtems')))
+        args = [
+            path.join(top, 'source-builder', 'sb-set-builder'), '--dry-run',
+            '--without-log', '--prefix=%s' % (os.path.join(root, 'prefix'))
+        ]
+        if _macros is not None:
+            args += ['--macros=%s' % (_macros)]
+        opts = options.load(args, logfile=False)
+        log.tracing = False
+        messages = 200
+        _seconds('trace, rendered', messages,
+                 lambda: [log.trace('%s' % (str(opts.defaults)))
+                          for m in range(0, messages)])
+        _seconds('trace, deferred', messages,
+                 lambda: [log.trace('%s', opts.defaults)
+                          for m in range(0, messages)])
+        cfgs = expandcheck.configs(top)
+
+        def _parse():
+            for c in cfgs:
+                try:
+                    config.file(c, copy.copy(opts),
+                                copy.copy(opts.defaults))
+                except error.general:
+                    pass
+
+        _seconds('parse, %d configs' % (len(cfgs)), len(cfgs), _parse)
+        configs = build.get_configs(opts)
+        _seconds('dry run, %s' % (_bset), 1,
+                 lambda: setbuilder.buildset(_bset, configs, opts).build())
+    finally:
+        log.tracing = tracing
+        os.chdir(cwd)
+
+
+benchmarks = {
+    'copy-tree': copy_tree,
+    'get-size': get_size,
+    'http': http,
+    'trace': trace
+}
+
+#
+# The benchmarks that need the synthetic tree.
+#
+_tree_benchmarks = ['copy-tree', 'get-size']
+
+#
+# The macro file and build set the trace benchmark uses.
+#
+_macros = None
+_bset = '7/rtems-sparc'
+
+
+def run(args):
+    global _macros, _bset
+    try:
+        opts, args = getopt.getopt(args[1:], 's:d:m:b:')
+    except getopt.GetoptError as err:
+        print('error: benchmark: %s' % (err), file=sys.stderr)
+        return 2
+    scale = 1
+    directory = None
+    for o, a in opts:
+        if o == '-s':
+            scale = int(a)
+        elif o == '-d':
+            directory = a
+        elif o == '-m':
+            _macros = os.path.abspath(a)
+        elif o == '-b':
+            _bset = a
+    if len(args) == 0 or [a for a in args if a not in benchmarks]:
+        print('usage: benchmark [-s scale] [-d dir] [-m macros] [-b bset] ' \
+              '%s' % ('|'.join(sorted(benchmarks))), file=sys.stderr)
+        return 2
+    root = tempfile.mkdtemp(prefix='rsb-benchmark-', dir=directory)
+    try:
+        files = 0
+        size = 0
+        if [a for a in args if a in _tree_benchmarks]:
+            start = time.time()
+            files, size = gcc_prefix(os.path.join(root, 'prefix'), scale)
+            print('tree: %d files, %0.1fMB (%0.2fs)' % \
+                  (files, size / (1024.0 * 1024.0), time.time() - start))
+        for benchmark in args:
+            benchmarks[benchmark](root, files, size)
+    finally:
+        shutil.rmtree(root)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
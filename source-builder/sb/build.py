@@ -33,8 +33,11 @@ import stat
 import sys
 
 try:
+    from . import archive
+    from . import buildcache
     from . import check
     from . import config
+    from . import configindex
     from . import download
     from . import error
     from . import ereport
@@ -43,6 +46,8 @@ try:
     from . import options
     from . import path
     from . import sources
+    from . import sourcecache
+    from . import trash
     from . import version
 except KeyboardInterrupt:
     print('abort: user terminated')
@@ -52,6 +57,17 @@ except:
 
 file_exts = ['.cfg', '.bset', '.binc']
 
+#
+# The parallel decompressors for each compression type in the order they
+# are preferred.
+#
+parallel_decompressors = {
+    'gzip': ['%{__pigz} -dc'],
+    'bzip2': ['%{__lbzip2} -dc', '%{__pbzip2} -dc'],
+    'xz': ['%{__xz} -T0 -dc'],
+    'zstd': ['%{__zstd} -T0 -dc']
+}
+
 
 def humanize_number(num, suffix):
     for unit in ['', 'K', 'M', 'G', 'T', 'P', 'E', 'Z']:
@@ -61,6 +77,23 @@ def humanize_number(num, suffix):
     return "%.3f%s%s" % (size, 'Y', suffix)
 
 
+def archive_settings(config):
+    """Return the format, compressor command and member modification time
+    of the package and build set archives. The command is None if the host
+    has no compressor for the format."""
+    fmt = config.expand('%{_tar_format}')
+    if fmt not in archive.formats:
+        raise error.general('invalid tar format: %s' % (fmt))
+    command = archive.compressor(fmt, config, check.host_exe)
+    mtime = os.environ.get('SOURCE_DATE_EPOCH',
+                           config.expand('%{_tar_mtime}'))
+    try:
+        mtime = int(mtime)
+    except ValueError:
+        raise error.general('invalid tar mtime: %s' % (mtime))
+    return fmt, command, mtime
+
+
 def short_name(name):
     #
     # If on Windows use short names to keep the build paths as short as possible.
@@ -155,6 +188,12 @@ class build:
             self._sources = []
             self._patches = []
             self._hashes = []
+            self.source_cache = None
+            self._cache_segments = []
+            self._cache_segment = None
+            self.build_cache = None
+            self.fingerprint = None
+            self.prefetch()
         except error.general as gerr:
             log.notice(str(gerr))
             log.stderr('Build FAILED')
@@ -184,7 +223,7 @@ class build:
         log.output('removing: %s' % (path.host(rmpath)))
         if not self.opts.dry_run():
             if path.exists(rmpath):
-                path.removeall(rmpath)
+                trash.remove(rmpath, self.config, self.opts)
 
     def mkdir(self, mkpath):
         log.output('making dir: %s' % (path.host(mkpath)))
@@ -212,14 +251,55 @@ class build:
             _disable_installing = False
         _no_install = self.opts.no_install()
         log.trace('_build: installable: host=%s build=%s ' \
-                  'no-install=%r Cxc=%r disable_installing=%r disabled=%r' % \
-                  (_host, _build, _no_install, _canadian_cross, _disable_installing, \
-                   self.disabled()))
+                  'no-install=%r Cxc=%r disable_installing=%r disabled=%r',
+                  _host, _build, _no_install, _canadian_cross,
+                  _disable_installing, self.disabled())
         return len(_host) and len(_build) and \
             not self.disabled() and \
             not _disable_installing and \
             not _canadian_cross
 
+    def prefetch(self):
+        """Start downloading the sources and patches in the background. The
+        script generation waits for each file as it needs it. Errors are
+        ignored here and reported when the file is needed."""
+        if not download.prefetching(self.opts):
+            return
+        log.hold()
+        try:
+            for _map in self.macros.maps():
+                if _map.startswith('source-'):
+                    pathkey = '_sourcedir'
+                elif _map.startswith('patch-'):
+                    pathkey = '_patchdir'
+                else:
+                    continue
+                for key in self.macros.map_keys(_map):
+                    if key == 'setup':
+                        continue
+                    m = self.macros.get(key, globals=False, maps=_map)
+                    if m is None:
+                        continue
+                    url = []
+                    file_override = None
+                    for u in m[2].split():
+                        if len(url) == 0 and u[0] == '-':
+                            if u.startswith('--rsb-file='):
+                                file_override = u.split('=', 1)[1]
+                        else:
+                            url += [u]
+                    try:
+                        url = self.config.expand(' '.join(url))
+                        src = download.parse_url(url, pathkey, self.config,
+                                                 self.opts, file_override,
+                                                 prefetch=True)
+                        download.prefetch(src['url'], src['local'], self.opts,
+                                          self.config)
+                    except error.general:
+                        pass
+        finally:
+            log.release()
+
     def source(self, name, strip_components, download_only, copy_target):
         #
         # Return the list of sources. Merge in any macro defined sources as
@@ -274,27 +354,71 @@ class build:
                     tar_extract_key = '__tar_extract_trace'
                 else:
                     tar_extract_key = '__tar_extract'
-                if strip_components > 0:
-                    tar_extract = '%{' + tar_extract_key + '} --strip-components %d' % \
-                        (strip_components)
-                else:
-                    tar_extract = '%{' + tar_extract_key + '}'
                 if 'symlink' in src:
                     sname = name.replace('-', '_')
                     src['script'] = '%%{__ln_s} %s ${source_dir_%s}' % \
                         (src['symlink'], sname)
-                elif 'compressed' in src:
+                elif 'compressed' in src and \
+                     src['compressed-type'] == 'zip':
                     #
                     # Zip files unpack as well so do not use tar.
                     #
                     src['script'] = '%s %s' % (src['compressed'], src['local'])
-                    if src['compressed-type'] != 'zip':
-                        src['script'] += ' | %s -f -' % (tar_extract)
                 else:
-                    src['script'] = '%s -f %s' % (tar_extract, src['local'])
+                    src['script'] = self.extract_script(src, tar_extract_key,
+                                                        strip_components)
             srcs += [src]
         return srcs
 
+    def extract_script(self, src, tar_extract_key, strip_components):
+        """Return the command to extract a tar file source. A compressed
+        source is decompressed with a parallel decompressor if the host has
+        one."""
+        backend = self.config.expand('%{_source_extract}')
+        if backend not in ['auto', 'python', 'shell']:
+            raise error.general('invalid source extract backend: %s' %
+                                (backend))
+        if options.host_windows:
+            backend = 'shell'
+        tar_extract = '%{' + tar_extract_key + '}'
+        decompressor = None
+        if 'compressed' in src:
+            decompressor = src['compressed']
+            if backend == 'auto':
+                for pd in parallel_decompressors.get(src['compressed-type'],
+                                                     []):
+                    exe = self.config.expand(pd).split()[0]
+                    if check.host_exe(exe) is not None:
+                        decompressor = pd
+                        break
+        if backend == 'shell':
+            if strip_components > 0:
+                tar_extract += ' --strip-components %d' % (strip_components)
+            if decompressor is None:
+                return '%s -f %s' % (tar_extract, src['local'])
+            return '%s %s | %s -f -' % (decompressor, src['local'],
+                                        tar_extract)
+        #
+        # Use the tarfile module if the host cannot run the commands.
+        #
+        commands = [tar_extract]
+        if decompressor is not None:
+            commands += [decompressor]
+        for command in commands:
+            if check.host_exe(self.config.expand(command).split()[0]) is None:
+                backend = 'python'
+        script = '%{__source_extract}'
+        if strip_components > 0:
+            script += ' -s %d' % (strip_components)
+        if backend == 'python':
+            if self.opts.trace():
+                script += ' -v'
+        else:
+            script += " -t '%s'" % (tar_extract)
+            if decompressor is not None:
+                script += " -d '%s'" % (decompressor)
+        return '%s %s' % (script, src['local'])
+
     def source_setup(self, package, args):
         log.output('source setup: %s: %s' % (package.name(), ' '.join(args)))
         setup_name = args[1]
@@ -345,6 +469,25 @@ class build:
         self._sources += srcs
         if not download.enabled(self.opts):
             return
+        #
+        # A source that is unpacked into a fresh directory can be held in the
+        # source cache. The extract and patch commands are moved to a
+        # segment that is run or taken from the cache before the build.
+        #
+        self._cache_segment = None
+        setup_script = self.script_build
+        if self.source_cache is not None and opt_name is not None and \
+           delete_before_unpack and not download_only and \
+           not options.host_windows and \
+           len([s for s in srcs if 'symlink' in s]) == 0:
+            self._cache_segment = {
+                'setup': setup_name,
+                'name': opt_name,
+                'files': [s['local'] for s in srcs],
+                'script': script()
+            }
+            self._cache_segments += [self._cache_segment]
+            setup_script = self._cache_segment['script']
         for source in srcs:
             if name is None:
                 if opt_name is None:
@@ -356,20 +499,20 @@ class build:
                 else:
                     name = opt_name
             if download_only and copy_target is not None:
-                self.script_build.append(self.config.expand(source['script']))
+                setup_script.append(self.config.expand(source['script']))
             if not download_only:
-                self.script_build.append(self.config.expand('cd %{_builddir}'))
+                setup_script.append(self.config.expand('cd %{_builddir}'))
                 if not deleted_dir and delete_before_unpack and name is not None:
-                    self.script_build.append(
+                    setup_script.append(
                         self.config.expand('%{__rm} -rf ' + name))
                     deleted_dir = True
                 if not created_dir and create_dir and name is not None:
-                    self.script_build.append(
+                    setup_script.append(
                         self.config.expand('%{__mkdir_p} ' + name))
                     created_dir = True
                 if not changed_dir and (not unpack_before_chdir or create_dir) and \
                    name is not None:
-                    self.script_build.append(self.config.expand('cd ' + name))
+                    setup_script.append(self.config.expand('cd ' + name))
                     changed_dir = True
                 #
                 # On Windows tar can fail on links if the link appears in the
@@ -378,29 +521,33 @@ class build:
                 # so on error redo the untar a second time.
                 #
                 if options.host_windows or no_errors:
-                    self.script_build.append('set +e')
-                self.script_build.append(self.config.expand(source['script']))
+                    setup_script.append('set +e')
+                setup_script.append(self.config.expand(source['script']))
                 if options.host_windows or not no_errors:
-                    self.script_build.append('tar_exit=$?')
+                    setup_script.append('tar_exit=$?')
                 if options.host_windows or no_errors:
-                    self.script_build.append('set -e')
+                    setup_script.append('set -e')
                 if options.host_windows:
                     if no_errors:
-                        self.script_build.append(' set +e')
-                        self.script_build.append(
+                        setup_script.append(' set +e')
+                        setup_script.append(
                             ' ' + self.config.expand(source['script']))
-                        self.script_build.append(' set -e')
+                        setup_script.append(' set -e')
                     else:
-                        self.script_build.append(
+                        setup_script.append(
                             'if test $tar_exit != 0; then')
-                        self.script_build.append(
+                        setup_script.append(
                             ' ' + self.config.expand(source['script']))
-                        self.script_build.append('fi')
+                        setup_script.append('fi')
         if not changed_dir and (unpack_before_chdir and not create_dir) and \
            name is not None and not download_only:
-            self.script_build.append(self.config.expand('cd ' + name))
+            setup_script.append(self.config.expand('cd ' + name))
             changed_dir = True
-        self.script_build.append(self.config.expand('%{__setup_post}'))
+        setup_script.append(self.config.expand('%{__setup_post}'))
+        if self._cache_segment is not None:
+            self.script_build.append(self.config.expand('cd %{_builddir}'))
+            if changed_dir:
+                self.script_build.append(self.config.expand('cd ' + name))
 
     def patch_setup(self, package, args):
         name = args[1]
@@ -462,11 +609,17 @@ class build:
             else:
                 patch['script'] = '%{__cat} ' + patch['local']
             patch['script'] += ' | %%{__patch} %s' % (opts)
-            self.script_build.append(self.config.expand(patch['script']))
+            segment = self._cache_segment
+            if segment is not None and segment['setup'] == name:
+                segment['files'] += [patch['local']]
+                segment['script'].append(self.config.expand(patch['script']))
+            else:
+                self.script_build.append(self.config.expand(patch['script']))
             self._patches += [patch]
 
     def run(self, command, shell_opts='', cwd=None):
-        e = execute.capture_execution(log=log.default, dump=self.opts.quiet())
+        e = execute.capture_execution(log=log.thread_log(),
+                                      dump=self.opts.quiet())
         cmd = self.config.expand('%{___build_shell} -ex ' + shell_opts + ' ' +
                                  command)
         log.output('run: ' + cmd)
@@ -481,13 +634,88 @@ class build:
             self.rmdir(builddir)
             self.mkdir(builddir)
 
+    def _file_hash(self, local):
+        hash = sources.get_hash(path.basename(local).lower(), self.macros)
+        if hash is not None and not hash.startswith('NO-HASH'):
+            return hash
+        return 'sha512 ' + download.file_digest('sha512', local)[0]
+
+    def source_cache_prep(self):
+        """Fill the build directory with the cached source trees. A tree not
+        in the cache is extracted and patched by running its segment and
+        then added to the cache."""
+        builddir = self.config.abspath('_builddir')
+        for s in range(0, len(self._cache_segments)):
+            segment = self._cache_segments[s]
+            body = os.linesep.join(segment['script'].body)
+            body = body.replace(builddir, '%{_builddir}')
+            hashes = []
+            for f in segment['files']:
+                hashes += [self._file_hash(f)]
+                body = body.replace(f, path.basename(f))
+            key = sourcecache.make_key(hashes, body)
+            tree = path.join(builddir, segment['name'])
+            if self.source_cache.get(key, tree):
+                log.notice('source cache: %s' % (segment['name']))
+                continue
+            before = set(path.listdir(builddir))
+            prep_sn = path.join(builddir, 'do-prep-%d' % (s + 1))
+            prep = script()
+            prep.body = self.config.expand('%{___build_template}').splitlines()
+            prep.body += segment['script'].body
+            log.output('write script: ' + prep_sn)
+            prep.write(prep_sn)
+            self.run(prep_sn)
+            created = set(path.listdir(builddir)) - before
+            if created == set([segment['name'], path.basename(prep_sn)]):
+                self.source_cache.put(key, tree)
+
+    def build_fingerprint(self):
+        """Make the package's fingerprint from the fingerprint of the
+        packages built before it. A package with a source that cannot be
+        hashed gets a fingerprint that is never in the cache."""
+        scripts = [self.script_build.body, self.script_clean.body]
+        for segment in self._cache_segments:
+            scripts += [segment['script'].body]
+        hashes = []
+        for f in self._sources + self._patches:
+            local = f.get('local')
+            if 'symlink' in f or local is None or not path.isfile(local):
+                log.trace('build cache: not hashable: %s', f.get('url'))
+                return sourcecache.make_key(os.getpid(), os.urandom(16))
+            hashes += [self._file_hash(local)]
+        triplets = [self.config.expand('%%{%s}' % (t))
+                    for t in ['_host', '_build', '_target']]
+        tools = None
+        if self.build_cache is not None:
+            tools = buildcache.toolchain(self.config)
+        return buildcache.fingerprint(self.fingerprint, scripts, hashes,
+                                      triplets, tools)
+
+    def build_cacheable(self):
+        """A package is only cached if everything it builds is in its
+        buildroot."""
+        if self.build_cache is None or self.create_tar_files:
+            return False
+        if self.macros.get('%{_disable_collecting}'):
+            return False
+        if self.macros.get('_disable_installing') and \
+           self.config.expand('%{_disable_installing}') == 'yes':
+            return False
+        return True
+
     def prep(self, package):
         self.script_build.append('echo "==> %prep:"')
+        self.source_cache = sourcecache.open_cache(self.config, self.opts)
+        self._cache_segments = []
+        self._cache_segment = None
         _prep = package.prep()
         if _prep:
             for l in _prep:
                 args = l.split()
                 if len(args):
+                    if args[:2] != ['%setup', 'patch']:
+                        self._cache_segment = None
 
                     def err(msg):
                         raise error.general('%s: %s' % (package, msg))
@@ -542,10 +770,17 @@ class build:
             self.script_build.append(
                 self.config.expand('  %%{__mkdir_p} %s' % tardir))
             self.script_build.append(self.config.expand('  cd ' + inpath))
-            tar = path.join(tardir, package.long_name() + '.tar.bz2')
-            cmd = self.config.expand('  %{__tar} -cf - . ' +
-                                     '| %{__bzip2} > ' + tar)
-            self.script_build.append(cmd)
+            fmt, command, mtime = archive_settings(self.config)
+            tar = path.join(tardir, package.long_name() + '.tar.' + fmt)
+            if options.host_windows and command is not None:
+                cmd = '  %%{__tar} -cf - . | %s > %s' % (command, tar)
+            else:
+                cmd = '  %%{__archive_write} -f %s -m %d -o %s' % \
+                    (fmt, mtime, tar)
+                if command is not None:
+                    cmd += " -c '%s'" % (command)
+                cmd += ' .'
+            self.script_build.append(self.config.expand(cmd))
             self.script_build.append(self.config.expand('  cd %{_builddir}'))
             self.script_build.append('fi')
 
@@ -562,17 +797,23 @@ class build:
 
     def sizes(self, package):
 
-        def _sizes(package, what, path):
-            package.set_size(what, path)
+        def _sizes(package, what, path, size):
+            package.add_size(what, size)
             s = humanize_number(package.get_size(what), 'B')
-            log.trace('size: %s (%s): %s (%d)' %
-                      (what, path, s, package.get_size(what)))
+            log.trace('size: %s (%s): %s (%d)',
+                      what, path, s, package.get_size(what))
             return s
 
+        #
+        # Measure each tree once with the trees measured at the same time.
+        #
+        trees = [self.config.expand('%{_builddir}'),
+                 self.config.expand('%{buildroot}')]
+        tree_sizes = dict(zip(trees, path.get_sizes(trees)))
         s = {}
-        for p in [('build', '%{_builddir}'), ('build', '%{buildroot}'),
-                  ('installed', '%{buildroot}')]:
-            hs = _sizes(package, p[0], self.config.expand(p[1]))
+        for p in [('build', trees[0]), ('build', trees[1]),
+                  ('installed', trees[1])]:
+            hs = _sizes(package, p[0], p[1], tree_sizes[p[1]])
             s[p[0]] = hs
         log.notice('sizes: %s: %s (installed: %s)' %
                    (package.name(), s['build'], s['installed']))
@@ -598,14 +839,14 @@ class build:
             builddir = self.config.abspath('_builddir')
             buildcxcdir = self.config.abspath('_buildcxcdir')
             tmproot = self.config.abspath('_tmproot')
-            log.trace('cleanup: %s' % (buildroot))
+            log.trace('cleanup: %s', buildroot)
             self.rmdir(buildroot)
-            log.trace('cleanup: %s' % (builddir))
+            log.trace('cleanup: %s', builddir)
             self.rmdir(builddir)
             if self.canadian_cross():
-                log.trace('cleanup: %s' % (buildcxcdir))
+                log.trace('cleanup: %s', buildcxcdir)
                 self.rmdir(buildcxcdir)
-            log.trace('cleanup: %s' % (tmproot))
+            log.trace('cleanup: %s', tmproot)
             self.rmdir(tmproot)
 
     def main_package(self):
@@ -627,8 +868,8 @@ class build:
                 else:
                     cxc_label = ''
                 log.notice('package: %s%s' % (cxc_label, name))
-                log.trace('---- macro maps %s' % ('-' * 55))
-                log.trace('%s' % (str(self.config.macros)))
+                log.trace('---- macro maps %s', '-' * 55)
+                log.trace('%s', self.config.macros)
                 log.trace('-' * 70)
                 self.script_build.reset()
                 self.script_build.append(
@@ -637,21 +878,38 @@ class build:
                 self.prep(package)
                 self.build_package(package)
                 self.builddir()
+                cached = False
+                if not self.opts.dry_run():
+                    self.build_cache = buildcache.open_cache(
+                        self.config, self.opts)
+                    self.fingerprint = self.build_fingerprint()
+                    log.trace('build cache: fingerprint: %s', self.fingerprint)
+                    buildroot = self.config.abspath('buildroot')
+                    if self.build_cacheable():
+                        cached = self.build_cache.get(self.fingerprint,
+                                                      buildroot)
+                    if not cached and self.source_cache is not None:
+                        self.source_cache_prep()
                 build_sn = path.join(self.config.expand('%{_builddir}'),
                                      'do-build')
                 clean_sn = path.join(self.config.expand('%{_builddir}'),
                                      'do-clean')
-                log.trace('script: ' + build_sn)
-                log.trace(str(self.script_build))
-                log.trace('script: ' + clean_sn)
-                log.trace(str(self.script_clean))
+                log.trace('script: %s', build_sn)
+                log.trace('%s', self.script_build)
+                log.trace('script: %s', clean_sn)
+                log.trace('%s', self.script_clean)
                 if not self.opts.dry_run():
                     log.output('write script: ' + build_sn)
                     self.script_build.write(build_sn)
                     log.output('write script: ' + clean_sn)
                     self.script_clean.write(clean_sn)
-                    log.notice('building: %s%s' % (cxc_label, name))
-                    self.run(build_sn)
+                    if cached:
+                        log.notice('cached: %s%s' % (cxc_label, name))
+                    else:
+                        log.notice('building: %s%s' % (cxc_label, name))
+                        self.run(build_sn)
+                        if self.build_cacheable():
+                            self.build_cache.put(self.fingerprint, buildroot)
                     self.sizes(package)
                     log.notice('cleaning: %s%s' % (cxc_label, name))
                     self.run(clean_sn)
@@ -707,15 +965,10 @@ class build:
 def get_configs(opts):
 
     def _scan(_path, ext):
-        configs = []
-        for root, dirs, files in os.walk(_path):
-            prefix = root[len(_path) + 1:]
-            for file in files:
-                for e in ext:
-                    if file.endswith(e):
-                        configs += [path.join(prefix, file)]
-        return configs
+        return [path.join(prefix, file) \
+                for prefix, file in configindex.files(_path, ext)]
 
+    configindex.refresh()
     configs = {'paths': [], 'files': []}
     paths = opts.defaults.expand('%{_configdir}').split(':')
     root = path.host(os.path.commonprefix(paths))
@@ -733,16 +986,23 @@ def get_configs(opts):
 
 
 def find_config(config, configs):
+    #
+    # The files are indexed by name and by name without the extension the
+    # first time a config is found. The first file in the sorted list is
+    # found as the search did.
+    #
+    if '_names' not in configs:
+        names = {}
+        for c in configs['files']:
+            r, e = path.splitext(c)
+            names.setdefault((r, e), c)
+            names.setdefault((r, ''), c)
+        configs['_names'] = names
     config_root, config_ext = path.splitext(config)
     if config_ext not in [''] + file_exts:
         config_root = config
         config_ext = ''
-    for c in configs['files']:
-        r, e = path.splitext(c)
-        if config_root == r:
-            if config_ext == '' or config_ext == e:
-                return c
-    return None
+    return configs['_names'].get((config_root, config_ext))
 
 
 def run(args):
@@ -0,0 +1,223 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# A cache of package build results. A package's buildroot is stored as an
+# archive under the package's fingerprint. The fingerprint is made from the
+# package's build script, the hashes of its sources and patches, the parts
+# of the environment a build depends on, the host triplets, the host
+# compilers and the fingerprint of the packages built before it. A package
+# with a fingerprint in the cache restores its buildroot rather than
+# building.
+#
+# The tools a package builds against in the prefix are staged by the
+# packages built before it in the build set so the fingerprints of those
+# packages cover them. The prefix itself is not looked at, it changes when
+# a build set is installed and a cache keyed on it would never hit again.
+#
+# The fingerprint cannot cover everything a build may use from the host or
+# the prefix so the cache is only used if _build_cache_dir is set.
+#
+# The entries are managed the same way as the source cache's entries.
+#
+
+from __future__ import print_function
+
+import hashlib
+import os
+import tarfile
+import threading
+
+from . import check
+from . import error
+from . import execute
+from . import log
+from . import path
+from . import sourcecache
+
+#
+# Bump if the layout of an entry or what a fingerprint covers changes.
+#
+version = 3
+
+#
+# The host compilers a build uses.
+#
+compilers = ['__cc', '__cxx']
+
+#
+# The environment variables a build depends on that are not in its script.
+#
+environment = [
+    'PATH', 'LD_LIBRARY_PATH', 'LIBRARY_PATH', 'CPATH', 'C_INCLUDE_PATH',
+    'CPLUS_INCLUDE_PATH', 'PKG_CONFIG_PATH', 'CC', 'CXX', 'CPP', 'CFLAGS',
+    'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'MAKEFLAGS'
+]
+
+#
+# The open caches by directory.
+#
+_caches = {}
+
+#
+# The identity of the host tools by name.
+#
+_tools = {}
+_tools_lock = threading.Lock()
+
+
+def _tool(exe):
+    """The identity of a host tool is its path, its version output and the
+    hash of its file."""
+    with _tools_lock:
+        if exe in _tools:
+            return _tools[exe]
+    found = check.host_exe(exe)
+    if found is None:
+        identity = (exe, None)
+    else:
+        e = execute.capture_execution()
+        try:
+            exit_code, proc, output = e.spawn([path.host(found), '--version'])
+        except error.general:
+            exit_code, output = None, None
+        hasher = hashlib.sha256()
+        try:
+            with open(path.host(found), 'rb') as f:
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+        except (IOError, OSError):
+            pass
+        identity = (exe, found, exit_code, output, hasher.hexdigest())
+    log.trace('build cache: tool: %s: %s', exe, identity[-1])
+    with _tools_lock:
+        _tools[exe] = identity
+    return identity
+
+
+def toolchain(config):
+    """The identity of the host compilers a package builds with."""
+    tools = []
+    for macro in compilers:
+        exe = config.expand('%%{%s}' % (macro)).split()
+        if len(exe) > 0:
+            tools += [_tool(exe[0])]
+    return tools
+
+
+def fingerprint(chain, script, hashes, triplets, tools):
+    env = [(e, os.environ.get(e)) for e in environment]
+    return sourcecache.make_key('build', version, chain, script, hashes, env,
+                                triplets, tools)
+
+
+def _extract(tar, dst):
+    #
+    # The archives are created by the cache so they are trusted. Python's
+    # with extraction filters warn or restrict links if not told this.
+    #
+    if hasattr(tarfile, 'fully_trusted_filter'):
+        tar.extractall(path.host(dst), filter='fully_trusted')
+    else:
+        tar.extractall(path.host(dst))
+
+
+class cache(sourcecache.cache):
+    """A size limited cache of package buildroots."""
+
+    label = 'build cache'
+
+    def __init__(self, directory, size):
+        sourcecache.cache.__init__(self, directory, size, None)
+
+    def get(self, key, buildroot):
+        """Restore the buildroot of the key. Return False if the key is not
+        in the cache."""
+        entry = self._entry(key)
+        archive = path.join(entry, 'buildroot.tar')
+        if not path.isfile(archive):
+            return False
+        try:
+            os.utime(path.host(entry), None)
+            if path.exists(buildroot):
+                path.removeall(buildroot)
+            path.mkdir(buildroot)
+            tar = tarfile.open(path.host(archive), 'r')
+            try:
+                _extract(tar, buildroot)
+            finally:
+                tar.close()
+        except (error.general, tarfile.TarError, IOError, OSError) as err:
+            log.output('%s: %s: get failed: %s' % (self.label, key, err))
+            if path.exists(buildroot):
+                path.removeall(buildroot)
+            return False
+        log.output('%s: %s: hit: %s' % (self.label, key, buildroot))
+        return True
+
+    def put(self, key, buildroot):
+        """Add an archive of the buildroot to the cache. Failing to add a
+        buildroot is not an error."""
+        entry = self._entry(key)
+        if path.exists(entry):
+            return
+        tmp = self._tmp(entry)
+        try:
+            if path.exists(tmp):
+                path.removeall(tmp)
+            path.mkdir(tmp)
+            archive = path.join(tmp, 'buildroot.tar')
+            tar = tarfile.open(path.host(archive), 'w')
+            try:
+                if path.isdir(buildroot):
+                    tar.add(path.host(buildroot), arcname='.')
+            finally:
+                tar.close()
+            size = os.stat(path.host(archive)).st_size
+            with open(path.host(path.join(tmp, 'size')), 'w') as f:
+                f.write('%d\n' % (size))
+            os.rename(path.host(tmp), path.host(entry))
+            log.output('%s: %s: added: %s' % (self.label, key, buildroot))
+        except (error.general, tarfile.TarError, IOError, OSError) as err:
+            log.output('%s: %s: put failed: %s' % (self.label, key, err))
+            if path.exists(tmp):
+                path.removeall(tmp)
+            return
+        self.evict()
+
+
+def open_cache(config, opts):
+    """Return the build cache or None if it is disabled."""
+    if opts.no_build_cache() or opts.dry_run():
+        return None
+    directory = config.expand('%{_build_cache_dir}')
+    if len(directory) == 0:
+        return None
+    directory = path.abspath(directory)
+    if directory not in _caches:
+        path.mkdir(directory)
+        _caches[directory] = \
+            cache(directory,
+                  sourcecache._parse_size(
+                      config.expand('%{_build_cache_size}')))
+        _caches[directory].evict()
+    return _caches[directory]
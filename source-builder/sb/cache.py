@@ -0,0 +1,131 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# On disk cache of results that are the same for every command run on a
+# host. Each entry has a key made from the things the result depends on
+# and is only used if the key matches.
+#
+# The cache directory is $RSB_CACHE or ~/.cache/rsb. Setting RSB_CACHE to
+# an empty string disables the cache.
+#
+
+from __future__ import print_function
+
+import hashlib
+import os
+import pickle
+import sys
+
+from . import log
+
+#
+# Bump if the format of any entry changes.
+#
+version = 1
+
+
+def directory():
+    if 'RSB_CACHE' in os.environ:
+        cache_dir = os.environ['RSB_CACHE']
+        if len(cache_dir) == 0:
+            return None
+        return cache_dir
+    if 'HOME' in os.environ:
+        return os.path.join(os.environ['HOME'], '.cache', 'rsb')
+    return None
+
+
+def _entry(name):
+    cache_dir = directory()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir,
+                        '%s-py%d.pickle' % (name, sys.version_info[0]))
+
+
+def file_key(name):
+    """The key of a file is its name, modification time, size and hash."""
+    try:
+        st = os.stat(name)
+        hasher = hashlib.sha1()
+        with open(name, 'rb') as f:
+            hasher.update(f.read())
+        return (name, st.st_mtime, st.st_size, hasher.hexdigest())
+    except (IOError, OSError):
+        return (name, None)
+
+
+def module_key(module):
+    """The key of a module is its source file's modification time and size."""
+    name = module.__file__
+    if name.endswith('.pyc') or name.endswith('.pyo'):
+        name = name[:-1]
+    try:
+        st = os.stat(name)
+        return (name, st.st_mtime, st.st_size)
+    except (IOError, OSError):
+        return (name, None)
+
+
+def make_key(*items):
+    return hashlib.sha1(repr((version, ) + items).encode('utf-8')).hexdigest()
+
+
+def load(name, key):
+    entry = _entry(name)
+    if entry is None or not os.path.exists(entry):
+        return None
+    try:
+        with open(entry, 'rb') as f:
+            cached = pickle.load(f)
+        if cached[0] != key:
+            log.trace('cache: %s: stale' % (name))
+            return None
+        log.trace('cache: %s: loaded' % (name))
+        return cached[1]
+    except:
+        log.trace('cache: %s: invalid' % (name))
+        return None
+
+
+def save(name, key, data):
+    entry = _entry(name)
+    if entry is None:
+        return
+    #
+    # Write a temporary file and rename it so a concurrent load never sees
+    # a partial entry. Failing to save is not an error.
+    #
+    tmp = '%s.%d' % (entry, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(entry)):
+            os.makedirs(os.path.dirname(entry))
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, data), f, 2)
+        if os.name == 'nt' and os.path.exists(entry):
+            os.remove(entry)
+        os.rename(tmp, entry)
+        log.trace('cache: %s: saved' % (name))
+    except (IOError, OSError) as err:
+        log.trace('cache: %s: save failed: %s' % (name, err))
+        try:
+            os.remove(tmp)
+        except:
+            pass
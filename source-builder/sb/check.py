@@ -23,10 +23,10 @@
 
 from __future__ import print_function
 
-import fnmatch
 import os
 import re
 
+from . import configindex
 from . import error
 from . import execute
 from . import log
@@ -184,15 +184,32 @@ def check_exe(label, exe):
     return _check_exe(None, label, exe, None, True)
 
 
+_host_exes = {}
+
+
+def host_exe(exe):
+    """Return the path to the executable if the host has it else None."""
+    if exe not in _host_exes:
+        found = None
+        if path.isabspath(exe):
+            if path.isfile(exe):
+                found = exe
+        elif len(exe) > 0 and 'PATH' in os.environ:
+            for p in os.environ['PATH'].split(os.pathsep):
+                if _check_paths(exe, [p]):
+                    found = path.join(p, exe)
+                    break
+        _host_exes[exe] = found
+    return _host_exes[exe]
+
+
 def check_orphans(opts):
 
-    def _find_files(path, globs, excludes=[]):
+    def _find_files(path, exts, excludes=[]):
         ff = []
-        for root, dirs, files in os.walk(path, followlinks=True):
-            for f in files:
-                for g in globs:
-                    if fnmatch.fnmatch(f, g) and f not in excludes:
-                        ff += [os.path.join(root, f)]
+        for prefix, f in configindex.files(path, exts, follow_links=True):
+            if f not in excludes:
+                ff += [os.path.join(path, prefix, f)]
         return sorted(ff)
 
     def _clean(line):
@@ -211,7 +228,7 @@ def check_orphans(opts):
             paths = opts.defaults.get_value('_configdir').split(':')
         for p in paths:
             n = path.join(opts.defaults.expand(p), name)
-            if path.exists(n):
+            if configindex.exists(n):
                 return n
         return None
 
@@ -221,7 +238,7 @@ def check_orphans(opts):
     for p in paths:
         ep = opts.defaults.expand(p)
         print('Scanning: %s (%s)' % (p, ep))
-        for f in _find_files(ep, ['*.cfg', '*.bset']):
+        for f in _find_files(ep, ['.cfg', '.bset']):
             root, ext = path.splitext(f)
             cfgs[f] = {'src': None, 'ext': ext, 'refs': 0, 'errors': []}
 
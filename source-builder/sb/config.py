@@ -34,9 +34,11 @@ import re
 import sys
 
 try:
+    from . import configindex
     from . import error
     from . import execute
     from . import log
+    from . import macros
     from . import options
     from . import path
     from . import pkgconfig
@@ -48,6 +50,16 @@ except:
     raise
 
 
+def shell_pure(macros, command):
+    """A shell macro is pure if the command matches the regular expression
+    in the '_shell_pure' macro. The output of a pure shell macro is reused
+    for the rest of the run."""
+    pure = macros.get_value('_shell_pure')
+    if pure is None or len(pure) == 0:
+        return False
+    return re.match('(?:%s)$' % (macros.expand(pure)), command) is not None
+
+
 def _check_bool(value):
     istrue = None
     if value.isdigit():
@@ -79,6 +91,71 @@ def _check_number(value):
         return False
 
 
+#
+# Config files are read, cleaned and their continued lines joined once. The
+# logical lines and the line number each ends on are kept and replayed each
+# time the file is loaded while the file is not changed.
+#
+_cleaned_configs = {}
+
+
+def _clean_config(config):
+
+    def _clean(line):
+        line = line[0:-1]
+        b = line.find('#')
+        if b >= 0:
+            line = line[1:b] + ('\\' if line[-1] == '\\' else '')
+        return line.strip()
+
+    def _clean_and_pack(line, last_line):
+        leading_ws = ' ' if len(line) > 0 and line[0].isspace() else ''
+        line = _clean(line)
+        if len(last_line) > 0:
+            line = last_line + leading_ws + line
+        return line
+
+    #
+    # Need to add code to count matching '{' and '}' and if they
+    # do not match get the next line and add to the string until
+    # they match. This closes an opening '{' that is on another
+    # line.
+    #
+    lines = []
+    lc = 0
+    ll = ''
+    for l in config:
+        lc += 1
+        l = _clean_and_pack(l, ll)
+        if len(l) == 0:
+            continue
+        if l[-1] == '\\':
+            ll = l[0:-1]
+            continue
+        ll = ''
+        lines += [(lc, l)]
+    return lines, lc
+
+
+class _config_lines:
+    """The logical lines of a config file. Iterating continues from the last
+    line taken so nested parsing shares the position in the file."""
+
+    def __init__(self, name):
+        st = os.stat(name)
+        key = (st.st_mtime, st.st_size, st.st_ino)
+        cleaned = _cleaned_configs.get(name)
+        if cleaned is None or cleaned[0] != key:
+            with open(name, 'r') as config:
+                cleaned = (key, _clean_config(config))
+            _cleaned_configs[name] = cleaned
+        lines, self.count = cleaned[1]
+        self.lines = iter(lines)
+
+    def __iter__(self):
+        return self.lines
+
+
 class package:
 
     def __init__(self, name, arch, config):
@@ -235,9 +312,12 @@ class package:
         return len(self.name()) == 0
 
     def set_size(self, what, path_):
+        self.add_size(what, path.get_size(path_))
+
+    def add_size(self, what, size):
         if what not in self.sizes:
             self.sizes[what] = 0
-        self.sizes[what] += path.get_size(path_)
+        self.sizes[what] += size
 
     def get_size(self, what):
         if what in self.sizes:
@@ -263,13 +343,28 @@ class file:
         re.compile('%disable')
     ]
 
+    #
+    # Compiled macro expansion templates shared by all configurations.
+    #
+    _templates = {}
+    _templates_size = 16384
+
+    #
+    # Template nodes with side effects. An expansion using any of these
+    # is not memoised.
+    #
+    _side_effects = [
+        'malformed', 'malformed-expand', 'echo', 'triplet', 'path', 'pkgconfig'
+    ]
+
     def __init__(self, name, opts, macros=None, load=True):
-        log.trace('config: %s: initialising' % (name))
+        log.trace('config: %s: initialising', name)
         self.opts = opts
         self.init_name = name
         self.wss = re.compile(r'\s+')
         self.tags = re.compile(r':+')
         self.sf = re.compile(r'%\([^\)]+\)')
+        self.side_effects = 0
         self.set_macros(macros)
         self._reset(name)
         if load:
@@ -372,18 +467,13 @@ class file:
 
     def _macro_split(self, s):
         '''Split the string (s) up by macros. Only split on the
-           outter level. Nested levels will need to split with futher calls.'''
-        trace_me = False
-        if trace_me:
-            print('------------------------------------------------------')
+           outter level. Nested levels will need to split with futher calls.
+           Returns a list of (start, end) spans of each macro in the string.'''
         macros = []
         nesting = []
         has_braces = False
         c = 0
         while c < len(s):
-            if trace_me:
-                print('ms:', c, '"' + s[c:] + '"', has_braces, len(nesting),
-                      nesting)
             #
             # We need to watch for shell type variables or the form '${var}' because
             # they can upset the brace matching.
@@ -421,22 +511,95 @@ class file:
                     #
                     if not has_braces:
                         if s[c] == '}':
-                            macro_start, has_braces = nesting[len(nesting) - 1]
-                            nesting = nesting[:-1]
+                            macro_start, has_braces = nesting.pop()
                             if len(nesting) == 0:
-                                macros.append(s[macro_start:c].strip())
+                                macros.append((macro_start, c))
                     if len(nesting) > 0:
-                        macro_start, has_braces = nesting[len(nesting) - 1]
-                        nesting = nesting[:-1]
+                        macro_start, has_braces = nesting.pop()
                         if len(nesting) == 0:
-                            macros.append(s[macro_start:c + 1].strip())
+                            if s[c] == '}':
+                                macros.append((macro_start, c + 1))
+                            else:
+                                macros.append((macro_start, c))
             c += 1
-        if trace_me:
-            print('ms:', macros)
-        if trace_me:
-            print('-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=')
         return macros
 
+    def _template(self, s):
+        '''Compile the string (s) into a template. A template is the
+           string and a list of the outter level macros found in it. Each
+           macro is classified once so an expansion pass is a walk over
+           the template. Templates only depend on the text so they are
+           cached and shared by all configurations.'''
+        t = file._templates.get(s)
+        if t is not None:
+            return t
+        nodes = []
+        for start, end in self._macro_split(s):
+            m = s[start:end]
+            if m[1] != '{':
+                #
+                # A macro can be '%{macro}' or '%macro'. Turn the later
+                # into the former.
+                #
+                for r in self._ignore:
+                    if r.match(m) is not None:
+                        node = ('keep', None)
+                        break
+                else:
+                    node = ('macro', (self._label(m[1:]), False))
+            elif m.startswith('%{expand'):
+                colon = m.find(':')
+                if colon < 8:
+                    node = ('malformed-expand', (m, True))
+                else:
+                    node = ('expand', m[colon + 1:-1].strip())
+            elif m.startswith('%{with '):
+                #
+                # Change the ' ' to '_' because the macros have no spaces.
+                #
+                node = ('defined',
+                        (self._label('with_' + m[7:-1].strip()), '1', '0'))
+            elif m.startswith('%{echo'):
+                if not m.endswith('}'):
+                    node = ('malformed', "malformed conditional macro '%s'" % (m))
+                else:
+                    node = ('echo', m[6:-1].strip())
+            elif m.startswith('%{defined'):
+                node = ('defined', (self._label(m[9:-1].strip()), '1', '0'))
+            elif m.startswith('%{!defined'):
+                node = ('defined', (self._label(m[10:-1].strip()), '0', '1'))
+            elif m.startswith('%{triplet'):
+                node = ('triplet', m[len('%{triplet'):-1].strip().split())
+            elif m.startswith('%{path '):
+                node = ('path', m[7:-1].strip().split())
+            elif m.startswith('%{pkgconfig '):
+                node = ('pkgconfig', m[11:-1].strip())
+            elif m.startswith('%{?') or m.startswith('%{!?'):
+                if m[2] == '!':
+                    start_ = 4
+                else:
+                    start_ = 3
+                colon = m[start_:].find(':')
+                if colon < 0:
+                    if not m.endswith('}'):
+                        node = ('malformed',
+                                "malformed conditional macro '%s'" % (m))
+                    else:
+                        node = ('conditional',
+                                (start_ == 4, self._label(m[start_:-1]), None))
+                else:
+                    node = ('conditional',
+                            (start_ == 4, self._label(m[start_:start_ + colon]),
+                             m[start_ + colon + 1:-1]))
+            else:
+                node = ('macro', (m, True))
+            nodes += [(start, end, m, node[0], node[1])]
+        t = (s, nodes)
+        if len(file._templates) >= file._templates_size:
+            file._templates.clear()
+        file._templates[s] = t
+        return t
+
     def _shell(self, line, nesting=0):
         #
         # Parse the line and handle nesting '()' pairs. If on Windows
@@ -446,7 +609,6 @@ class file:
         def _exec(shell_macro):
             output = ''
             if len(shell_macro) > 3:
-                e = execute.capture_execution()
                 if options.host_windows:
                     shell_cmd = \
                         ''.join([c if c != '"' else '\\' + c for c in shell_macro[2:-1]])
@@ -454,8 +616,9 @@ class file:
                                           shell_cmd)
                 else:
                     cmd = shell_macro[2:-1]
-                exit_code, proc, output = e.shell(cmd)
-                log.trace('shell-output: %d %s' % (exit_code, output))
+                exit_code, output = execute.shell_macro(
+                    cmd, shell_pure(self.macros, cmd))
+                log.trace('shell-output: %d %s', exit_code, output)
                 if exit_code != 0:
                     raise error.general('shell macro failed: %s: %d: %s' %
                                         (cmd, exit_code, output))
@@ -492,10 +655,10 @@ class file:
            ('with_download' in self.macros and self.macros['with_download'] == '1'):
             return '0'
         ok = False
-        log.trace('pkgconfig: check: crossc=%d pkg_crossc=%d prefix=%s' %
-                  (self._cross_compile(), self.pkgconfig_crosscompile,
-                   self.pkgconfig_prefix))
-        log.trace('pkgconfig: check: test=%s' % (test))
+        log.trace('pkgconfig: check: crossc=%d pkg_crossc=%d prefix=%s',
+                  self._cross_compile(), self.pkgconfig_crosscompile,
+                  self.pkgconfig_prefix)
+        log.trace('pkgconfig: check: test=%s', test)
         if type(test) == str:
             test = test.split()
         if not self._cross_compile() or self.pkgconfig_crosscompile:
@@ -537,7 +700,7 @@ class file:
                         if not f.startswith('-W'):
                             fflags += [f]
                     pkg_flags = ' '.join(fflags)
-                log.trace('pkgconfig: %s:  %s' % (flags, pkg_flags))
+                log.trace('pkgconfig: %s:  %s', flags, pkg_flags)
             except pkgconfig.error as pe:
                 self._error('pkgconfig: %s:  %s' % (flags, pe))
             except:
@@ -589,233 +752,220 @@ class file:
             self._error('pkgconfig error: %s' % (' '.join(pcl)))
         return ps
 
-    def _expand(self, s):
-        expand_count = 0
-        expanded = True
-        while expanded:
-            expand_count += 1
-            if expand_count > 500:
-                raise error.general('macro expand looping: %s' % (s))
-            expanded = False
-            ms = self._macro_split(s)
-            for m in ms:
-                mn = m
-                #
-                # A macro can be '%{macro}' or '%macro'. Turn the later into
-                # the former.
-                #
-                show_warning = True
-                if mn[1] != '{':
-                    for r in self._ignore:
-                        if r.match(mn) is not None:
-                            mn = None
-                            break
-                    else:
-                        mn = self._label(mn[1:])
-                        show_warning = False
-                elif m.startswith('%{expand'):
-                    colon = m.find(':')
-                    if colon < 8:
-                        log.warning(self._name_line_msg('malformed expand macro, ' \
-                                                        'no colon found'))
-                    else:
-                        e = self._expand(m[colon + 1:-1].strip())
-                        s = s.replace(m, self._label(e))
-                        expanded = True
-                        mn = None
-                elif m.startswith('%{with '):
-                    #
-                    # Change the ' ' to '_' because the macros have no spaces.
-                    #
-                    n = self._label('with_' + m[7:-1].strip())
-                    if n in self.macros:
-                        s = s.replace(m, '1')
-                    else:
-                        s = s.replace(m, '0')
-                    expanded = True
-                    mn = None
-                elif m.startswith('%{echo'):
-                    if not m.endswith('}'):
-                        log.warning(
-                            self._name_line_msg(
-                                "malformed conditional macro '%s'" % (m)))
-                        mn = None
-                    else:
-                        e = self._expand(m[6:-1].strip())
-                        log.notice('%s' % (self._name_line_msg(e)))
-                        s = ''
-                        expanded = True
-                        mn = None
-                elif m.startswith('%{defined'):
-                    n = self._label(m[9:-1].strip())
-                    if n in self.macros:
-                        s = s.replace(m, '1')
-                    else:
-                        s = s.replace(m, '0')
-                    expanded = True
-                    mn = None
-                elif m.startswith('%{!defined'):
-                    n = self._label(m[10:-1].strip())
-                    if n in self.macros:
-                        s = s.replace(m, '0')
-                    else:
-                        s = s.replace(m, '1')
-                    expanded = True
-                    mn = None
-                elif m.startswith('%{triplet'):
-                    triplet = m[len('%{triplet'):-1].strip().split()
-                    ok = False
-                    if len(triplet) == 2:
-                        macro = self._expand(triplet[0])
-                        value = self._expand(triplet[1])
-                        vorig = value
-                        arch_value = ''
-                        vendor_value = ''
-                        os_value = ''
-                        dash = value.find('-')
-                        if dash >= 0:
-                            arch_value = value[:dash]
-                            value = value[dash + 1:]
-                        dash = value.find('-')
-                        if dash >= 0:
-                            vendor_value = value[:dash]
-                            value = value[dash + 1:]
-                        if len(value):
-                            os_value = value
-                        self.macros[macro] = vorig
-                        self.macros[macro + '_cpu'] = arch_value
-                        self.macros[macro + '_arch'] = arch_value
-                        self.macros[macro + '_vendor'] = vendor_value
-                        self.macros[macro + '_os'] = os_value
+    def _expand_pass(self, template):
+        '''Expand the outter level macros in the template once. Return
+           the resulting string and if any macro was expanded.'''
+        s, nodes = template
+        if len(nodes) == 0:
+            return s, False
+        expanded = False
+        echoed = False
+        out = []
+        last = 0
+        for start, end, m, kind, arg in nodes:
+            out += [s[last:start]]
+            last = end
+            if kind in self._side_effects:
+                self.side_effects += 1
+            mn = None
+            show_warning = True
+            if kind == 'macro':
+                mn, show_warning = arg
+            elif kind == 'keep':
+                out += [m]
+            elif kind == 'malformed':
+                log.warning(self._name_line_msg(arg))
+                out += [m]
+            elif kind == 'malformed-expand':
+                log.warning(self._name_line_msg('malformed expand macro, ' \
+                                                'no colon found'))
+                mn, show_warning = arg
+            elif kind == 'expand':
+                out += [self._label(self._expand(arg))]
+                expanded = True
+            elif kind == 'defined':
+                n, if_defined, if_undefined = arg
+                if n in self.macros:
+                    out += [if_defined]
+                else:
+                    out += [if_undefined]
+                expanded = True
+            elif kind == 'echo':
+                e = self._expand(arg)
+                log.notice('%s' % (self._name_line_msg(e)))
+                echoed = True
+                expanded = True
+            elif kind == 'triplet':
+                triplet = arg
+                ok = False
+                if len(triplet) == 2:
+                    macro = self._expand(triplet[0])
+                    value = self._expand(triplet[1])
+                    vorig = value
+                    arch_value = ''
+                    vendor_value = ''
+                    os_value = ''
+                    dash = value.find('-')
+                    if dash >= 0:
+                        arch_value = value[:dash]
+                        value = value[dash + 1:]
+                    dash = value.find('-')
+                    if dash >= 0:
+                        vendor_value = value[:dash]
+                        value = value[dash + 1:]
+                    if len(value):
+                        os_value = value
+                    self.macros[macro] = vorig
+                    self.macros[macro + '_cpu'] = arch_value
+                    self.macros[macro + '_arch'] = arch_value
+                    self.macros[macro + '_vendor'] = vendor_value
+                    self.macros[macro + '_os'] = os_value
+                    ok = True
+                if not ok:
+                    self._error('triplet error: %s' % (' '.join(triplet)))
+            elif kind == 'path':
+                pl = arg
+                ok = False
+                result = ''
+                pl_0 = pl[0].lower()
+                if pl_0 == 'prepend':
+                    if len(pl) == 2:
                         ok = True
-                    if ok:
-                        s = s.replace(m, '')
-                    else:
-                        self._error('triplet error: %s' % (' '.join(triplet)))
-                    mn = None
-                elif m.startswith('%{path '):
-                    pl = m[7:-1].strip().split()
-                    ok = False
-                    result = ''
-                    pl_0 = pl[0].lower()
-                    if pl_0 == 'prepend':
-                        if len(pl) == 2:
+                        p = ' '.join([self._expand(pp) for pp in pl[1:]])
+                        if len(self.macros['_pathprepend']):
+                            self.macros['_pathprepend'] = \
+                                '%s:%s' % (p, self.macros['_pathprepend'])
+                        else:
+                            self.macros['_pathprepend'] = p
+                elif pl_0 == 'postpend':
+                    if len(pl) == 2:
+                        ok = True
+                        p = ' '.join([self._expand(pp) for pp in pl[1:]])
+                        if len(self.macros['_pathprepend']):
+                            self.macros['_pathprepend'] = \
+                                '%s:%s' % (self.macros['_pathprepend'], p)
+                        else:
+                            self.macros['_pathprepend'] = p
+                elif pl_0 == 'check':
+                    if len(pl) == 3:
+                        pl_1 = pl[1].lower()
+                        p = ' '.join([self._expand(pp) for pp in pl[2:]])
+                        if pl_1 == 'exists':
                             ok = True
-                            p = ' '.join([self._expand(pp) for pp in pl[1:]])
-                            if len(self.macros['_pathprepend']):
-                                self.macros['_pathprepend'] = \
-                                    '%s:%s' % (p, self.macros['_pathprepend'])
+                            if path.exists(p):
+                                result = '1'
                             else:
-                                self.macros['_pathprepend'] = p
-                    elif pl_0 == 'postpend':
-                        if len(pl) == 2:
+                                result = '0'
+                        elif pl_1 == 'isdir':
                             ok = True
-                            p = ' '.join([self._expand(pp) for pp in pl[1:]])
-                            if len(self.macros['_pathprepend']):
-                                self.macros['_pathprepend'] = \
-                                    '%s:%s' % (self.macros['_pathprepend'], p)
+                            if path.isdir(p):
+                                result = '1'
                             else:
-                                self.macros['_pathprepend'] = p
-                    elif pl_0 == 'check':
-                        if len(pl) == 3:
-                            pl_1 = pl[1].lower()
-                            p = ' '.join([self._expand(pp) for pp in pl[2:]])
-                            if pl_1 == 'exists':
-                                ok = True
-                                if path.exists(p):
-                                    result = '1'
-                                else:
-                                    result = '0'
-                            elif pl_1 == 'isdir':
-                                ok = True
-                                if path.isdir(p):
-                                    result = '1'
-                                else:
-                                    result = '0'
-                            elif pl_1 == 'isfile':
-                                ok = True
-                                if path.isfile(p):
-                                    result = '1'
-                                else:
-                                    result = '0'
-                    if ok:
-                        s = s.replace(m, result)
-                    else:
-                        self._error('path error: %s' % (' '.join(pl)))
-                    mn = None
-                elif m.startswith('%{pkgconfig '):
-                    pcl = m[11:-1].strip().split()
-                    if len(pcl):
-                        epcl = []
-                        for pc in pcl:
-                            epcl += [self._expand(pc)]
-                        ps = self._pkgconfig(epcl)
-                        s = s.replace(m, ps)
-                        expanded = True
-                    else:
-                        self._error('pkgconfig error: %s' % (m[11:-1].strip()))
-                    mn = None
-                elif m.startswith('%{?') or m.startswith('%{!?'):
-                    if m[2] == '!':
-                        start = 4
-                    else:
-                        start = 3
-                    colon = m[start:].find(':')
-                    if colon < 0:
-                        if not m.endswith('}'):
-                            log.warning(
-                                self._name_line_msg(
-                                    "malformed conditional macro '%s'" % (m)))
-                            mn = None
-                        else:
-                            mn = self._label(m[start:-1])
-                    else:
-                        mn = self._label(m[start:start + colon])
-                    if mn:
-                        if m.startswith('%{?'):
-                            istrue = False
-                            if mn in self.macros:
-                                # If defined and 0 or '' then it is false.
-                                istrue = _check_bool(self.macros[mn])
-                                if istrue is None:
-                                    istrue = _check_nil(self.macros[mn])
-                            if colon >= 0 and istrue:
-                                s = s.replace(m, m[start + colon + 1:-1])
-                                expanded = True
-                                mn = None
-                            elif not istrue:
-                                mn = '%{nil}'
-                        else:
-                            isfalse = True
-                            if mn in self.macros:
-                                istrue = _check_bool(self.macros[mn])
-                                if istrue is None or istrue == True:
-                                    isfalse = False
-                            if colon >= 0 and isfalse:
-                                s = s.replace(m, m[start + colon + 1:-1])
-                                expanded = True
-                                mn = None
+                                result = '0'
+                        elif pl_1 == 'isfile':
+                            ok = True
+                            if path.isfile(p):
+                                result = '1'
                             else:
-                                mn = '%{nil}'
-                if mn:
-                    if mn.lower() in self.macros:
-                        em = self.macros[mn.lower()]
-                        if self.macros.get_type(mn) == 'dir' and ':' in em:
-                            ss = []
-                            for sp in s.split():
-                                if m in sp:
-                                    sp = ':'.join([
-                                        sp.replace(mn, ps)
-                                        for ps in em.split(':')
-                                    ])
-                                ss += [sp]
-                                s = ' '.join(ss)
-                        else:
-                            s = s.replace(m, self.macros[mn.lower()])
+                                result = '0'
+                if ok:
+                    out += [result]
+                else:
+                    self._error('path error: %s' % (' '.join(pl)))
+            elif kind == 'pkgconfig':
+                pcl = arg.split()
+                if len(pcl):
+                    epcl = []
+                    for pc in pcl:
+                        epcl += [self._expand(pc)]
+                    out += [self._pkgconfig(epcl)]
+                    expanded = True
+                else:
+                    self._error('pkgconfig error: %s' % (arg))
+            elif kind == 'conditional':
+                negated, mn, body = arg
+                if not negated:
+                    istrue = False
+                    if mn in self.macros:
+                        # If defined and 0 or '' then it is false.
+                        istrue = _check_bool(self.macros[mn])
+                        if istrue is None:
+                            istrue = _check_nil(self.macros[mn])
+                    if body is not None and istrue:
+                        out += [body]
                         expanded = True
-                    elif show_warning:
-                        self._error("macro '%s' not found" % (mn))
-        return self._shell(s)
+                        mn = None
+                    elif not istrue:
+                        mn = '%{nil}'
+                else:
+                    isfalse = True
+                    if mn in self.macros:
+                        istrue = _check_bool(self.macros[mn])
+                        if istrue is None or istrue == True:
+                            isfalse = False
+                    if body is not None and isfalse:
+                        out += [body]
+                        expanded = True
+                        mn = None
+                    else:
+                        mn = '%{nil}'
+            if mn:
+                if mn.lower() in self.macros:
+                    em = self.macros[mn.lower()]
+                    if self.macros.get_type(mn) == 'dir' and ':' in em:
+                        #
+                        # A path list is expanded in place over the whole
+                        # string. The rest of the string is expanded on
+                        # the next pass.
+                        #
+                        if echoed:
+                            expanded = True
+                            continue
+                        ss = []
+                        for sp in (''.join(out) + s[start:]).split():
+                            if m in sp:
+                                sp = ':'.join([
+                                    sp.replace(mn, ps)
+                                    for ps in em.split(':')
+                                ])
+                            ss += [sp]
+                        return ' '.join(ss), True
+                    out += [em]
+                    expanded = True
+                elif show_warning:
+                    self._error("macro '%s' not found" % (mn))
+                else:
+                    out += [m]
+        if echoed:
+            return '', True
+        out += [s[last:]]
+        return ''.join(out), expanded
+
+    def _expand(self, s):
+        #
+        # The result only depends on the macro values if there are no side
+        # effects so it can be reused until a macro changes.
+        #
+        generation = self.macros.generation
+        key = (generation, 'config', s)
+        result = macros.expansions.get(key)
+        if result is not None:
+            return result
+        side_effects = self.side_effects
+        expand_count = 0
+        expanded = True
+        while expanded:
+            expand_count += 1
+            if expand_count > 500:
+                raise error.general('macro expand looping: %s' % (s))
+            s, expanded = self._expand_pass(self._template(s))
+        if '%(' in s:
+            self.side_effects += 1
+        result = self._shell(s)
+        if side_effects == self.side_effects and \
+           generation == self.macros.generation:
+            macros.expansions.put(key, result)
+        return result
 
     def _disable(self, config, ls):
         if len(ls) != 2:
@@ -823,8 +973,8 @@ class file:
         else:
             if ls[1] == 'select':
                 self.macros.lock_read_map()
-                log.trace('config: %s: %3d:  _disable_select: %s' %
-                          (self.name, self.lc, ls[1]))
+                log.trace('config: %s: %3d:  _disable_select: %s',
+                          self.name, self.lc, ls[1])
             else:
                 log.warning(
                     self._name_line_msg('invalid disable statement: %s' %
@@ -835,9 +985,8 @@ class file:
             log.warning(self._name_line_msg('invalid select statement'))
         else:
             r = self.macros.set_read_map(ls[1])
-            log.trace('config: %s: %3d:  _select: %s %s %r' % \
-                          (self.name, self.lc,
-                           r, ls[1], self.macros.maps()))
+            log.trace('config: %s: %3d:  _select: %s %s %r', self.name,
+                      self.lc, r, ls[1], self.macros.maps())
 
     def _source(self, ls):
         label = ls[0][1:]
@@ -886,8 +1035,8 @@ class file:
                 del self.macros[mn]
 
     def _ifs(self, config, ls, label, iftrue, isvalid, dir, info):
-        log.trace('config: %s: %3d:  _ifs[%i]: dir=%s %i %r' % \
-                  (self.name, self.lc, self.if_depth, str(dir), len(ls), ls))
+        log.trace('config: %s: %3d:  _ifs[%i]: dir=%s %i %r', self.name,
+                  self.lc, self.if_depth, dir, len(ls), ls)
         in_dir = dir
         in_iftrue = True
         data = []
@@ -909,9 +1058,9 @@ class file:
                     self._error(label + ' without %endif')
                     raise error.general('terminating build')
                 if r[1] == '%endif':
-                    log.trace('config: %s: %3d:  _ifs[%i]: %%endif: dir=%s %s %s %r' % \
-                              (self.name, self.lc, self.if_depth,
-                               str(dir), r[1], this_isvalid, data))
+                    log.trace('config: %s: %3d:  _ifs[%i]: %%endif: dir=%s %s %s %r',
+                              self.name, self.lc, self.if_depth,
+                              dir, r[1], this_isvalid, data)
                     if in_dir is None:
                         if dir is not None:
                             dir, info, data = self._process_directive(
@@ -948,8 +1097,8 @@ class file:
         sls = reduce(add, ls[1:], '').split()
         cls = sls
 
-        log.trace('config: %s: %3d:  _if[%i]: %s' %
-                  (self.name, self.lc, self.if_depth, sls))
+        log.trace('config: %s: %3d:  _if[%i]: %s',
+                  self.name, self.lc, self.if_depth, sls)
 
         self.if_depth += 1
 
@@ -963,31 +1112,31 @@ class file:
                 elif cls[0] == '&&':
                     join_op = 'and'
                 cls = cls[1:]
-                log.trace('config: %s: %3d:  _if[%i]: joining: %s' % \
-                          (self.name, self.lc,
-                           self.if_depth,
-                           join_op))
+                log.trace('config: %s: %3d:  _if[%i]: joining: %s',
+                          self.name, self.lc,
+                          self.if_depth,
+                          join_op)
                 # If OR and the previous check was true short circuit the evaluation
                 if join_op == 'or' and cistrue:
-                    log.trace('config: %s: %3d:  _if[%i]: OR true, short circuit eval' % \
-                              (self.name, self.lc,
-                               self.if_depth))
+                    log.trace('config: %s: %3d:  _if[%i]: OR true, short circuit eval',
+                              self.name, self.lc,
+                              self.if_depth)
                     break
             ori = 0
             andi = 0
             i = len(cls)
             if '||' in cls:
                 ori = cls.index('||')
-                log.trace('config: %s: %3d:  _if[%i}: OR found at %i' % \
-                          (self.name, self.lc,
-                           self.if_depth,
-                           ori))
+                log.trace('config: %s: %3d:  _if[%i}: OR found at %i',
+                          self.name, self.lc,
+                          self.if_depth,
+                          ori)
             if '&&' in cls:
                 andi = cls.index('&&')
-                log.trace('config: %s: %3d:  _if[%i]: AND found at %i' % \
-                          (self.name, self.lc,
-                           self.if_depth,
-                           andi))
+                log.trace('config: %s: %3d:  _if[%i]: AND found at %i',
+                          self.name, self.lc,
+                          self.if_depth,
+                          andi)
             if ori > 0 or andi > 0:
                 if ori == 0:
                     i = andi
@@ -995,10 +1144,10 @@ class file:
                     i = ori
                 else:
                     i = min(ori, andi)
-                log.trace('config: %s: %3d:  _if[%i]: next OP found at %i' % \
-                          (self.name, self.lc,
-                           self.if_depth,
-                           i))
+                log.trace('config: %s: %3d:  _if[%i]: next OP found at %i',
+                          self.name, self.lc,
+                          self.if_depth,
+                          i)
             ls = cls[:i]
             if len(ls) == 0:
                 self._error('invalid if expression: ' + reduce(add, sls, ''))
@@ -1061,8 +1210,8 @@ class file:
                 operator = ifls[1]
                 rhs = ifls[2]
                 if _check_number(lhs) and _check_number(rhs):
-                    log.trace('config: %s: %3d:  _if: numeric value check' % \
-                              (self.name, self.lc))
+                    log.trace('config: %s: %3d:  _if: numeric value check',
+                              self.name, self.lc)
                     lhs = float(lhs)
                     rhs = float(rhs)
                 if operator == '==':
@@ -1089,9 +1238,9 @@ class file:
             else:
                 cistrue = istrue
 
-            log.trace('config: %s: %3d:  _if[%i]:  %s %s %s %s' %
-                      (self.name, self.lc, self.if_depth, ifls, str(cistrue),
-                       join_op, str(istrue)))
+            log.trace('config: %s: %3d:  _if[%i]:  %s %s %s %s',
+                      self.name, self.lc, self.if_depth, ifls, cistrue,
+                      join_op, istrue)
 
         if invert:
             cistrue = not cistrue
@@ -1100,8 +1249,8 @@ class file:
 
         self.if_depth -= 1
 
-        log.trace('config: %s: %3d:  _if[%i]: %r' %
-                  (self.name, self.lc, self.if_depth, ifs_return))
+        log.trace('config: %s: %3d:  _if[%i]: %r',
+                  self.name, self.lc, self.if_depth, ifs_return)
 
         return ifs_return
 
@@ -1143,42 +1292,14 @@ class file:
     def _parse(self, config, dir, info, roc=False, isvalid=True):
         # roc = return on control
 
-        def _clean(line):
-            line = line[0:-1]
-            b = line.find('#')
-            if b >= 0:
-                line = line[1:b] + ('\\' if line[-1] == '\\' else '')
-            return line.strip()
-
-        def _clean_and_pack(line, last_line):
-            leading_ws = ' ' if len(line) > 0 and line[0].isspace() else ''
-            line = _clean(line)
-            if len(last_line) > 0:
-                line = last_line + leading_ws + line
-            return line
-
-        #
-        # Need to add code to count matching '{' and '}' and if they
-        # do not match get the next line and add to the string until
-        # they match. This closes an opening '{' that is on another
-        # line.
-        #
-        ll = ''
-        for l in config:
-            self.lc += 1
-            l = _clean_and_pack(l, ll)
-            if len(l) == 0:
-                continue
-            if l[-1] == '\\':
-                ll = l[0:-1]
-                continue
-            ll = ''
+        for lc, l in config:
+            self.lc = lc
             if isvalid:
                 indicator = '>'
             else:
                 indicator = ' '
-            log.trace('config: %s: %3d:%s%s [%s]' % \
-                          (self.name, self.lc, indicator, l, str(isvalid)))
+            log.trace('config: %s: %3d:%s%s [%s]', self.name, self.lc,
+                      indicator, l, isvalid)
             lo = l
             if isvalid:
                 l = self._expand(l)
@@ -1238,14 +1359,14 @@ class file:
                 elif ls[0] == '%if':
                     d = self._if(config, ls, isvalid, dir, info)
                     if len(d):
-                        log.trace('config: %s: %3d:  %%if: %s' %
-                                  (self.name, self.lc, d))
+                        log.trace('config: %s: %3d:  %%if: %s',
+                                  self.name, self.lc, d)
                         return ('data', d)
                 elif ls[0] == '%ifn':
                     d = self._if(config, ls, isvalid, dir, info, True)
                     if len(d):
-                        log.trace('config: %s: %3d:  %%ifn: %s' %
-                                  (self.name, self.lc, d))
+                        log.trace('config: %s: %3d:  %%ifn: %s',
+                                  self.name, self.lc, d)
                         return ('data', d)
                 elif ls[0] == '%ifos':
                     d = self._ifos(config, ls, isvalid, dir, info)
@@ -1294,14 +1415,16 @@ class file:
                     if isvalid:
                         for d in self._directive:
                             if ls[0].strip() == d:
-                                log.trace('config: %s: %3d:  _parse: directive: %s' % \
-                                          (self.name, self.lc, ls[0].strip()))
+                                log.trace('config: %s: %3d:  _parse: directive: %s',
+                                          self.name, self.lc, ls[0].strip())
                                 return ('directive', ls[0].strip(), ls[1:])
                         log.warning(self._name_line_msg("unknown directive: '" + \
                                                         ls[0] + "'"))
                         return ('data', [lo])
             else:
                 return ('data', [lo])
+        else:
+            self.lc = config.count
         return ('control', '%end', '%end')
 
     def _process_package(self, results, directive, info, data):
@@ -1331,8 +1454,8 @@ class file:
 
     def _process_data(self, results, directive, info, data):
         log.trace('config: %s: %3d:  _process_data: result=#%r# ' \
-                  'directive=#%s# info=#%r# data=#%r#' % \
-                  (self.name, self.lc, results, directive, info, data))
+                  'directive=#%s# info=#%r# data=#%r#',
+                  self.name, self.lc, results, directive, info, data)
         new_data = []
         for l in results[1]:
             if l.startswith('%error'):
@@ -1350,8 +1473,8 @@ class file:
             if not directive:
                 l = self._expand(l)
                 ls = self.tags.split(l, 1)
-                log.trace('config: %s: %3d:  _tag: %s %s' %
-                          (self.name, self.lc, l, ls))
+                log.trace('config: %s: %3d:  _tag: %s %s',
+                          self.name, self.lc, l, ls)
                 if len(ls) > 1:
                     info = ls[0].lower()
                     if info[-1] == ':':
@@ -1366,8 +1489,8 @@ class file:
                                                     (info_data.rstrip())))
             else:
                 l = self._expand(l)
-                log.trace('config: %s: %3d:  _data: %s %s' % \
-                          (self.name, self.lc, l, new_data))
+                log.trace('config: %s: %3d:  _data: %s %s',
+                          self.name, self.lc, l, new_data)
                 new_data.append(l)
         return (directive, info, data + new_data)
 
@@ -1382,8 +1505,8 @@ class file:
         self.package = _package
 
     def _directive_extend(self, dir, data):
-        log.trace('config: %s: %3d:  _directive_extend: %s: %r' % \
-                  (self.name, self.lc, dir, data))
+        log.trace('config: %s: %3d:  _directive_extend: %s: %r',
+                  self.name, self.lc, dir, data)
         self._packages[self.package].directive_extend(dir, data)
 
     def _info_append(self, info, data):
@@ -1407,15 +1530,16 @@ class file:
                 right = right[:-1]
             return end
 
-        def search_path(confignames):
+        def search_path(confignames, exists=path.exists):
             for configname in confignames.split(':'):
                 if not configname.endswith('.cfg'):
                     configname = '%s.cfg' % (configname)
-                if path.exists(configname):
+                if exists(configname):
                     return configname
             return None
 
         if self.load_depth == 0:
+            configindex.refresh()
             self._packages[self.package] = package(self.package,
                                                    self.define('%{_arch}'),
                                                    self)
@@ -1439,7 +1563,8 @@ class file:
         configname = search_path(exname)
         if configname is None:
             configname = search_path(
-                self.expand(path.join('%{_configdir}', exname)))
+                self.expand(path.join('%{_configdir}', exname)),
+                configindex.exists)
         if configname is None:
             raise error.general('no config file found: %s' %
                                 (','.join(exname.split(':'))))
@@ -1447,10 +1572,10 @@ class file:
         name = path.basename(configname)
 
         try:
-            log.trace('config: %s:  _open: %s [dir: %s info: %s]' %
-                      (self.name, path.host(configname), dir, info))
-            config = open(path.host(configname), 'r')
-        except IOError as err:
+            log.trace('config: %s:  _open: %s [dir: %s info: %s]',
+                      self.name, path.host(configname), dir, info)
+            config = _config_lines(path.host(configname))
+        except (IOError, OSError) as err:
             raise error.general('error opening config file: %s' %
                                 (path.host(configname)))
 
@@ -1486,11 +1611,7 @@ class file:
                                 (self.lc, r[0]))
                 if dir is not None:
                     self._directive_extend(dir, data)
-        except:
-            config.close()
-            raise
         finally:
-            config.close()
             self.name = save_name
             self.parent = save_parent
             self.lc = save_lc
@@ -1558,7 +1679,7 @@ def run():
         # Run where defaults.mc is located
         #
         opts = options.load(sys.argv, defaults='defaults.mc')
-        log.trace('config: count %d' % (len(opts.config_files())))
+        log.trace('config: count %d', len(opts.config_files()))
         for config_file in opts.config_files():
             s = open(config_file, opts)
             print(s)
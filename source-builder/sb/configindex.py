@@ -0,0 +1,187 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# An index of the directories holding the config and build set files. A
+# directory is listed once and its entries are kept with its modification
+# time. The scans of the config paths, the searches for a config file and
+# the checks an include or build set file exists use the index rather than
+# walking the directories and probing each candidate.
+#
+# A directory is checked against its modification time once in each
+# refresh of the index and listed again if it has changed. The index is
+# refreshed when the config paths are scanned and when a package's config
+# is loaded. The directories used are saved in the on disk cache so the next
+# command only checks them.
+#
+
+from __future__ import print_function
+
+import atexit
+import os
+import sys
+import threading
+
+from . import cache
+from . import path
+
+#
+# The process's index or None if not loaded.
+#
+_index = None
+_index_lock = threading.Lock()
+
+
+def _case(name):
+    if path.windows:
+        return name.lower()
+    return name
+
+
+class index:
+    """The entries of each directory used keyed by its host path."""
+
+    def __init__(self, dirs={}):
+        self.lock = threading.Lock()
+        self.dirs = dict(dirs)
+        self.checked = set()
+        self.used = set()
+        self.changed = False
+
+    def _scan(self, hdir):
+        try:
+            stamp = list(path._dir_stamp(hdir))
+            entries = path._scandir(hdir)
+        except OSError:
+            return None
+        files = []
+        dirs = []
+        links = []
+        for name, kind in entries:
+            if kind == 'dir':
+                dirs += [name]
+            elif kind == 'link' and os.path.isdir(os.path.join(hdir, name)):
+                dirs += [name]
+                links += [name]
+            else:
+                files += [name]
+        return {'stamp': stamp, 'files': files, 'dirs': dirs, 'links': links}
+
+    def _dir(self, hdir):
+        """The entries of a directory or None if it does not exist."""
+        with self.lock:
+            if hdir in self.checked:
+                return self.dirs.get(hdir)
+            entry = self.dirs.get(hdir)
+            try:
+                stamp = list(path._dir_stamp(hdir))
+            except OSError:
+                stamp = None
+            if stamp is None:
+                entry = None
+            elif entry is None or entry['stamp'] != stamp:
+                entry = self._scan(hdir)
+                self.changed = True
+            if entry is None:
+                self.dirs.pop(hdir, None)
+            else:
+                self.dirs[hdir] = entry
+                self.used.add(hdir)
+            self.checked.add(hdir)
+            return entry
+
+    def refresh(self):
+        with self.lock:
+            self.checked = set()
+
+    def exists(self, name):
+        hdir, base = os.path.split(path.host(path.abspath(name)))
+        entry = self._dir(hdir)
+        if entry is None:
+            return False
+        base = _case(base)
+        for e in entry['files'] + entry['dirs']:
+            if _case(e) == base:
+                return True
+        return False
+
+    def files(self, root, exts, follow_links=False):
+        """The files under the root with one of the extensions as prefix and
+        name pairs. The prefix is the file's directory relative to the root.
+        A file is listed for each extension it ends with."""
+        found = []
+        pending = [(path.host(root), '')]
+        while len(pending):
+            hdir, prefix = pending.pop()
+            entry = self._dir(hdir)
+            if entry is None:
+                continue
+            for f in entry['files']:
+                for e in exts:
+                    if f.endswith(e):
+                        found += [(prefix, f)]
+            for d in reversed(entry['dirs']):
+                if follow_links or d not in entry['links']:
+                    pending += [(os.path.join(hdir, d),
+                                 os.path.join(prefix, d))]
+        return found
+
+    def save(self):
+        with self.lock:
+            if self.changed:
+                cache.save('config-index', _key(),
+                           dict([(d, self.dirs[d]) for d in self.used
+                                 if d in self.dirs]))
+                self.changed = False
+
+
+def _key():
+    return cache.make_key(cache.module_key(sys.modules[__name__]))
+
+
+def get():
+    """The process's index loaded from the on disk cache."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            dirs = cache.load('config-index', _key())
+            if not isinstance(dirs, dict):
+                dirs = {}
+            _index = index(dirs)
+        return _index
+
+
+def refresh():
+    get().refresh()
+
+
+def exists(name):
+    return get().exists(name)
+
+
+def files(root, exts, follow_links=False):
+    return get().files(root, exts, follow_links)
+
+
+def save():
+    if _index is not None:
+        _index.save()
+
+
+atexit.register(save)
@@ -23,22 +23,32 @@
 #
 
 import base64
+import binascii
+import copy
 import hashlib
+import json
 import os
 import re
 import stat
 import sys
+import threading
+import time
 try:
+    import http.client as http_client
     import urllib.request as urllib_request
     import urllib.parse as urllib_parse
 except ImportError:
+    import httplib as http_client
     import urllib2 as urllib_request
     import urlparse as urllib_parse
 
 from . import cvs
+from . import downloadstore
 from . import error
 from . import git
+from . import httpclient
 from . import log
+from . import mirrors
 from . import path
 from . import sources
 from . import version
@@ -74,7 +84,123 @@ def _sensible_url(url, used=0):
     return url
 
 
-def _hash_check(file_, absfile, macros, remove=True):
+#
+# The hash algorithms a source can be checked with.
+#
+_hash_algorithms = ['sha512']
+
+#
+# The size of the reads hashing a file.
+#
+_hash_chunk_size = 1024 * 1024
+
+#
+# The digests of the files in a directory are kept in a sidecar file in the
+# directory. A digest is used while the file's inode, size and modification
+# time are the same so an unchanged source is not read again.
+#
+_digests_name = '.rsb-digests'
+_digests_lock = threading.Lock()
+
+
+def _file_key(hfile):
+    st = os.stat(hfile)
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = repr(st.st_mtime)
+    return [st.st_ino, st.st_size, mtime]
+
+
+def _digests_load(hdir):
+    try:
+        with open(os.path.join(hdir, _digests_name), 'r') as f:
+            digests = json.load(f)
+        if isinstance(digests, dict):
+            return digests
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def _digests_save(hdir, digests):
+    #
+    # Write a temporary file and rename it so a reader never sees a partial
+    # file. Failing to save is not an error.
+    #
+    name = os.path.join(hdir, _digests_name)
+    tmp = '%s.%d' % (name, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(digests, f, sort_keys=True)
+        getattr(os, 'replace', os.rename)(tmp, name)
+    except (IOError, OSError) as err:
+        log.trace('hash: digests: %s: %s', name, err)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _digest_get(hfile, algorithm, key):
+    hdir, name = os.path.split(hfile)
+    with _digests_lock:
+        entry = _digests_load(hdir).get(name)
+    if entry is not None and entry.get('key') == key:
+        return entry.get(algorithm)
+    return None
+
+
+def _digest_put(hfile, algorithm, key, digest):
+    hdir, name = os.path.split(hfile)
+    with _digests_lock:
+        digests = _digests_load(hdir)
+        for n in list(digests.keys()):
+            if not os.path.exists(os.path.join(hdir, n)):
+                del digests[n]
+        entry = digests.get(name)
+        if entry is None or entry.get('key') != key:
+            entry = {'key': key}
+        entry[algorithm] = digest
+        digests[name] = entry
+        _digests_save(hdir, digests)
+
+
+def _digests(hex_digest):
+    return hex_digest, \
+        base64.b64encode(binascii.unhexlify(hex_digest)).decode('utf-8')
+
+
+def file_digest(algorithm, absfile):
+    """The digest of a file as hex and base64. The file's sidecar digest is
+    used if the file has not changed, otherwise the file is read in
+    chunks."""
+    hfile = path.host(absfile)
+    key = _file_key(hfile)
+    hex_digest = _digest_get(hfile, algorithm, key)
+    if hex_digest is None:
+        hasher = hashlib.new(algorithm)
+        with open(hfile, 'rb') as f:
+            while True:
+                chunk = f.read(_hash_chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        hex_digest = hasher.hexdigest()
+        _digest_put(hfile, algorithm, key, hex_digest)
+    return _digests(hex_digest)
+
+
+def _hasher(file_, macros):
+    """A hasher for the data of a download if the file has a hash. The hash
+    is checked by _hash_check when the download finishes."""
+    hash = sources.get_hash(file_.lower(), macros)
+    if hash is None:
+        return None
+    hash = hash.split()
+    if len(hash) != 2 or hash[0] not in _hash_algorithms:
+        return None
+    return hashlib.new(hash[0])
+
+
+def _hash_check(file_, absfile, macros, remove=True, hasher=None):
     failed = False
     hash = sources.get_hash(file_.lower(), macros)
     if hash is not None:
@@ -83,32 +209,26 @@ def _hash_check(file_, absfile, macros, remove=True):
             raise error.internal('invalid hash format: %s' % (file_))
         if hash[0] == 'NO-HASH':
             return not failed
-        hashlib_algorithms = ['sha512']
-        if hash[0] not in hashlib_algorithms:
+        if hash[0] not in _hash_algorithms:
             raise error.general('invalid hash algorithm for %s: %s' %
                                 (file_, hash[0]))
         if hash[0] in ['md5', 'sha1']:
             raise error.general('hash: %s: insecure: %s' % (file_, hash[0]))
-        hasher = None
-        _in = None
+        hash_hex = None
+        hash_base64 = None
         try:
-            hasher = hashlib.new(hash[0])
-            _in = open(path.host(absfile), 'rb')
-            hasher.update(_in.read())
-        except IOError as err:
+            if hasher is not None and hasher.name == hash[0]:
+                hash_hex, hash_base64 = _digests(hasher.hexdigest())
+            else:
+                hash_hex, hash_base64 = file_digest(hash[0], absfile)
+        except (IOError, OSError) as err:
             log.notice('hash: %s: read error: %s' % (file_, str(err)))
             failed = True
         except:
             msg = 'hash: %s: error' % (file_)
             log.stderr(msg)
             log.notice(msg)
-            if _in is not None:
-                _in.close()
             raise
-        if _in is not None:
-            _in.close()
-        hash_hex = hasher.hexdigest()
-        hash_base64 = base64.b64encode(hasher.digest()).decode('utf-8')
         log.output('checksums: %s: (hex: %s) (b64: %s) => %s' %
                    (file_, hash_hex, hash_base64, hash[1]))
         if hash_hex != hash[1] and hash_base64 != hash[1]:
@@ -124,24 +244,28 @@ def _hash_check(file_, absfile, macros, remove=True):
                                         (absfile, str(err)))
                 except:
                     raise error.general('hash: %s: remove error' % (file_))
-        if hasher is not None:
-            del hasher
     else:
         raise error.general('%s: no hash found' % (file_))
     return not failed
 
 
 def _local_path(source, pathkey, config):
+    prefetch = 'prefetch' in source['options']
     for p in config.define(pathkey).split(':'):
         local_prefix = path.abspath(p)
         local = path.join(local_prefix, source['file'])
         if source['local'] is None:
             source['local_prefix'] = local_prefix
             source['local'] = local
+        if not prefetch and _prefetched(local):
+            source['local_prefix'] = local_prefix
+            source['local'] = local
+            break
         if path.exists(local):
             source['local_prefix'] = local_prefix
             source['local'] = local
-            _hash_check(source['file'], local, config.macros)
+            if not prefetch:
+                _hash_check(source['file'], local, config.macros)
             break
 
 
@@ -212,6 +336,9 @@ def _http_parser(source, pathkey, config, opts):
     elif esl[-1:][0] == 'xz':
         source['compressed-type'] = 'xz'
         source['compressed'] = '%{__xz} -dc'
+    elif esl[-1:][0] == 'zst':
+        source['compressed-type'] = 'zstd'
+        source['compressed'] = '%{__zstd} -dc'
 
 
 def _git_parser(source, pathkey, config, opts):
@@ -313,13 +440,17 @@ def set_release_path(release_path, macros):
     macros.define('release_path', release_path)
 
 
-def parse_url(url, pathkey, config, opts, file_override=None):
+def parse_url(url, pathkey, config, opts, file_override=None,
+              prefetch=False):
     #
-    # Split the source up into the parts we need.
+    # Split the source up into the parts we need. A prefetch parse does not
+    # wait for or check the local file.
     #
     source = {}
     source['url'] = url
     source['options'] = []
+    if prefetch:
+        source['options'] += ['prefetch']
     colon = url.find(':')
     if url[colon + 1:colon + 3] != '//':
         raise error.general('malforned URL (no protocol prefix): %s' % (url))
@@ -351,19 +482,126 @@ def parse_url(url, pathkey, config, opts, file_override=None):
     return source
 
 
-def _http_downloader(url, local, config, opts):
-    if path.exists(local):
-        return True
-    #
-    # Hack for GitHub.
-    #
-    if url.startswith('https://api.github.com'):
-        url = urllib_parse.urljoin(url, config.expand('tarball/%{version}'))
-    dst = os.path.relpath(path.host(local))
-    log.output('download: (full) %s -> %s' % (url, dst))
-    log.notice('download: %s -> %s' % (_sensible_url(url, len(dst)), dst))
-    failed = False
-    if enabled(opts):
+#
+# The seconds a download waits for data and the number of times a download
+# that stops is continued from where it stopped.
+#
+_http_timeout = 120
+_http_retries = 3
+
+
+class _http_transfer:
+    """A download to a partial file. The partial file is kept with the
+    validator of its data, the ETag or Last-Modified header, if the server
+    gave one so a retry or a later run can continue it with a range
+    request. The data is hashed as it is written."""
+
+    def __init__(self, url, local, dst, macros):
+        self.url = url
+        self.local = local
+        self.dst = dst
+        self.macros = macros
+        self.part = local + '.part'
+        self.info = local + '.part.info'
+        self.hasher = None
+        self.resumed = False
+        self.transferred = 0
+        self.error = None
+
+    def size(self):
+        try:
+            return os.path.getsize(path.host(self.part))
+        except OSError:
+            return 0
+
+    def resumable(self):
+        return path.exists(self.part) and path.exists(self.info)
+
+    def remove(self):
+        self.resumed = False
+        for f in [self.part, self.info]:
+            if path.exists(f):
+                os.remove(path.host(f))
+
+    def done(self):
+        if path.exists(self.info):
+            os.remove(path.host(self.info))
+
+    def _validator(self):
+        try:
+            with open(path.host(self.info), 'r') as f:
+                return json.load(f)['validator']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save_validator(self, headers):
+        validator = headers.get('ETag')
+        if validator is None or validator.startswith('W/'):
+            validator = headers.get('Last-Modified')
+        if validator is None:
+            if path.exists(self.info):
+                os.remove(path.host(self.info))
+        else:
+            with open(path.host(self.info), 'w') as f:
+                json.dump({'url': self.url, 'validator': validator}, f)
+
+    def _open(self, offset, validator):
+        # See #2656
+        headers = {'User-Agent': 'Wget/1.16.3 (freebsd10.1)'}
+        if offset > 0:
+            headers['Range'] = 'bytes=%d-' % (offset)
+            headers['If-Range'] = validator
+        return httpclient.urlopen(self.url, headers, _http_timeout)
+
+    def _hash_part(self):
+        self.hasher = _hasher(path.basename(self.local), self.macros)
+        if self.hasher is not None:
+            with open(path.host(self.part), 'rb') as f:
+                while True:
+                    chunk = f.read(_hash_chunk_size)
+                    if not chunk:
+                        break
+                    self.hasher.update(chunk)
+
+    def download(self):
+        """Download the file to the partial file continuing it if a
+        transfer stops after writing data. Return True if the download
+        finished. A partial file that can be continued is kept."""
+        retries = _http_retries
+        while True:
+            have = self.size()
+            try:
+                self.fetch()
+                return True
+            except (IOError, ValueError) as err:
+                self.error = err
+                log.notice('download: %s: error: %s' %
+                           (_sensible_url(self.url), str(err)))
+                if self.resumable() and self.size() > have and retries > 0:
+                    retries -= 1
+                    continue
+                if not self.resumable():
+                    self.remove()
+                return False
+            except:
+                msg = 'download: %s: error' % (_sensible_url(self.url))
+                log.stderr(msg)
+                log.notice(msg)
+                if not self.resumable():
+                    self.remove()
+                raise
+
+    def fetch(self):
+        """Download the data not in the partial file. An IOError is raised
+        if the transfer fails or ends early."""
+        offset = 0
+        validator = None
+        if path.exists(self.part):
+            validator = self._validator()
+            if validator is None:
+                self.remove()
+            else:
+                offset = self.size()
         _in = None
         _out = None
         _length = None
@@ -373,35 +611,47 @@ def _http_downloader(url, local, config, opts):
         _last_percent = 200.0
         _last_msg = ''
         _have_status_output = False
-        _url = url
         try:
             try:
-                _in = None
-                _ssl_context = None
-                # See #2656
-                _req = urllib_request.Request(_url)
-                _req.add_header('User-Agent', 'Wget/1.16.3 (freebsd10.1)')
                 try:
-                    import ssl
-                    _ssl_context = ssl._create_unverified_context()
-                    _in = urllib_request.urlopen(_req, context=_ssl_context)
-                except:
-                    log.output('download: no ssl context')
-                    _ssl_context = None
-                if _ssl_context is None:
-                    _in = urllib_request.urlopen(_req)
-                if _url != _in.geturl():
-                    _url = _in.geturl()
-                    log.output(' redirect: %s' % (_url))
-                    log.notice(' redirect: %s' % (_sensible_url(_url)))
-                _out = open(path.host(local), 'wb')
+                    _in = self._open(offset, validator)
+                except urllib_request.HTTPError as err:
+                    if offset == 0 or err.code != 416:
+                        raise
+                    log.output('download: %s: range not satisfiable' %
+                               (self.dst))
+                    self.remove()
+                    offset = 0
+                    _in = self._open(0, None)
+                if self.url != _in.geturl():
+                    self.url = _in.geturl()
+                    log.output(' redirect: %s' % (self.url))
+                    log.notice(' redirect: %s' % (_sensible_url(self.url)))
+                if offset > 0:
+                    content_range = _in.info().get('Content-Range', '')
+                    if _in.getcode() == 206 and \
+                       content_range.startswith('bytes %d-' % (offset)):
+                        log.notice('download: %s: continuing at %s' %
+                                   (self.dst, _humanize_bytes(offset)))
+                        self._hash_part()
+                        self.resumed = True
+                        _out = open(path.host(self.part), 'ab')
+                        _have = offset
+                    else:
+                        offset = 0
+                if offset == 0:
+                    self.hasher = _hasher(path.basename(self.local),
+                                          self.macros)
+                    _out = open(path.host(self.part), 'wb')
+                self._save_validator(_in.info())
                 try:
-                    _length = int(_in.info()['Content-Length'].strip())
+                    _length = offset + \
+                        int(_in.info()['Content-Length'].strip())
                 except:
                     pass
                 while True:
-                    _msg = '\rdownloading: %s - %s ' % (dst,
-                                                        _humanize_bytes(_have))
+                    _msg = '\rdownloading: %s - %s ' % (
+                        self.dst, _humanize_bytes(_have))
                     if _length:
                         _percent = round((float(_have) / _length) * 100, 2)
                         if _percent != _last_percent:
@@ -417,45 +667,87 @@ def _http_downloader(url, local, config, opts):
                     if not _chunk:
                         break
                     _out.write(_chunk)
+                    if self.hasher is not None:
+                        self.hasher.update(_chunk)
                     _have += len(_chunk)
+                    self.transferred += len(_chunk)
                 log.stdout_raw('\n\r')
+                if _length and _have < _length:
+                    raise IOError('transfer ended early: %d of %d bytes' %
+                                  (_have, _length))
+            except http_client.HTTPException as err:
+                raise IOError('%s: %s' % (type(err).__name__, str(err)))
             except:
                 if _have_status_output:
                     log.stdout_raw('\n\r')
                 raise
-        except IOError as err:
-            log.notice('download: %s: error: %s' %
-                       (_sensible_url(_url), str(err)))
-            if path.exists(local):
-                os.remove(path.host(local))
-            failed = True
-        except ValueError as err:
-            log.notice('download: %s: error: %s' %
-                       (_sensible_url(_url), str(err)))
-            if path.exists(local):
-                os.remove(path.host(local))
-            failed = True
-        except:
-            msg = 'download: %s: error' % (_sensible_url(_url))
-            log.stderr(msg)
-            log.notice(msg)
-            if _in is not None:
-                _in.close()
+        finally:
             if _out is not None:
                 _out.close()
-            raise
-        if _out is not None:
-            _out.close()
-        if _in is not None:
-            _in.close()
-            del _in
+            if _in is not None:
+                _in.close()
+
+
+def _http_downloader(url, local, config, opts):
+    if path.exists(local):
+        return True
+    #
+    # Hack for GitHub.
+    #
+    if url.startswith('https://api.github.com'):
+        url = urllib_parse.urljoin(url, config.expand('tarball/%{version}'))
+    dst = os.path.relpath(path.host(local))
+    log.output('download: (full) %s -> %s' % (url, dst))
+    log.notice('download: %s -> %s' % (_sensible_url(url, len(dst)), dst))
+    failed = False
+    if enabled(opts):
+        #
+        # The data is written to a partial file that is checked and renamed
+        # into place so a source that is present is always whole. A
+        # transfer that stops after writing data is continued. A partial
+        # file the server can continue is kept for the next URL or run.
+        #
+        transfer = _http_transfer(url, local, dst, config.macros)
+        start = time.time()
+        failed = not transfer.download()
+        if _racing(opts, config):
+            if not failed:
+                mirrors.record(url, True, transfer.transferred,
+                               time.time() - start)
+            elif not isinstance(transfer.error, urllib_request.HTTPError) or \
+                 transfer.error.code not in [404, 410]:
+                mirrors.record(url, False)
         if not failed:
-            if not path.isfile(local):
+            part = transfer.part
+            if not path.isfile(part):
                 raise error.general('source is not a file: %s' %
                                     (path.host(local)))
-            if not _hash_check(path.basename(local), local, config.macros,
-                               False):
-                raise error.general('checksum failure file: %s' % (dst))
+            try:
+                ok = _hash_check(path.basename(local), part, config.macros,
+                                 True, transfer.hasher)
+                if not ok and transfer.resumed:
+                    #
+                    # The data continued may not be from the same file so
+                    # download all of it once more.
+                    #
+                    log.notice('download: %s: downloading again' % (dst))
+                    transfer.remove()
+                    failed = not transfer.download()
+                    if not failed:
+                        ok = _hash_check(path.basename(local), part,
+                                         config.macros, True, transfer.hasher)
+                if not failed and not ok:
+                    raise error.general('checksum failure file: %s' % (dst))
+            except:
+                transfer.remove()
+                raise
+            if not failed:
+                os.rename(path.host(part), path.host(local))
+                transfer.done()
+                if transfer.hasher is not None:
+                    hlocal = path.host(local)
+                    _digest_put(hlocal, transfer.hasher.name,
+                                _file_key(hlocal), transfer.hasher.hexdigest())
     return not failed
 
 
@@ -644,7 +936,7 @@ def process_release_url(url_bases, opts, config):
     if rtems_release_url is not None:
         rtems_release_urls = rtems_release_url.split(',')
         for release_url in rtems_release_urls:
-            log.trace('release url: %s' % (release_url))
+            log.trace('release url: %s', release_url)
             #
             # If the URL being fetched is under the release path do not add
             # the sources release path because it is already there.
@@ -653,28 +945,254 @@ def process_release_url(url_bases, opts, config):
     url_bases = list(set(url_bases))
 
 
+def _file_hash(file_, macros):
+    """The hash algorithm and hex digest of a file or None if the file has
+    no hash."""
+    file_hash = sources.get_hash(file_.lower(), macros)
+    if file_hash is None:
+        return None
+    hash_parts = file_hash.split()
+    if len(hash_parts) != 2:
+        raise error.internal('invalid hash format: %s' % (file_))
+    if hash_parts[0] == 'NO-HASH':
+        return None
+    if len(hash_parts[1]) % 2 == 0 and all(c in '0123456789ABCDEFabcdef'
+                                           for c in hash_parts[1]):
+        hash_str = hash_parts[1]
+    else:
+        hash_str = ''.join([
+            '{:02x}'.format(b) for b in bytearray(
+                base64.b64decode(hash_parts[1].encode('ascii')))
+        ])
+    return hash_parts[0], hash_str
+
+
 def process_download_file_cache(local, url_bases, config):
-    local_file = path.basename(local)
-    file_hash = sources.get_hash(local_file.lower(), config.macros)
+    file_hash = _file_hash(path.basename(local), config.macros)
     if file_hash is not None:
-        hash_parts = file_hash.split()
-        if len(hash_parts) != 2:
-            raise error.internal('invalid hash format: %s' % (local_file))
-        if hash_parts[0] == 'NO-HASH':
-            return
-        if len(hash_parts[1]) % 2 == 0 and all(c in '0123456789ABCDEFabcdef'
-                                               for c in hash_parts[1]):
-            hash_str = hash_parts[1]
-        else:
-            hash_str = ''.join([
-                '{:02x}'.format(b)
-                for b in base64.decodebytes(hash_parts[1].encode('ascii'))
-            ])
-        url = config.macros.expand('%{rtems_dl_url}') + '/' + hash_str
+        url = config.macros.expand('%{rtems_dl_url}') + '/' + file_hash[1]
         url_bases.append(url)
 
 
+def _store_get(local, opts, config):
+    """Take the file from the download store. The stored file's hash is
+    checked before it is used."""
+    store = downloadstore.open_store(config, opts)
+    if store is None:
+        return False
+    local_file = path.basename(local)
+    file_hash = _file_hash(local_file, config.macros)
+    if file_hash is None or not store.has(file_hash[0], file_hash[1]):
+        return False
+    entry = store.entry(file_hash[0], file_hash[1])
+    if not _hash_check(local_file, entry, config.macros, remove=False):
+        store.remove(file_hash[0], file_hash[1])
+        return False
+    if not store.get(file_hash[0], file_hash[1], local):
+        return False
+    log.notice('download: %s: from the download store' % (local_file))
+    try:
+        _digest_put(path.host(local), file_hash[0],
+                    _file_key(path.host(local)), file_hash[1].lower())
+    except OSError:
+        pass
+    return True
+
+
+def _store_put(local, opts, config):
+    """Add a source that has been checked to the download store."""
+    store = downloadstore.open_store(config, opts)
+    if store is None or not path.isfile(local):
+        return
+    local_file = path.basename(local)
+    file_hash = _file_hash(local_file, config.macros)
+    if file_hash is None or store.has(file_hash[0], file_hash[1]):
+        return
+    if _hash_check(local_file, local, config.macros, remove=False):
+        store.put(file_hash[0], file_hash[1], local)
+        if store.has(file_hash[0], file_hash[1]):
+            entry = path.host(store.entry(file_hash[0], file_hash[1]))
+            try:
+                _digest_put(entry, file_hash[0], _file_key(entry),
+                            file_hash[1].lower())
+            except OSError:
+                pass
+
+
+class _config_snapshot:
+    """A copy of a configuration's macros a download thread can use while
+    the configuration continues to be processed."""
+
+    def __init__(self, config):
+        self.macros = copy.copy(config.macros)
+
+    def expand(self, line):
+        return self.macros.expand(line)
+
+    def defined(self, name):
+        return name in self.macros
+
+
+class _prefetch_job:
+
+    def __init__(self, url, local, opts, config):
+        self.url = url
+        self.local = local
+        self.opts = opts
+        self.config = _config_snapshot(config)
+        self.state = 'queued'
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+
+class prefetcher:
+    """Download files in the background with a bounded number of threads
+    and a limit on the number of downloads from any host at once. The
+    output of a download is held and replayed when the file is waited for
+    so the log reads the same as downloading in order."""
+
+    def __init__(self, jobs, host_jobs):
+        self.jobs = jobs
+        self.host_jobs = host_jobs
+        self.lock = threading.Condition()
+        self.queue = []
+        self.files = {}
+        self.fetched = set()
+        self.hosts = {}
+        self.threads = []
+
+    def host_slot(self, url):
+        host = urllib_parse.urlsplit(url)[1]
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.Semaphore(self.host_jobs)
+            return self.hosts[host]
+
+    def add(self, url, local, opts, config):
+        with self.lock:
+            if local in self.files or local in self.fetched:
+                return
+            job = _prefetch_job(url, local, opts, config)
+            self.files[local] = job
+            self.queue += [job]
+            log.trace('download: prefetch: %s', local)
+            if len(self.threads) < self.jobs:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self.threads += [thread]
+            self.lock.notify()
+
+    def wait(self, local):
+        """Wait for a prefetch of a file. Return True if the file has been
+        downloaded. A file not being downloaded yet is removed from the
+        queue and False is returned so the caller downloads it."""
+        with self.lock:
+            if local in self.fetched:
+                return True
+            job = self.files.get(local)
+            if job is None:
+                return False
+            if job.state == 'queued':
+                self.queue.remove(job)
+                del self.files[local]
+                return False
+        while not job.done.wait(1.0):
+            pass
+        with self.lock:
+            del self.files[local]
+            if job.error is None:
+                self.fetched.add(local)
+        log.replay(job.output)
+        if job.error is not None:
+            raise job.error
+        return True
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while len(self.queue) == 0:
+                    self.lock.wait()
+                job = self.queue.pop(0)
+                job.state = 'running'
+            log.hold()
+            try:
+                _get_file(job.url, job.local, job.opts, job.config)
+            except:
+                job.error = sys.exc_info()[1]
+            job.output = log.release()
+            job.done.set()
+
+
+_prefetcher = None
+
+
+def _macro_number(config, name):
+    try:
+        return int(config.macros.expand('%{' + name + '}'))
+    except:
+        return 0
+
+
+def _racing(opts, config):
+    return enabled(opts) and \
+        config.macros.expand('%{_mirror_race}') == '1'
+
+
+def prefetching(opts):
+    return enabled(opts) and not opts.download_disabled()
+
+
+def prefetch(url, local, opts, config):
+    """Start downloading a file in the background. Nothing is done if the
+    file is local or _download_jobs is 0."""
+    global _prefetcher
+    if local is None or not prefetching(opts) or path.exists(local):
+        return
+    if not url.startswith('http') and not url.startswith('ftp'):
+        return
+    if _prefetcher is None:
+        jobs = _macro_number(config, '_download_jobs')
+        if jobs <= 0:
+            return
+        host_jobs = max(_macro_number(config, '_download_host_jobs'), 1)
+        httpclient.host_connections = host_jobs
+        _prefetcher = prefetcher(jobs, host_jobs)
+    _prefetcher.add(url, local, opts, config)
+
+
+def _prefetched(local):
+    if _prefetcher is None:
+        return False
+    return _prefetcher.wait(local)
+
+
+def _download(dl, url, local, config, opts):
+    #
+    # A download changes the files in the source directory.
+    #
+    try:
+        if _prefetcher is None or dl not in ['http', 'ftp']:
+            return downloaders[dl](url, local, config, opts)
+        slot = _prefetcher.host_slot(url)
+        slot.acquire()
+        try:
+            return downloaders[dl](url, local, config, opts)
+        finally:
+            slot.release()
+    finally:
+        path.forget_size(local)
+        path.forget_size(path.dirname(local))
+
+
 def get_file(url, local, opts, config):
+    if local is not None and _prefetched(local):
+        return
+    _get_file(url, local, opts, config)
+
+
+def _get_file(url, local, opts, config):
     if local is None:
         raise error.general('source/patch path invalid:' + url)
     if not path.isdir(path.dirname(local)) and not opts.download_disabled():
@@ -683,6 +1201,9 @@ def get_file(url, local, opts, config):
     log.output('making dir: %s' % (path.host(path.dirname(local))))
     if enabled(opts):
         path.mkdir(path.dirname(local))
+    if enabled(opts) and not path.exists(local) and \
+       _store_get(local, opts, config):
+        return
     if not path.exists(local) and opts.download_disabled(
     ) and opts.defaults.expand('%{_rsb_getting_source}') == '0':
         raise error.general('source not found: %s' % (path.host(local)))
@@ -695,6 +1216,8 @@ def get_file(url, local, opts, config):
     url_bases = opts.urls()
     if url_bases is None:
         url_bases = []
+    user_bases = list(url_bases)
+    user_urls = []
     if not opts.download_disabled():
         process_download_file_cache(local, url_bases, config)
     process_release_url(url_bases, opts, config)
@@ -706,20 +1229,33 @@ def get_file(url, local, opts, config):
         url_path = urllib_parse.urlsplit(url)[2]
         slash = url_path.rfind('/')
         url_file = path.basename(local)
-        log.trace('url_file: %s' % (url_file))
+        log.trace('url_file: %s', url_file)
         for base in url_bases:
+            user = base in user_bases
             if base[-1:] != '/':
                 base += '/'
             next_url = urllib_parse.urljoin(base, url_file)
-            log.trace('url: %s' % (next_url))
+            log.trace('url: %s', next_url)
             urls.append(next_url)
+            if user:
+                user_urls.append(next_url)
     urls += url.split()
+    if _racing(opts, config) and not path.exists(local):
+        #
+        # The URLs given on the command line are tried first in the order
+        # given. The others are ordered by the health of their hosts.
+        #
+        urls = [u for u in urls if u in user_urls] + \
+            mirrors.order([u for u in urls if u not in user_urls],
+                          _macro_number(config, '_mirror_cooldown'))
     for url in urls:
-        log.trace('url: get: %s -> %s' % (url, local))
+        log.trace('url: get: %s -> %s', url, local)
     for url in urls:
         for dl in downloaders:
             if url.startswith(dl):
-                if downloaders[dl](url, local, config, opts):
+                if _download(dl, url, local, config, opts):
+                    if enabled(opts):
+                        _store_put(local, opts, config)
                     return
     if enabled(opts):
         raise error.general(
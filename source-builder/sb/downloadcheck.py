@@ -0,0 +1,298 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Check HTTP downloads continue when they stop. A local server drops the
+# connection part way through a response, ignores range requests or
+# changes the file between attempts and each download is checked to give
+# the file with its hash and leave no partial file behind. The requests the
+# server sees are checked to use Range and If-Range with the validator the
+# server gave.
+#
+# Run from the source-builder directory, any options are passed to the
+# options as a build set builder command line:
+#
+#  $ python -m sb.downloadcheck [--macros=host.mc]
+#
+# The exit code is 1 if any check fails.
+#
+
+from __future__ import print_function
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+
+try:
+    import http.server as http_server
+    import socketserver
+except ImportError:
+    import BaseHTTPServer as http_server
+    import SocketServer as socketserver
+
+from . import download
+from . import error
+from . import httpclient
+from . import log
+from . import options
+from . import path
+from . import sources
+
+_file = 'check-1.0.tar.gz'
+_size = 200 * 1024
+_drop = 64 * 1024
+_etag = '"rsb-check-1"'
+_changed_etag = '"rsb-check-2"'
+_last_modified = 'Thu, 01 Jan 2026 00:00:00 GMT'
+
+
+def _data(seed):
+    block = hashlib.sha512(seed.encode('ascii')).digest()
+    return (block * (_size // len(block) + 1))[:_size]
+
+
+class _server(socketserver.ThreadingMixIn, http_server.HTTPServer):
+    daemon_threads = True
+
+    def reset(self, data, validator=None, drop=0, ranges='if-range'):
+        """Serve the data with the validator. A response longer than drop
+        bytes is dropped after sending drop bytes. The ranges is 'if-range'
+        to honour the If-Range header, 'range' to ignore it and 'none' to
+        ignore range requests."""
+        self.data = data
+        self.validator = validator
+        self.drop = drop
+        self.ranges = ranges
+        self.requests = []
+
+
+class _handler(http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        range_ = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        server.requests += [(range_, if_range)]
+        start = 0
+        if range_ is not None and server.ranges != 'none' and \
+           (server.ranges == 'range' or if_range == server.validator):
+            start = int(range_[len('bytes='):].split('-')[0])
+        body = server.data[start:]
+        if start > 0:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % \
+                             (start, len(server.data) - 1, len(server.data)))
+        else:
+            self.send_response(200)
+        if server.validator == _last_modified:
+            self.send_header('Last-Modified', server.validator)
+        elif server.validator is not None:
+            self.send_header('ETag', server.validator)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.drop > 0 and len(body) > server.drop:
+            self.wfile.write(body[:server.drop])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _config:
+    """The macros of a download."""
+
+    def __init__(self, macros):
+        self.macros = macros
+
+    def expand(self, line):
+        return self.macros.expand(line)
+
+
+class _check:
+
+    def __init__(self, opts, server, directory):
+        self.opts = opts
+        self.server = server
+        self.directory = directory
+        self.url = 'http://127.0.0.1:%d/%s' % (server.server_address[1],
+                                               _file)
+        self.local = path.join(directory, _file)
+        self.checks = 0
+        self.failures = 0
+
+    def _clean(self):
+        for f in [self.local, self.local + '.part', self.local + '.part.info']:
+            if path.exists(f):
+                os.remove(path.host(f))
+
+    def _part(self, data, validator):
+        """Leave a partial file as a run that stopped would."""
+        with open(path.host(self.local + '.part'), 'wb') as f:
+            f.write(data)
+        with open(path.host(self.local + '.part.info'), 'w') as f:
+            json.dump({'url': self.url, 'validator': validator}, f)
+
+    def _download(self, data):
+        macros = copy.copy(self.opts.defaults)
+        macros['_mirror_race'] = '0'
+
+        def _error(msg):
+            raise error.general(msg)
+
+        sources.hash(['sha512', _file, hashlib.sha512(data).hexdigest()],
+                     macros, _error)
+        httpclient.close()
+        stdout = sys.stdout
+        try:
+            with open(os.devnull, 'w') as null:
+                sys.stdout = null
+                return download._http_downloader(self.url, self.local,
+                                                 _config(macros), self.opts)
+        finally:
+            sys.stdout = stdout
+
+    def _result(self):
+        try:
+            with open(path.host(self.local), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def check(self, name, ok, detail):
+        self.checks += 1
+        if ok:
+            print('pass: %s' % (name))
+        else:
+            self.failures += 1
+            print('FAIL: %s: %s' % (name, detail))
+
+    def downloaded(self, name, data, requests):
+        """Check the download gave the data, left no partial file and made
+        the requests."""
+        ok = self._download(data)
+        result = self._result()
+        if not ok or result != data:
+            self.check(name, False, 'download failed')
+        elif path.exists(self.local + '.part') or \
+             path.exists(self.local + '.part.info'):
+            self.check(name, False, 'partial file left')
+        else:
+            self.check(name, self.server.requests == requests,
+                       'requests: %r' % (self.server.requests))
+        self._clean()
+
+    def dropped(self):
+        data = _data('dropped')
+        self.server.reset(data, _etag, _drop)
+        requests = [(None, None)]
+        for offset in range(_drop, _size, _drop):
+            requests += [('bytes=%d-' % (offset), _etag)]
+        self.downloaded('dropped, etag', data, requests)
+        self.server.reset(data, _last_modified, _drop)
+        requests = [(None, None)]
+        for offset in range(_drop, _size, _drop):
+            requests += [('bytes=%d-' % (offset), _last_modified)]
+        self.downloaded('dropped, last-modified', data, requests)
+
+    def dropped_no_validator(self):
+        data = _data('no-validator')
+        self.server.reset(data, None, _drop)
+        ok = self._download(data)
+        self.check('dropped, no validator', not ok and \
+                   not path.exists(self.local) and \
+                   not path.exists(self.local + '.part'),
+                   'a download that cannot continue was kept')
+        self._clean()
+
+    def partial(self):
+        data = _data('partial')
+        self.server.reset(data, _etag)
+        self._part(data[:_drop], _etag)
+        self.downloaded('partial file continued', data,
+                        [('bytes=%d-' % (_drop), _etag)])
+
+    def range_ignored(self):
+        data = _data('range-ignored')
+        self.server.reset(data, _etag, ranges='none')
+        self._part(data[:_drop], _etag)
+        self.downloaded('range answered with 200', data,
+                        [('bytes=%d-' % (_drop), _etag)])
+
+    def changed(self):
+        old = _data('changed-old')
+        data = _data('changed-new')
+        self.server.reset(data, _changed_etag)
+        self._part(old[:_drop], _etag)
+        self.downloaded('file changed, if-range', data,
+                        [('bytes=%d-' % (_drop), _etag)])
+        self.server.reset(data, _changed_etag, ranges='range')
+        self._part(old[:_drop], _etag)
+        self.downloaded('file changed, if-range ignored', data,
+                        [('bytes=%d-' % (_drop), _etag), (None, None)])
+
+
+def run(args):
+    sbdir = path.dirname(path.dirname(path.abspath(__file__)))
+    directory = tempfile.mkdtemp(prefix='rsb-downloadcheck-')
+    server = None
+    try:
+        opts = options.load([path.join(sbdir, 'sb-set-builder'),
+                             '--without-log',
+                             '--prefix=%s' % (directory)] + args[1:],
+                            logfile=False)
+        log.quiet = True
+        server = _server(('127.0.0.1', 0), _handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        check = _check(opts, server, path.join(directory, 'sources'))
+        path.mkdir(check.directory)
+        check.dropped()
+        check.dropped_no_validator()
+        check.partial()
+        check.range_ignored()
+        check.changed()
+        print('checks: %d, failed: %d' % (check.checks, check.failures))
+    except error.general as gerr:
+        print(gerr, file=sys.stderr)
+        return 2
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        httpclient.close()
+        shutil.rmtree(directory)
+    if check.failures != 0:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
@@ -0,0 +1,200 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# A store of downloaded source and patch files shared by the checkouts on a
+# host. A file is stored under its hash, the layout the RTEMS download
+# server uses, so a file downloaded by one checkout is linked into the
+# source directory of another rather than downloaded again.
+#
+# A file is at <directory>/<algorithm>/<first two digits>/<hex digest>. A
+# file is added by cloning it to a temporary file in the store and renaming
+# that into place, and is taken by cloning it to a temporary file next to
+# the source and renaming that, so a builder never sees a partial file.
+# Files are hard linked if the store and source directory are on the same
+# file system and copied if not.
+#
+# The store is limited to a size. Each file has a '.used' file touched when
+# the file is added or taken and the least recently used files are removed
+# when the store is over its size. The file itself is not touched as it is
+# linked into source directories. A file removed from the store stays in
+# the source directories linked to it.
+#
+# The store is only used if _download_store is 1. It is
+# $RSB_CACHE/downloads or ~/.cache/rsb/downloads unless _download_store_dir
+# is set.
+#
+
+from __future__ import print_function
+
+import os
+import threading
+
+from . import cache
+from . import error
+from . import log
+from . import path
+from . import sourcecache
+
+#
+# The open stores by directory.
+#
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class store:
+    """A size limited directory of files named by their hash."""
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _tmp(self, name):
+        with self.lock:
+            self.count += 1
+            count = self.count
+        return '%s.tmp-%d-%d' % (name, os.getpid(), count)
+
+    def _clone(self, src, dst):
+        tmp = self._tmp(dst)
+        try:
+            mode = path.clone_file(src, tmp, 'hardlink')
+            getattr(os, 'replace', os.rename)(path.host(tmp), path.host(dst))
+        except (error.general, IOError, OSError):
+            if os.path.exists(path.host(tmp)):
+                os.remove(path.host(tmp))
+            raise
+        return mode
+
+    def _used(self, entry):
+        try:
+            with open(path.host(entry + '.used'), 'a'):
+                pass
+            os.utime(path.host(entry + '.used'), None)
+        except (IOError, OSError):
+            pass
+
+    def entry(self, algorithm, digest):
+        digest = digest.lower()
+        return path.join(self.directory, algorithm, digest[:2], digest)
+
+    def has(self, algorithm, digest):
+        return path.isfile(self.entry(algorithm, digest))
+
+    def get(self, algorithm, digest, dst):
+        """Link or copy the file with the digest to the destination. Return
+        False if the store does not have the file."""
+        entry = self.entry(algorithm, digest)
+        if not path.isfile(entry):
+            return False
+        try:
+            mode = self._clone(entry, dst)
+        except (error.general, IOError, OSError) as err:
+            log.output('download store: %s: get failed: %s' % (digest, err))
+            return False
+        self._used(entry)
+        log.output('download store: hit: %s -> %s (%s)' % (entry, dst, mode))
+        return True
+
+    def put(self, algorithm, digest, src):
+        """Add the file to the store. The caller has checked the file has the
+        digest. Failing to add a file is not an error."""
+        entry = self.entry(algorithm, digest)
+        if path.exists(entry):
+            self._used(entry)
+            return
+        try:
+            path.mkdir(path.dirname(entry))
+            mode = self._clone(src, entry)
+        except (error.general, IOError, OSError) as err:
+            log.output('download store: %s: put failed: %s' % (digest, err))
+            return
+        self._used(entry)
+        log.output('download store: added: %s -> %s (%s)' % (src, entry, mode))
+        self.evict()
+
+    def remove(self, algorithm, digest):
+        """Remove a file that does not have its digest."""
+        entry = self.entry(algorithm, digest)
+        log.warning('download store: removing: %s' % (entry))
+        for f in [entry, entry + '.used']:
+            try:
+                os.remove(path.host(f))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used files until the store fits in its
+        size budget."""
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(path.host(self.directory)):
+            for name in files:
+                if name.startswith('.') or name.endswith('.used') or \
+                   '.tmp-' in name:
+                    continue
+                entry = os.path.join(root, name)
+                try:
+                    size = os.stat(entry).st_size
+                    try:
+                        used = os.stat(entry + '.used').st_mtime
+                    except OSError:
+                        used = 0
+                except OSError:
+                    continue
+                entries += [(used, size, entry)]
+                total += size
+        for used, size, entry in sorted(entries):
+            if total <= self.size:
+                break
+            log.output('download store: evict: %s' % (entry))
+            try:
+                os.remove(entry)
+                total -= size
+            except OSError:
+                continue
+            try:
+                os.remove(entry + '.used')
+            except OSError:
+                pass
+
+
+def open_store(config, opts):
+    """Return the download store or None if it is disabled."""
+    if opts.dry_run() or config.expand('%{_download_store}') != '1':
+        return None
+    directory = config.expand('%{_download_store_dir}')
+    if len(directory) == 0:
+        directory = cache.directory()
+        if directory is None:
+            return None
+        directory = os.path.join(directory, 'downloads')
+    directory = path.abspath(directory)
+    with _stores_lock:
+        if directory not in _stores:
+            path.mkdir(directory)
+            _stores[directory] = \
+                store(directory,
+                      sourcecache._parse_size(
+                          config.expand('%{_download_store_size}')))
+            _stores[directory].evict()
+        return _stores[directory]
@@ -26,6 +26,8 @@
 
 from __future__ import print_function
 
+import atexit
+import binascii
 import functools
 import codecs
 import io
@@ -378,7 +380,7 @@ class execute(object):
         cs = what + ': ' + cs
         if self.verbose:
             log.output(what + ': ' + cs)
-        log.trace('exe: %s' % (cs))
+        log.trace('exe: %s', cs)
         if shell and self.shell_exe:
             command = arg_list(command)
             command[:0] = self.shell_exe
@@ -402,7 +404,7 @@ class execute(object):
                     r, e = os.path.splitext(command[0])
                     if e not in ['.exe', '.com', '.bat']:
                         command[0] = command[0] + '.exe'
-            log.trace('exe: %s' % (command))
+            log.trace('exe: %s', command)
             proc = subprocess.Popen(command,
                                     shell=shell,
                                     cwd=cwd,
@@ -629,6 +631,154 @@ class capture_execution(execute):
         raise error.general('output capture cannot be overrided')
 
 
+class coprocess:
+    """A long lived shell commands are run in. Each command is run in a sub-shell
+    of the coprocess and its output and exit code are framed by a marker so
+    many commands can be run without creating a process and the threads to
+    capture its output for each one. The shell is restarted if the working
+    directory or the environment change."""
+
+    def __init__(self, shell='/bin/sh'):
+        self.shell = shell
+        self.lock = threading.Lock()
+        self.proc = None
+        self.cwd = None
+        self.environ = None
+        self.marker = None
+
+    def _start(self):
+        self.cwd = os.getcwd()
+        self.environ = dict(os.environ)
+        self.marker = 'rsb-coprocess-%s' % \
+            (binascii.hexlify(os.urandom(8)).decode('ascii'))
+        self.proc = subprocess.Popen([self.shell],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT)
+        #
+        # Python 2 pipes are inherited by all other child processes.
+        #
+        try:
+            import fcntl
+            for fd in [self.proc.stdin.fileno(), self.proc.stdout.fileno()]:
+                fcntl.fcntl(fd, fcntl.F_SETFD,
+                            fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        except:
+            pass
+        log.trace('exe: coprocess: %s: started: %d', self.shell,
+                  self.proc.pid)
+
+    def _run(self, command):
+        #
+        # The command is quoted and evaluated in a sub-shell so a syntax
+        # error, 'cd' or 'exit' in a command does not change the coprocess.
+        #
+        quoted = "'" + command.replace("'", "'\\''") + "'"
+        script = "(eval %s) </dev/null 2>&1; printf '\\n%s %%d\\n' $?\n" % \
+            (quoted, self.marker)
+        if type(script) is not bytes:
+            script = script.encode(self._encoding(), 'replace')
+        self.proc.stdin.write(script)
+        self.proc.stdin.flush()
+        end = ('\n%s ' % (self.marker)).encode('ascii')
+        fd = self.proc.stdout.fileno()
+        data = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if len(chunk) == 0:
+                raise IOError('coprocess exited')
+            data += [chunk]
+            if chunk.endswith(b'\n'):
+                output = b''.join(data)
+                frame = output.rfind(end)
+                if frame >= 0:
+                    break
+                data = [output]
+        exit_code = int(output[frame + len(end):].strip())
+        output = output[:frame]
+        if type(output) is not str:
+            output = output.decode(self._encoding(), 'replace')
+        return exit_code, output
+
+    def _encoding(self):
+        if sys.stdout.encoding is not None:
+            return sys.stdout.encoding
+        return 'utf-8'
+
+    def run(self, command):
+        """Run the command returning the exit code and the output with the
+        leading and trailing white space removed."""
+        self.lock.acquire()
+        try:
+            log.trace('exe: coprocess: %s', command)
+            if self.proc is not None and \
+               (self.cwd != os.getcwd() or self.environ != dict(os.environ)):
+                self._close()
+            for attempt in [1, 2]:
+                if self.proc is None:
+                    self._start()
+                try:
+                    exit_code, output = self._run(command)
+                    return exit_code, output.strip()
+                except (IOError, OSError, ValueError):
+                    self._close()
+                    if attempt == 2:
+                        raise
+        finally:
+            self.lock.release()
+
+    def _close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait()
+            except:
+                pass
+            self.proc = None
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self._close()
+        finally:
+            self.lock.release()
+
+
+#
+# The shell macro coprocess and the output of the commands declared pure.
+#
+_coprocess = None
+_pure_results = {}
+
+
+def _close_coprocess():
+    if _coprocess is not None:
+        _coprocess.close()
+
+
+atexit.register(_close_coprocess)
+
+
+def shell_macro(command, pure=False):
+    """Run a shell macro's command returning the exit code and output. A pure
+    command's output only depends on the command so the result of the first
+    successful run is returned for the rest of the run."""
+    global _coprocess
+    if pure and command in _pure_results:
+        log.trace('exe: pure: %s', command)
+        return _pure_results[command]
+    if os.name == 'posix' and os.path.exists('/bin/sh'):
+        if _coprocess is None:
+            _coprocess = coprocess()
+        exit_code, output = _coprocess.run(command)
+    else:
+        e = capture_execution()
+        exit_code, proc, output = e.shell(command)
+    if pure and exit_code == 0:
+        _pure_results[command] = (exit_code, output)
+    return exit_code, output
+
+
 if __name__ == "__main__":
 
     def run_tests(e, commands, use_shell):
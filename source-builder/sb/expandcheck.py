@@ -0,0 +1,373 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Check the compiled template macro expansion gives the same result as the
+# multi-pass string replace expansion it replaced. Every config file under
+# rtems/config, bare/config and source-builder/config is loaded with each
+# and the parsed configs, the packages' scripts and the expansion of every
+# macro are compared.
+#
+# Run from the source-builder directory, any options are passed to the
+# options as a build set builder command line:
+#
+#  $ python -m sb.expandcheck [--macros=host.mc] [--target=sparc-rtems7]
+#
+# The exit code is 1 if any config differs.
+#
+
+from __future__ import print_function
+
+import copy
+import difflib
+import os
+import shutil
+import sys
+import tempfile
+
+from . import config
+from . import error
+from . import log
+from . import options
+from . import path
+
+
+class _reference(config.file):
+    """A config file expanded with the original expansion."""
+
+    def _reference_split(self, s):
+        '''Split the string (s) up by macros. Only split on the
+           outter level. Nested levels will need to split with futher calls.'''
+        macros = []
+        nesting = []
+        has_braces = False
+        c = 0
+        while c < len(s):
+            if s[c] == '%' or s[c] == '$':
+                start = s[c]
+                c += 1
+                if c == len(s):
+                    continue
+                if s[c] == '%' or s[c] == '(' or (start == '$'
+                                                  and s[c] != '{'):
+                    continue
+                elif not s[c].isspace():
+                    if start == '$' and (s[c] != '{' or len(nesting) == 0):
+                        continue
+                    if s[c] == '{':
+                        this_has_braces = True
+                    else:
+                        this_has_braces = False
+                    nesting.append((c - 1, has_braces))
+                    has_braces = this_has_braces
+            elif len(nesting) > 0:
+                if s[c] == '}' or (s[c].isspace() and not has_braces):
+                    if not has_braces:
+                        if s[c] == '}':
+                            macro_start, has_braces = nesting[len(nesting) - 1]
+                            nesting = nesting[:-1]
+                            if len(nesting) == 0:
+                                macros.append(s[macro_start:c].strip())
+                    if len(nesting) > 0:
+                        macro_start, has_braces = nesting[len(nesting) - 1]
+                        nesting = nesting[:-1]
+                        if len(nesting) == 0:
+                            macros.append(s[macro_start:c + 1].strip())
+            c += 1
+        return macros
+
+    def _expand(self, s):
+        expand_count = 0
+        expanded = True
+        while expanded:
+            expand_count += 1
+            if expand_count > 500:
+                raise error.general('macro expand looping: %s' % (s))
+            expanded = False
+            ms = self._reference_split(s)
+            for m in ms:
+                mn = m
+                show_warning = True
+                if mn[1] != '{':
+                    for r in self._ignore:
+                        if r.match(mn) is not None:
+                            mn = None
+                            break
+                    else:
+                        mn = self._label(mn[1:])
+                        show_warning = False
+                elif m.startswith('%{expand'):
+                    colon = m.find(':')
+                    if colon < 8:
+                        log.warning(self._name_line_msg('malformed expand macro, ' \
+                                                        'no colon found'))
+                    else:
+                        e = self._expand(m[colon + 1:-1].strip())
+                        s = s.replace(m, self._label(e))
+                        expanded = True
+                        mn = None
+                elif m.startswith('%{with '):
+                    n = self._label('with_' + m[7:-1].strip())
+                    if n in self.macros:
+                        s = s.replace(m, '1')
+                    else:
+                        s = s.replace(m, '0')
+                    expanded = True
+                    mn = None
+                elif m.startswith('%{echo'):
+                    if not m.endswith('}'):
+                        log.warning(
+                            self._name_line_msg(
+                                "malformed conditional macro '%s'" % (m)))
+                        mn = None
+                    else:
+                        e = self._expand(m[6:-1].strip())
+                        log.notice('%s' % (self._name_line_msg(e)))
+                        s = ''
+                        expanded = True
+                        mn = None
+                elif m.startswith('%{defined'):
+                    n = self._label(m[9:-1].strip())
+                    if n in self.macros:
+                        s = s.replace(m, '1')
+                    else:
+                        s = s.replace(m, '0')
+                    expanded = True
+                    mn = None
+                elif m.startswith('%{!defined'):
+                    n = self._label(m[10:-1].strip())
+                    if n in self.macros:
+                        s = s.replace(m, '0')
+                    else:
+                        s = s.replace(m, '1')
+                    expanded = True
+                    mn = None
+                elif m.startswith('%{triplet'):
+                    triplet = m[len('%{triplet'):-1].strip().split()
+                    ok = False
+                    if len(triplet) == 2:
+                        macro = self._expand(triplet[0])
+                        value = self._expand(triplet[1])
+                        vorig = value
+                        arch_value = ''
+                        vendor_value = ''
+                        os_value = ''
+                        dash = value.find('-')
+                        if dash >= 0:
+                            arch_value = value[:dash]
+                            value = value[dash + 1:]
+                        dash = value.find('-')
+                        if dash >= 0:
+                            vendor_value = value[:dash]
+                            value = value[dash + 1:]
+                        if len(value):
+                            os_value = value
+                        self.macros[macro] = vorig
+                        self.macros[macro + '_cpu'] = arch_value
+                        self.macros[macro + '_arch'] = arch_value
+                        self.macros[macro + '_vendor'] = vendor_value
+                        self.macros[macro + '_os'] = os_value
+                        ok = True
+                    if ok:
+                        s = s.replace(m, '')
+                    else:
+                        self._error('triplet error: %s' % (' '.join(triplet)))
+                    mn = None
+                elif m.startswith('%{path '):
+                    pl = m[7:-1].strip().split()
+                    ok = False
+                    result = ''
+                    pl_0 = pl[0].lower()
+                    if pl_0 == 'prepend':
+                        if len(pl) == 2:
+                            ok = True
+                            p = ' '.join([self._expand(pp) for pp in pl[1:]])
+                            if len(self.macros['_pathprepend']):
+                                self.macros['_pathprepend'] = \
+                                    '%s:%s' % (p, self.macros['_pathprepend'])
+                            else:
+                                self.macros['_pathprepend'] = p
+                    elif pl_0 == 'postpend':
+                        if len(pl) == 2:
+                            ok = True
+                            p = ' '.join([self._expand(pp) for pp in pl[1:]])
+                            if len(self.macros['_pathprepend']):
+                                self.macros['_pathprepend'] = \
+                                    '%s:%s' % (self.macros['_pathprepend'], p)
+                            else:
+                                self.macros['_pathprepend'] = p
+                    elif pl_0 == 'check':
+                        if len(pl) == 3:
+                            pl_1 = pl[1].lower()
+                            p = ' '.join([self._expand(pp) for pp in pl[2:]])
+                            if pl_1 == 'exists':
+                                ok = True
+                                result = '1' if path.exists(p) else '0'
+                            elif pl_1 == 'isdir':
+                                ok = True
+                                result = '1' if path.isdir(p) else '0'
+                            elif pl_1 == 'isfile':
+                                ok = True
+                                result = '1' if path.isfile(p) else '0'
+                    if ok:
+                        s = s.replace(m, result)
+                    else:
+                        self._error('path error: %s' % (' '.join(pl)))
+                    mn = None
+                elif m.startswith('%{pkgconfig '):
+                    pcl = m[11:-1].strip().split()
+                    if len(pcl):
+                        epcl = []
+                        for pc in pcl:
+                            epcl += [self._expand(pc)]
+                        ps = self._pkgconfig(epcl)
+                        s = s.replace(m, ps)
+                        expanded = True
+                    else:
+                        self._error('pkgconfig error: %s' % (m[11:-1].strip()))
+                    mn = None
+                elif m.startswith('%{?') or m.startswith('%{!?'):
+                    if m[2] == '!':
+                        start = 4
+                    else:
+                        start = 3
+                    colon = m[start:].find(':')
+                    if colon < 0:
+                        if not m.endswith('}'):
+                            log.warning(
+                                self._name_line_msg(
+                                    "malformed conditional macro '%s'" % (m)))
+                            mn = None
+                        else:
+                            mn = self._label(m[start:-1])
+                    else:
+                        mn = self._label(m[start:start + colon])
+                    if mn:
+                        if m.startswith('%{?'):
+                            istrue = False
+                            if mn in self.macros:
+                                istrue = config._check_bool(self.macros[mn])
+                                if istrue is None:
+                                    istrue = config._check_nil(self.macros[mn])
+                            if colon >= 0 and istrue:
+                                s = s.replace(m, m[start + colon + 1:-1])
+                                expanded = True
+                                mn = None
+                            elif not istrue:
+                                mn = '%{nil}'
+                        else:
+                            isfalse = True
+                            if mn in self.macros:
+                                istrue = config._check_bool(self.macros[mn])
+                                if istrue is None or istrue == True:
+                                    isfalse = False
+                            if colon >= 0 and isfalse:
+                                s = s.replace(m, m[start + colon + 1:-1])
+                                expanded = True
+                                mn = None
+                            else:
+                                mn = '%{nil}'
+                if mn:
+                    if mn.lower() in self.macros:
+                        em = self.macros[mn.lower()]
+                        if self.macros.get_type(mn) == 'dir' and ':' in em:
+                            ss = []
+                            for sp in s.split():
+                                if m in sp:
+                                    sp = ':'.join([
+                                        sp.replace(mn, ps)
+                                        for ps in em.split(':')
+                                    ])
+                                ss += [sp]
+                                s = ' '.join(ss)
+                        else:
+                            s = s.replace(m, self.macros[mn.lower()])
+                        expanded = True
+                    elif show_warning:
+                        self._error("macro '%s' not found" % (mn))
+        return self._shell(s)
+
+
+def configs(top):
+    """The config files in the trees."""
+    cfgs = []
+    for tree in ['rtems', 'bare', 'source-builder']:
+        for root, dirs, files in os.walk(os.path.join(top, tree, 'config')):
+            cfgs += [os.path.join(root, f) for f in files if f.endswith('.cfg')]
+    return sorted(cfgs)
+
+
+def _dump(cls, name, opts):
+    """Load the config and return its text and the expansion of each of its
+    macros. An error is part of the result."""
+    try:
+        cfg = cls(name, copy.copy(opts), copy.copy(opts.defaults))
+    except error.general as gerr:
+        return ['error: %s' % (gerr)]
+    lines = str(cfg).splitlines()
+    for _package in sorted(cfg.packages()):
+        p = cfg.packages()[_package]
+        for d in sorted(p.directives):
+            lines += ['script: %s: %s: %s' % (_package, d, l)
+                      for l in p.directives[d]]
+    for m in sorted(cfg.macros.keys()):
+        try:
+            lines += ['expand: %s: %s' % (m, cfg.expand('%{' + m + '}'))]
+        except error.general as gerr:
+            lines += ['expand: %s: error: %s' % (m, gerr)]
+    return lines
+
+
+def run(args):
+    sbdir = path.dirname(path.dirname(path.abspath(__file__)))
+    top = path.dirname(sbdir)
+    prefix = tempfile.mkdtemp(prefix='rsb-expandcheck-')
+    try:
+        opts = options.load([path.join(sbdir, 'sb-set-builder'), '--dry-run',
+                             '--without-log', '--prefix=%s' % (prefix)] +
+                            args[1:],
+                            logfile=False)
+        log.quiet = True
+        cfgs = configs(top)
+        differ = 0
+        for c in cfgs:
+            reference = _dump(_reference, c, opts)
+            compiled = _dump(config.file, c, opts)
+            if reference != compiled:
+                differ += 1
+                print('differs: %s' % (os.path.relpath(c, top)))
+                for l in difflib.unified_diff(reference,
+                                              compiled,
+                                              'reference',
+                                              'compiled',
+                                              lineterm=''):
+                    print(' ' + l)
+        print('configs: %d, differ: %d' % (len(cfgs), differ))
+    except error.general as gerr:
+        print(gerr, file=sys.stderr)
+        return 2
+    finally:
+        shutil.rmtree(prefix)
+    if differ != 0:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
@@ -0,0 +1,138 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Extract a source archive into the current directory and report how long
+# it took. The build scripts run this as a command so it only uses the
+# standard library.
+#
+# An archive is decompressed by the decompressor command, if there is one,
+# and piped to the tar command. Without a tar command the archive is
+# extracted by Python's tarfile module as a stream.
+#
+
+from __future__ import print_function
+
+import getopt
+import os
+import subprocess
+import sys
+import tarfile
+import time
+
+
+def _strip(member, strip_components):
+    if strip_components == 0:
+        return True
+    parts = [p for p in member.name.split('/') if p not in ['', '.']]
+    if len(parts) <= strip_components:
+        return False
+    member.name = '/'.join(parts[strip_components:])
+    if member.islnk():
+        parts = [p for p in member.linkname.split('/') if p not in ['', '.']]
+        if len(parts) <= strip_components:
+            return False
+        member.linkname = '/'.join(parts[strip_components:])
+    return True
+
+
+def tarfile_extract(archive, strip_components=0, verbose=False):
+    """Extract the archive with the tarfile module reading it as a
+    stream."""
+    tar = tarfile.open(archive, 'r|*')
+    try:
+        for member in tar:
+            if not _strip(member, strip_components):
+                continue
+            if verbose:
+                print(member.name)
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extract(member, '.', filter='tar')
+            else:
+                tar.extract(member, '.')
+    finally:
+        tar.close()
+
+
+def pipe_extract(archive, tar, decompressor=None, strip_components=0):
+    """Extract the archive with the tar command. Return the exit code."""
+    tar = tar.split()
+    if strip_components > 0:
+        tar += ['--strip-components', str(strip_components)]
+    if decompressor is None:
+        return subprocess.call(tar + ['-f', archive])
+    decompress = subprocess.Popen(decompressor.split() + [archive],
+                                  stdout=subprocess.PIPE)
+    extract = subprocess.Popen(tar + ['-f', '-'], stdin=decompress.stdout)
+    decompress.stdout.close()
+    extract_code = extract.wait()
+    decompress_code = decompress.wait()
+    if decompress_code != 0:
+        return decompress_code
+    return extract_code
+
+
+def run(args):
+    try:
+        opts, args = getopt.getopt(args[1:], 's:t:d:v')
+    except getopt.GetoptError as err:
+        print('error: extract: %s' % (err), file=sys.stderr)
+        return 2
+    if len(args) != 1:
+        print('usage: extract.py [-s strip] [-t tar] [-d decompressor] ' \
+              '[-v] archive', file=sys.stderr)
+        return 2
+    archive = args[0]
+    strip_components = 0
+    tar = None
+    decompressor = None
+    verbose = False
+    for o, a in opts:
+        if o == '-s':
+            strip_components = int(a)
+        elif o == '-t':
+            tar = a
+        elif o == '-d':
+            decompressor = a
+        elif o == '-v':
+            verbose = True
+    start = time.time()
+    if tar is None:
+        method = 'tarfile'
+        try:
+            tarfile_extract(archive, strip_components, verbose)
+            exit_code = 0
+        except (tarfile.TarError, IOError, OSError) as err:
+            print('error: extract: %s: %s' % (archive, err), file=sys.stderr)
+            exit_code = 1
+    else:
+        if decompressor is None:
+            method = tar.split()[0]
+        else:
+            method = decompressor.split()[0]
+        exit_code = pipe_extract(archive, tar, decompressor, strip_components)
+    print('extract: %s: %0.2fs (%s)' % (os.path.basename(archive),
+                                          time.time() - start,
+                                          os.path.basename(method)))
+    sys.stdout.flush()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
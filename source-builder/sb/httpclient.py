@@ -0,0 +1,282 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# An HTTP client that keeps the connections to each host open between the
+# downloads of a run. A download of a patch from a host already used does
+# not connect or negotiate TLS again. A host has a bounded number of
+# connections and a request waits for one to be free. Permanent redirects
+# are remembered so a URL is only redirected once.
+#
+# A URL that is not HTTP or HTTPS or is to be fetched through a proxy is
+# opened with urllib.
+#
+
+from __future__ import print_function
+
+import atexit
+import socket
+import threading
+
+try:
+    import http.client as http_client
+    import urllib.request as urllib_request
+    import urllib.parse as urllib_parse
+except ImportError:
+    import httplib as http_client
+    import urllib2 as urllib_request
+    import urlparse as urllib_parse
+
+from . import log
+
+#
+# The connections to a host at once and the redirects a request follows.
+#
+host_connections = 2
+max_redirects = 10
+
+_redirects = [301, 302, 303, 307, 308]
+_permanent_redirects = [301, 308]
+
+_pools = {}
+_redirected = {}
+_lock = threading.Lock()
+_ssl_context = None
+
+
+def _context():
+    global _ssl_context
+    with _lock:
+        if _ssl_context is None:
+            import ssl
+            _ssl_context = ssl._create_unverified_context()
+        return _ssl_context
+
+
+class _pool:
+    """The connections to a host. The connections not in use are kept
+    open."""
+
+    def __init__(self, scheme, netloc):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.lock = threading.Condition()
+        self.idle = []
+        self.busy = 0
+        self.connects = 0
+        self.requests = 0
+
+    def _connect(self, timeout):
+        if self.scheme == 'https':
+            return http_client.HTTPSConnection(self.netloc,
+                                               timeout=timeout,
+                                               context=_context())
+        return http_client.HTTPConnection(self.netloc, timeout=timeout)
+
+    def get(self, timeout, fresh=False):
+        """Take a connection, waiting if the host has none free. Return the
+        connection and True if it has been used before."""
+        with self.lock:
+            while self.busy >= max(host_connections, 1):
+                self.lock.wait()
+            self.busy += 1
+            self.requests += 1
+            conn = None
+            if not fresh and len(self.idle) > 0:
+                conn = self.idle.pop()
+            else:
+                self.connects += 1
+        if conn is None:
+            return self._connect(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def put(self, conn, keep):
+        with self.lock:
+            self.busy -= 1
+            if keep and len(self.idle) < max(host_connections, 1):
+                self.idle += [conn]
+                conn = None
+            self.lock.notify()
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for conn in idle:
+            conn.close()
+
+
+class response:
+    """A response on a pooled connection. It has the parts of a urllib
+    response a download uses. The connection is returned to the pool when
+    the response is closed if all of it has been read."""
+
+    def __init__(self, pool, conn, resp, url):
+        self.pool = pool
+        self.conn = conn
+        self.resp = resp
+        self.url = url
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.resp.msg
+
+    def getcode(self):
+        return self.resp.status
+
+    def read(self, amt=None):
+        if amt is None:
+            return self.resp.read()
+        return self.resp.read(amt)
+
+    def close(self):
+        if self.conn is not None:
+            keep = self.resp.isclosed() and not self.resp.will_close
+            if not keep:
+                self.resp.close()
+            self.pool.put(self.conn, keep)
+            self.conn = None
+
+
+def _pooled(url):
+    parts = urllib_parse.urlsplit(url)
+    if parts.scheme not in ['http', 'https']:
+        return False
+    if parts.scheme in urllib_request.getproxies():
+        if not urllib_request.proxy_bypass(parts.hostname or ''):
+            return False
+    return True
+
+
+def _pool_for(scheme, netloc):
+    with _lock:
+        key = (scheme, netloc)
+        if key not in _pools:
+            _pools[key] = _pool(scheme, netloc)
+        return _pools[key]
+
+
+def _request(url, headers, timeout, method='GET'):
+    parts = urllib_parse.urlsplit(url)
+    pool = _pool_for(parts.scheme, parts.netloc)
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    fresh = False
+    while True:
+        conn, reused = pool.get(timeout, fresh)
+        try:
+            conn.request(method, target, headers=headers)
+            return pool, conn, conn.getresponse()
+        except (http_client.HTTPException, socket.error, IOError):
+            pool.put(conn, False)
+            #
+            # The host may have closed a connection kept open. Try once
+            # more with a new connection.
+            #
+            if not reused:
+                raise
+            fresh = True
+
+
+def _urlopen(url, headers, timeout):
+    _in = None
+    _ssl_context = None
+    _req = urllib_request.Request(url)
+    for h in headers:
+        _req.add_header(h, headers[h])
+    try:
+        _ssl_context = _context()
+        _in = urllib_request.urlopen(_req,
+                                     context=_ssl_context,
+                                     timeout=timeout)
+    except:
+        log.output('download: no ssl context')
+        _ssl_context = None
+    if _ssl_context is None:
+        _in = urllib_request.urlopen(_req, timeout=timeout)
+    return _in
+
+
+def head(url, headers={}, timeout=None):
+    """Send a HEAD request to the URL on a pooled connection. Return the
+    status and the headers. Redirects are not followed."""
+    pool, conn, resp = _request(url, headers, timeout, 'HEAD')
+    r = response(pool, conn, resp, url)
+    r.read()
+    r.close()
+    return resp.status, resp.msg
+
+
+def urlopen(url, headers={}, timeout=None):
+    """Open a URL with a GET request. Redirects are followed and an error
+    status raises an HTTPError as urllib does."""
+    with _lock:
+        for redirect in range(0, max_redirects):
+            if url not in _redirected:
+                break
+            url = _redirected[url]
+    for redirect in range(0, max_redirects + 1):
+        if not _pooled(url):
+            return _urlopen(url, headers, timeout)
+        pool, conn, resp = _request(url, headers, timeout)
+        location = resp.getheader('Location')
+        if resp.status in _redirects and location is not None:
+            location = urllib_parse.urljoin(url, location)
+            r = response(pool, conn, resp, url)
+            r.read()
+            r.close()
+            if resp.status in _permanent_redirects:
+                with _lock:
+                    _redirected[url] = location
+            url = location
+            continue
+        r = response(pool, conn, resp, url)
+        if resp.status >= 400:
+            r.read()
+            r.close()
+            raise urllib_request.HTTPError(url, resp.status, resp.reason,
+                                           resp.msg, None)
+        return r
+    raise IOError('too many redirects: %s' % (url))
+
+
+def stats():
+    """The requests and connections of each host."""
+    with _lock:
+        pools = list(_pools.values())
+    return [(p.scheme + '://' + p.netloc, p.requests, p.connects)
+            for p in pools]
+
+
+def close():
+    with _lock:
+        pools = list(_pools.values())
+    for p in pools:
+        p.close()
+
+
+atexit.register(close)
@@ -0,0 +1,181 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Check the clone modes used to stage and install a build set install the
+# same prefix as copying does. The build set is installed twice into the
+# same prefix, once with the clone modes the options give and once with
+# _staging_clone and _install_clone set to copy, and the two prefixes are
+# compared. The content, mode and modification time of each file and the
+# target of each link must be the same.
+#
+# The packages are built once. The first install adds the buildroots to a
+# build cache and the second install restores them so both install the
+# same files. Reports are not created as they hold the time they are made.
+#
+# Run from a directory with build sets with the source-builder directory on
+# the Python path, any options are passed to the build set builder:
+#
+#  $ PYTHONPATH=../source-builder python -m sb.installcheck \
+#      --macros=host.mc devel/dtc
+#
+# The exit code is 1 if the prefixes differ.
+#
+
+from __future__ import print_function
+
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from . import error
+from . import execute
+from . import path
+
+_copy_macros = """[global]
+_staging_clone: none, none, 'copy'
+_install_clone: none, none, 'copy'
+"""
+
+
+def _macros(args, mc):
+    """Add the macro file to the options' macro files."""
+    args = list(args)
+    for a in range(0, len(args)):
+        if args[a].startswith('--macros='):
+            args[a] += ',' + mc
+            return args
+        if args[a] == '--macros' and a + 1 < len(args):
+            args[a + 1] += ',' + mc
+            return args
+    return ['--macros=%s' % (mc)] + args
+
+
+def _install(sbdir, args, directory, label):
+    """Install the build set into the prefix and move the prefix to a
+    directory named by the label."""
+    prefix = path.join(directory, 'prefix')
+    cmd = [sys.executable, path.host(path.join(sbdir, 'sb-set-builder')),
+           '--prefix=%s' % (prefix),
+           '--log=%s' % (path.join(directory, label + '.txt')),
+           '--build-cache-dir=%s' % (path.join(directory, 'build-cache')),
+           '--no-report'] + args
+    print('install: %s' % (label))
+    e = execute.capture_execution()
+    exit_code, proc, output = e.spawn(cmd)
+    if exit_code != 0:
+        print(output, file=sys.stderr)
+        raise error.general('install failed: %s' % (label))
+    if not path.exists(prefix):
+        raise error.general('nothing installed: %s' % (label))
+    installed = path.join(directory, label)
+    os.rename(path.host(prefix), path.host(installed))
+    return installed
+
+
+def _hash(name):
+    hasher = hashlib.sha256()
+    with open(name, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def tree(root):
+    """The kind, mode, modification time and content or link target of
+    each path in the tree. A directory's modification time depends on the
+    order its entries are added and a link's is when it was made so they
+    are not kept."""
+    paths = {}
+    hroot = path.host(root)
+    for dirpath, dirnames, filenames in os.walk(hroot):
+        for name in dirnames + filenames:
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, hroot)
+            st = os.lstat(full)
+            mode = stat.S_IMODE(st.st_mode)
+            if stat.S_ISLNK(st.st_mode):
+                paths[rel] = ('link', mode, None, os.readlink(full))
+            elif stat.S_ISDIR(st.st_mode):
+                paths[rel] = ('dir', mode, None, None)
+            elif stat.S_ISREG(st.st_mode):
+                paths[rel] = ('file', mode, st.st_mtime, _hash(full))
+            else:
+                paths[rel] = ('other', mode, st.st_mtime, None)
+    return paths
+
+
+def compare(a, ta, b, tb):
+    """Return the differences between the trees."""
+    differences = []
+    for rel in sorted(set(ta.keys()) | set(tb.keys())):
+        if rel not in tb:
+            differences += ['only in %s: %s' % (path.basename(a), rel)]
+        elif rel not in ta:
+            differences += ['only in %s: %s' % (path.basename(b), rel)]
+        elif ta[rel][0] != tb[rel][0]:
+            differences += ['kind: %s: %s != %s' % (rel, ta[rel][0],
+                                                    tb[rel][0])]
+        else:
+            for what, n in [('mode', 1), ('mtime', 2), ('content', 3)]:
+                if ta[rel][n] != tb[rel][n]:
+                    if what == 'mode':
+                        detail = '%o != %o' % (ta[rel][n], tb[rel][n])
+                    elif what == 'content' and ta[rel][0] == 'link':
+                        what = 'link'
+                        detail = '%s != %s' % (ta[rel][n], tb[rel][n])
+                    else:
+                        detail = '%r != %r' % (ta[rel][n], tb[rel][n])
+                    differences += ['%s: %s: %s' % (what, rel, detail)]
+    return differences
+
+
+def run(args):
+    sbdir = path.dirname(path.dirname(path.abspath(__file__)))
+    directory = tempfile.mkdtemp(prefix='rsb-installcheck-')
+    try:
+        mc = path.join(directory, 'copy.mc')
+        with open(path.host(mc), 'w') as f:
+            f.write(_copy_macros)
+        cloned = _install(sbdir, args[1:], directory, 'cloned')
+        copied = _install(sbdir, _macros(args[1:], mc), directory, 'copied')
+        tcloned = tree(cloned)
+        differences = compare(cloned, tcloned, copied, tree(copied))
+        for d in differences:
+            print(d)
+        print('paths: %d, differences: %d' % (len(tcloned),
+                                              len(differences)))
+    except error.general as gerr:
+        print(gerr, file=sys.stderr)
+        return 2
+    finally:
+        shutil.rmtree(directory)
+    if len(differences) != 0:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv))
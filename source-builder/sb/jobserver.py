@@ -0,0 +1,170 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# A GNU make jobserver shared by all the package builds of a run. The
+# jobserver is a pipe holding a token for each job a make can run after
+# its first. The pipe's option is the %{_smp_mflags} of the builds so the
+# makes that run parallel jobs take them from the same pool and the run
+# never has more jobs running than the --jobs option allows. A make not
+# given %{_smp_mflags} runs one job at a time as it does without the
+# jobserver. The build scripts' environment is not changed.
+#
+# Each package building takes a job. The first takes the job the run
+# always has and the others take a token from the pipe while they build.
+#
+
+from __future__ import print_function
+
+import errno
+import os
+import re
+import sys
+import threading
+
+from . import execute
+from . import log
+
+#
+# The run's jobserver or None.
+#
+_server = None
+
+
+def _auth_option(make):
+    """The make option passing the jobserver's pipe to the make or None
+    if the make is not a GNU make."""
+    e = execute.capture_execution()
+    exit_code, proc, output = e.spawn([make, '--version'])
+    if exit_code != 0:
+        return None
+    version = re.search(r'GNU Make (\d+)\.(\d+)', output)
+    if version is None:
+        return None
+    if (int(version.group(1)), int(version.group(2))) < (4, 2):
+        return '--jobserver-fds'
+    return '--jobserver-auth'
+
+
+class jobserver:
+    """A GNU make jobserver's pipe of job tokens."""
+
+    def __init__(self, jobs, auth):
+        self.jobs = jobs
+        self.auth = auth
+        self.lock = threading.Lock()
+        self.first_free = True
+        self.read_fd, self.write_fd = os.pipe()
+        for fd in [self.read_fd, self.write_fd]:
+            if hasattr(os, 'set_inheritable'):
+                os.set_inheritable(fd, True)
+        os.write(self.write_fd, b'+' * (jobs - 1))
+
+    def mflags(self):
+        """The make command line option to use the jobserver. A make before
+        4.2 needs a -j with no jobs to use the pipe and a later make uses
+        its own jobs if given a -j."""
+        mflags = '%s=%d,%d' % (self.auth, self.read_fd, self.write_fd)
+        if self.auth == '--jobserver-fds':
+            mflags = '-j ' + mflags
+        return mflags
+
+    def acquire(self):
+        """Take a job for a package build, blocking until there is one.
+        Return the token to release."""
+        self.lock.acquire()
+        try:
+            if self.first_free:
+                self.first_free = False
+                return None
+        finally:
+            self.lock.release()
+        while True:
+            try:
+                return os.read(self.read_fd, 1)
+            except OSError as err:
+                if err.errno != errno.EINTR:
+                    raise
+
+    def release(self, token):
+        if token is None:
+            self.lock.acquire()
+            try:
+                self.first_free = True
+            finally:
+                self.lock.release()
+        else:
+            os.write(self.write_fd, token)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def start(opts, macros):
+    """Start the run's jobserver if the builds can share one. Return True
+    if the jobserver is running."""
+    global _server
+    if _server is not None:
+        return True
+    if sys.platform == 'win32' or opts.dry_run():
+        return False
+    if macros.expand('%{_make_jobserver}') != '1':
+        return False
+    jobs = int(opts.jobs(macros.expand('%{_ncpus}')))
+    if jobs <= 1:
+        return False
+    make = macros.expand('%{__make}')
+    auth = _auth_option(make)
+    if auth is None:
+        log.trace('jobserver: not a GNU make: %s', make)
+        return False
+    _server = jobserver(jobs, auth)
+    log.trace('jobserver: %d jobs: %s', jobs, _server.mflags())
+    return True
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.close()
+        _server = None
+
+
+def running():
+    return _server is not None
+
+
+def mflags():
+    """The make option to use the jobserver or None if there is no
+    jobserver."""
+    if _server is None:
+        return None
+    return _server.mflags()
+
+
+def acquire():
+    if _server is None:
+        return None
+    return _server.acquire()
+
+
+def release(token):
+    if _server is not None:
+        _server.release(token)
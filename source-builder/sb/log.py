@@ -25,6 +25,7 @@ from __future__ import print_function
 
 import os
 import sys
+import threading
 
 from . import error
 
@@ -44,6 +45,11 @@ capture = None
 tracing = False
 quiet = False
 
+#
+# Output held by a thread so it can be replayed in order.
+#
+_held = threading.local()
+
 
 def set_default_once(log):
     global default
@@ -70,12 +76,67 @@ def _output(text=os.linesep, log=None):
         sys.stdout.flush()
 
 
+def hold():
+    """Hold the output of this thread until it is released. Holds nest."""
+    if getattr(_held, 'stack', None) is None:
+        _held.stack = []
+    _held.stack.append([])
+
+
+def release():
+    """Stop holding this thread's output and return what is held."""
+    return _held.stack.pop()
+
+
+def replay(held):
+    """Output held output in the order it was held."""
+    if held is not None:
+        for func, args in held:
+            func(*args)
+
+
+class _held_log:
+    """A log for output made by another thread on behalf of a thread that is
+    holding its output."""
+
+    def __init__(self, held):
+        self.held = held
+
+    def output(self, text):
+        self.held.append((_output, (text, None)))
+
+
+def thread_log():
+    """Return the log for output other threads make for this thread, for
+    example the output of a command it runs. The output is held with this
+    thread's output if it is being held."""
+    stack = getattr(_held, 'stack', None)
+    if stack:
+        return _held_log(stack[-1])
+    return default
+
+
+def _holding(func, *args):
+    stack = getattr(_held, 'stack', None)
+    if not stack:
+        return False
+    stack[-1].append((func, args))
+    return True
+
+
 def stdout_raw(text=os.linesep):
+    #
+    # Raw output is progress that has no meaning when replayed.
+    #
+    if getattr(_held, 'stack', None):
+        return
     print(text, end='')
     sys.stdout.flush()
 
 
 def stderr(text=os.linesep, log=None):
+    if _holding(stderr, text, log):
+        return
     for l in text.replace(chr(13), '').splitlines():
         print(l, file=sys.stderr)
         sys.stderr.flush()
@@ -83,12 +144,27 @@ def stderr(text=os.linesep, log=None):
         capture(text)
 
 
-def output(text=os.linesep, log=None):
+def _render(text, args):
+    """Render a deferred message. The text can be a callable returning the
+    text or a format string the arguments are applied to. The text is not
+    rendered unless it is output."""
+    if callable(text):
+        text = text()
+    if len(args) != 0:
+        text = text % args
+    return text
+
+
+def output(text=os.linesep, *args, **kwargs):
     if not quiet:
-        _output(text, log)
+        text = _render(text, args)
+        if not _holding(_output, text, kwargs.get('log')):
+            _output(text, kwargs.get('log'))
 
 
 def notice(text=os.linesep, log=None):
+    if _holding(notice, text, log):
+        return
     if not quiet and default is not None and not default.has_stdout():
         for l in text.replace(chr(13), '').splitlines():
             print(l)
@@ -98,9 +174,11 @@ def notice(text=os.linesep, log=None):
     _output(text, log)
 
 
-def trace(text=os.linesep, log=None):
+def trace(text=os.linesep, *args, **kwargs):
     if not quiet and tracing:
-        _output(text, log)
+        text = _render(text, args)
+        if not _holding(_output, text, kwargs.get('log')):
+            _output(text, kwargs.get('log'))
 
 
 def warning(text=os.linesep, log=None):
@@ -222,6 +300,8 @@ if __name__ == "__main__":
         print('- quiet:%s - trace:%s %s' %
               (str(quiet), str(tracing), '-' * 30))
         trace('trace with quiet off and trace on')
+        trace('trace with %s off and trace %s deferred', 'quiet', 'on')
+        trace(lambda: 'trace with quiet off and trace on callable')
         notice('notice with quiet off and trace on')
         quiet = True
         tracing = True
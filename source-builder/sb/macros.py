@@ -23,14 +23,72 @@
 
 from __future__ import print_function
 
+import collections
+import itertools
 import re
 import os
 import string
+import threading
 
 from . import error
 from . import path
 
 
+#
+# Generations of the macro views. A view gets a new generation when any
+# macro it resolves changes, so a generation identifies the macro values
+# of any macros instance or copy.
+#
+_generations = itertools.count(1)
+
+
+class expansion_cache:
+    """A bounded least recently used cache of expansion results. Keys
+    contain the generation of the view the result was expanded with. Copies
+    of a macros instance can be used by other threads so the cache is
+    locked."""
+
+    def __init__(self, size=8192):
+        self.size = size
+        self.lock = threading.Lock()
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return 'hits=%d misses=%d entries=%d' % \
+            (self.hits, self.misses, len(self.results))
+
+    def get(self, key):
+        with self.lock:
+            try:
+                result = self.results.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.results[key] = result
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.results.pop(key, None)
+            self.results[key] = result
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+#
+# The expansion results of all macro tables. The generations are unique
+# so copies share the results.
+#
+expansions = expansion_cache()
+
+
 #
 # Macro tables
 #
@@ -85,16 +143,27 @@ class macros:
             self.macros['global']['_sbtop'] = ('dir', 'required',
                                                path.abspath(
                                                    path.dirname(sbdir)))
+            self._owned_maps = set(['global'])
+            self._rebuild_view()
         else:
-            self.macros = {}
-            for m in original.macros:
-                if m not in self.macros:
-                    self.macros[m] = {}
-                for k in original.macros[m]:
-                    self.macros[m][k] = original.macros[m][k]
+            #
+            # A copy shares the maps and the view with the original. The
+            # first write to a shared map or the view by either copies it
+            # so a copy is a snapshot without copying every macro.
+            #
+            self.macros = dict(original.macros)
             self.read_maps = sorted(original.read_maps)
             self.read_map_locked = original.read_map_locked
             self.write_map = original.write_map
+            self._read_map_names = list(original._read_map_names)
+            self._resolved = original._resolved
+            self._defined = original._defined
+            self._sorted_keys = original._sorted_keys
+            self.generation = original.generation
+            self._owned_maps = set()
+            self._owned_view = False
+            original._owned_maps = set()
+            original._owned_view = False
         if name is not None:
             self.load(name)
 
@@ -189,7 +258,9 @@ class macros:
             raise TypeError('bad value tuple (attrib field): %s' % (value[1]))
         if value[1] == 'convert':
             value = (value[0], value[1], self.expand(value[2]))
-        self.macros[self.write_map][self.key_filter(key)] = value
+        key = self.key_filter(key)
+        self._writable_map(self.write_map)[key] = value
+        self._resolve(key)
 
     def __delitem__(self, key):
         self.undefine(key)
@@ -198,37 +269,112 @@ class macros:
         return self.has_key(self._unicode_to_str(key))
 
     def __len__(self):
-        return len(list(self.keys()))
+        return len(self._defined)
+
+    def _writable_map(self, _map):
+        if _map not in self._owned_maps:
+            self.macros[_map] = dict(self.macros[_map])
+            self._owned_maps.add(_map)
+        return self.macros[_map]
+
+    def _own_view(self):
+        if not self._owned_view:
+            self._resolved = dict(self._resolved)
+            self._defined = set(self._defined)
+            self._owned_view = True
+
+    def _resolve(self, key):
+        #
+        # Resolve the key against the read maps and the global map and
+        # update the view. The first read map holding the key provides the
+        # value. The defined count follows the way an 'undefine' in a read
+        # map has always removed a key from the list of keys.
+        #
+        value = None
+        count = 0
+        if key in self.macros['global']:
+            value = self.macros['global'][key]
+            count = 1
+        first = None
+        for rm in self._read_map_names:
+            if rm in self.macros and key in self.macros[rm]:
+                macro = self.macros[rm][key]
+                if first is None:
+                    first = macro
+                if macro[1] == 'undefine':
+                    if count > 0:
+                        count -= 1
+                else:
+                    count += 1
+        if first is not None:
+            value = first
+        defined = count > 0
+        if value is self._resolved.get(key) and \
+           defined == (key in self._defined):
+            return
+        self._own_view()
+        self.generation = next(_generations)
+        if value is None:
+            self._resolved.pop(key, None)
+        else:
+            self._resolved[key] = value
+        if defined:
+            if key not in self._defined:
+                self._defined.add(key)
+                self._sorted_keys = None
+        elif key in self._defined:
+            self._defined.discard(key)
+            self._sorted_keys = None
+
+    def _resolve_map(self, _map):
+        if _map in self.macros:
+            for key in list(self.macros[_map].keys()):
+                self._resolve(key)
+
+    def _rebuild_view(self):
+        self._read_map_names = self.get_read_maps()
+        self._resolved = {}
+        self._defined = set()
+        self._owned_view = True
+        self._sorted_keys = None
+        self.generation = next(_generations)
+        self._resolve_map('global')
+        for rm in self._read_map_names:
+            self._resolve_map(rm)
 
     def keys(self, globals=True):
-        if globals:
-            keys = list(self.macros['global'].keys())
-        else:
+        if not globals:
             keys = []
-        for rm in self.get_read_maps():
-            for mk in self.macros[rm]:
-                if self.macros[rm][mk][1] == 'undefine':
-                    if mk in keys:
-                        keys.remove(mk)
-                else:
-                    keys.append(mk)
-        return sorted(set(keys))
+            for rm in self._read_map_names:
+                for mk in self.macros[rm]:
+                    if self.macros[rm][mk][1] == 'undefine':
+                        if mk in keys:
+                            keys.remove(mk)
+                    else:
+                        keys.append(mk)
+            return sorted(set(keys))
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._defined)
+        return list(self._sorted_keys)
 
     def has_key(self, key):
         key = self._unicode_to_str(key)
         if type(key) is not str:
             raise TypeError('bad key type (want str): %s' % (type(key)))
-        if self.key_filter(key) not in list(self.keys()):
-            return False
-        return True
+        return self.key_filter(key) in self._defined
 
     def create_map(self, _map):
         if _map not in self.macros:
             self.macros[_map] = {}
+            self._owned_maps.add(_map)
 
     def delete_map(self, _map):
         if _map in self.macros:
+            keys = list(self.macros[_map].keys())
             self.macros.pop(_map, None)
+            self._owned_maps.discard(_map)
+            for key in keys:
+                self._resolve(key)
 
     def maps(self):
         return list(self.macros.keys())
@@ -394,10 +540,11 @@ class macros:
                     token = ''
                     state = 'key'
         for m in macros:
-            if m not in self.macros:
-                self.macros[m] = {}
+            self.create_map(m)
+            _map = self._writable_map(m)
             for mm in macros[m]:
-                self.macros[m][mm] = macros[m][mm]
+                _map[mm] = macros[m][mm]
+                self._resolve(mm)
 
     def load(self, name):
         names = self.expand(name).split(':')
@@ -414,13 +561,28 @@ class macros:
         raise error.general('opening macro file: %s' % \
                                 (path.host(self.expand(name))))
 
+    def snapshot(self):
+        """Return the loaded files and the maps. Copy-on-write means the
+        maps are not changed by later writes."""
+        self._owned_maps = set()
+        return (list(self.files), dict(self.macros))
+
+    def restore(self, snapshot):
+        files, maps = snapshot
+        self.files = list(files)
+        self.macros = dict(maps)
+        self._owned_maps = set()
+        self._rebuild_view()
+
     def get(self, key, globals=True, maps=None):
         key = self._unicode_to_str(key)
         if type(key) is not str:
             raise TypeError('bad key type: %s' % (type(key)))
         key = self.key_filter(key)
         if maps is None:
-            maps = self.get_read_maps()
+            if globals:
+                return self._resolved.get(key)
+            maps = self._read_map_names
         else:
             if type(maps) is str:
                 maps = [maps]
@@ -464,7 +626,8 @@ class macros:
         key = self.key_filter(key)
         for map in self.macros:
             if key in self.macros[map]:
-                del self.macros[map][key]
+                del self._writable_map(map)[key]
+        self._resolve(key)
 
     def defined(self, key, globals=True, maps=None):
         return self.get(key, globals, maps) is not None
@@ -472,6 +635,10 @@ class macros:
     def expand(self, _str):
         """Simple basic expander of config file macros."""
         _str = self._unicode_to_str(_str)
+        key = (self.generation, _str)
+        result = expansions.get(key)
+        if result is not None:
+            return result
         expanded = True
         while expanded:
             expanded = False
@@ -483,6 +650,7 @@ class macros:
                         'cannot expand default macro: %s in "%s"' % (m, _str))
                 _str = _str.replace(m, macro[2])
                 expanded = True
+        expansions.put(key, _str)
         return _str
 
     def find(self, regex, globals=True):
@@ -496,18 +664,24 @@ class macros:
     def set_read_map(self, _map):
         if not self.read_map_locked:
             if _map in self.macros:
-                if _map not in self.get_read_maps():
+                if _map not in self._read_map_names:
                     rm = '%04d_%s' % (len(self.read_maps), _map)
                     self.read_maps = sorted(self.read_maps + [rm])
+                    self._read_map_names = self.get_read_maps()
+                    self.generation = next(_generations)
+                    self._resolve_map(_map)
                 return True
         return False
 
     def unset_read_map(self, _map):
         if not self.read_map_locked:
-            if _map in self.get_read_maps():
+            if _map in self._read_map_names:
                 for i in range(0, len(self.read_maps)):
                     if '%04d_%s' % (i, _map) == self.read_maps[i]:
                         self.read_maps.pop(i)
+                self._read_map_names = self.get_read_maps()
+                self.generation = next(_generations)
+                self._resolve_map(_map)
                 return True
         return False
 
@@ -536,6 +710,10 @@ if __name__ == "__main__":
     if 'test1' in d:
         print('error: copy failed.')
         sys.exit(1)
+    d['test2'] = 'other'
+    if 'test2' in m or 'test2' not in d:
+        print('error: copy write failed.')
+        sys.exit(1)
     m.parse("[test]\n" \
             "test1: none, undefine, ''\n" \
             "name:  none, override, 'pink'\n")
@@ -547,5 +725,21 @@ if __name__ == "__main__":
         print('error: map undefine failed.')
         sys.exit(1)
     print('unset test:', m.unset_read_map('test'))
+    if 'test1' not in m or 'name' in m:
+        print('error: unset read map failed.')
+        sys.exit(1)
+    m.undefine('test1')
+    if 'test1' in m or m.get('test1') is not None:
+        print('error: undefine failed.')
+        sys.exit(1)
+    m['test3'] = 'red'
+    if m.expand('%{test3}') != 'red' or m.expand('%{test3}') != 'red':
+        print('error: expand failed.')
+        sys.exit(1)
+    m['test3'] = 'blue'
+    if m.expand('%{test3}') != 'blue':
+        print('error: expansion not invalidated.')
+        sys.exit(1)
+    print('expansions:', expansions)
     print(m)
     print(list(m.keys()))
@@ -0,0 +1,258 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Order the URLs of a download by the health of their hosts. The HTTP URLs
+# are probed at once with a HEAD request and the hosts that answer are
+# tried first, the fastest first. A host is probed once in a run on a
+# connection from its pool and the result is used for the other downloads
+# from it. The latency and throughput of each host and its failures are
+# kept in the RSB cache so later runs rank the hosts by how they did. A
+# host that fails is tried last until its cool down has passed. If the
+# cache is disabled the history is kept for the run.
+#
+# A URL that is not HTTP or HTTPS or is fetched through a proxy is not
+# probed and keeps its place. The probed URLs are ordered in the places
+# they had.
+#
+
+from __future__ import print_function
+
+import threading
+import time
+
+try:
+    import http.client as http_client
+    import urllib.parse as urllib_parse
+except ImportError:
+    import httplib as http_client
+    import urlparse as urllib_parse
+
+from . import cache
+from . import httpclient
+from . import log
+
+#
+# The seconds a probe waits for a host, the weight of a new measurement in
+# a host's averages and the smallest download that measures a host's
+# throughput.
+#
+probe_timeout = 5
+_weight = 0.3
+_throughput_size = 256 * 1024
+
+_health_name = 'mirrors'
+_health_key = cache.make_key(_health_name)
+
+_health = None
+_lock = threading.Lock()
+
+#
+# The result of the probe of each host in this run.
+#
+_probes = {}
+
+
+def host(url):
+    return urllib_parse.urlsplit(url)[1]
+
+
+class health:
+    """The history of the hosts downloaded from, kept in the cache."""
+
+    def __init__(self):
+        self.hosts = {}
+        hosts = cache.load(_health_name, _health_key)
+        if isinstance(hosts, dict):
+            self.hosts = hosts
+
+    def _host(self, name):
+        if name not in self.hosts:
+            self.hosts[name] = {'latency': None, 'throughput': None,
+                                'failures': 0, 'failed': 0}
+        return self.hosts[name]
+
+    def save(self):
+        cache.save(_health_name, _health_key, self.hosts)
+
+    def _average(self, h, key, value):
+        if h[key] is None:
+            h[key] = value
+        else:
+            h[key] = (1 - _weight) * h[key] + _weight * value
+
+    def success(self, name, latency=None, size=0, seconds=0):
+        h = self._host(name)
+        if latency is not None:
+            self._average(h, 'latency', latency)
+        if size >= _throughput_size and seconds > 0:
+            self._average(h, 'throughput', size / seconds)
+        h['failures'] = 0
+
+    def failure(self, name):
+        h = self._host(name)
+        h['failures'] += 1
+        h['failed'] = time.time()
+
+    def cooling(self, name, cooldown):
+        h = self.hosts.get(name)
+        if h is None or h['failures'] == 0:
+            return False
+        return time.time() - h['failed'] < cooldown
+
+    def transfer_time(self, name, size):
+        h = self.hosts.get(name)
+        if h is None or not h['throughput'] or size is None:
+            return 0
+        return size / h['throughput']
+
+
+def _get():
+    global _health
+    if _health is None:
+        _health = health()
+    return _health
+
+
+def probe(url, timeout=probe_timeout):
+    """Send a HEAD request to the URL. Return the state, the seconds to the
+    reply and the file's size if the reply has it. The state is 'ok',
+    'missing' if the host does not have the file or 'failed' if the host
+    cannot be used."""
+    start = time.time()
+    try:
+        status, headers = httpclient.head(
+            url, headers={'User-Agent': 'Wget/1.16.3 (freebsd10.1)'},
+            timeout=timeout)
+    except (http_client.HTTPException, IOError, OSError, ValueError):
+        return 'failed', time.time() - start, None
+    seconds = time.time() - start
+    try:
+        size = int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        size = None
+    if status in [404, 410]:
+        return 'missing', seconds, None
+    if status in [405, 501]:
+        #
+        # The host does not answer a HEAD request but is there.
+        #
+        return 'ok', seconds, None
+    if status >= 500:
+        return 'failed', seconds, None
+    return 'ok', seconds, size
+
+
+def order(urls, cooldown):
+    """Order the URLs by the health of their hosts. A host probed before in
+    the run is not probed again."""
+    probed = []
+    for u in urls:
+        if u not in probed and u.startswith('http') and httpclient._pooled(u):
+            probed += [u]
+    with _lock:
+        h = _get()
+        cooling = set([u for u in probed if h.cooling(host(u), cooldown)])
+        results = {}
+        for u in probed:
+            if u not in cooling and host(u) in _probes:
+                results[u] = _probes[host(u)]
+    fresh = []
+    if len(probed) > 1:
+        hosts = set()
+        for u in probed:
+            if u not in cooling and u not in results and host(u) not in hosts:
+                fresh += [u]
+                hosts.add(host(u))
+    if len(fresh) > 0:
+        probes = {}
+
+        def _probe(url):
+            probes[url] = probe(url)
+
+        threads = [threading.Thread(target=_probe, args=(u, )) for u in fresh]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join(probe_timeout + 1)
+        probes = dict(probes)
+        with _lock:
+            for u in fresh:
+                if u not in probes:
+                    continue
+                state, seconds, size = probes[u]
+                log.trace('mirrors: probe: %s: %s %0.3fs', u, state, seconds)
+                if state == 'ok':
+                    h.success(host(u), latency=seconds)
+                elif state == 'failed':
+                    h.failure(host(u))
+                #
+                # A host without this file is there for the others.
+                #
+                if state == 'missing':
+                    _probes[host(u)] = ('ok', seconds, None)
+                else:
+                    _probes[host(u)] = (state, seconds, None)
+                results[u] = probes[u]
+            if len(probes) > 0:
+                h.save()
+        for u in probed:
+            if u not in results and u not in cooling and host(u) in _probes:
+                results[u] = _probes[host(u)]
+    #
+    # The file is the same on each host so any size a host gave is the
+    # size to transfer.
+    #
+    size = None
+    for u in results:
+        if results[u][2] is not None:
+            size = results[u][2]
+    with _lock:
+        ranks = {}
+        for u in probed:
+            if u in cooling:
+                ranks[u] = (3, 0)
+            elif u not in results:
+                ranks[u] = (1, 0)
+            elif results[u][0] == 'ok':
+                ranks[u] = (0, results[u][1] + h.transfer_time(host(u), size))
+            elif results[u][0] == 'missing':
+                ranks[u] = (2, 0)
+            else:
+                ranks[u] = (3, 0)
+    places = [p for p in range(0, len(urls)) if urls[p] in ranks]
+    ranked = sorted(places, key=lambda p: (ranks[urls[p]], p))
+    ordered = list(urls)
+    for place, p in zip(places, ranked):
+        ordered[place] = urls[p]
+    if ordered != urls:
+        log.trace('mirrors: order: %s', ', '.join(ordered))
+    return ordered
+
+
+def record(url, ok, size=0, seconds=0):
+    """Record a download from the URL's host."""
+    with _lock:
+        h = _get()
+        if ok:
+            h.success(host(url), size=size, seconds=seconds)
+        else:
+            h.failure(host(url))
+        h.save()
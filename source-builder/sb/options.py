@@ -31,6 +31,7 @@ import os
 import string
 import sys
 
+from . import cache
 from . import download
 from . import error
 from . import execute
@@ -63,6 +64,10 @@ class command_line:
             '--sourcedir': ('_sourcedir', self._lo_path, True, None, False),
             '--patchdir': ('_patchdir', self._lo_path, True, None, False),
             '--tmppath': ('_tmppath', self._lo_path, True, None, False),
+            '--source-cache-dir':
+            ('_source_cache_dir', self._lo_path, True, None, False),
+            '--build-cache-dir':
+            ('_build_cache_dir', self._lo_path, True, None, False),
             '--jobs': ('_jobs', self._lo_jobs, True, 'max', True),
             '--log': ('_logfile', self._lo_string, True, None, False),
             '--url': ('_url_base', self._lo_string, True, None, False),
@@ -87,6 +92,10 @@ class command_line:
             '--always-clean': ('_always_clean', self._lo_bool, False, '0',
                                True),
             '--no-install': ('_no_install', self._lo_bool, False, '0', True),
+            '--no-source-cache':
+            ('_no_source_cache', self._lo_bool, False, '0', True),
+            '--no-build-cache':
+            ('_no_build_cache', self._lo_bool, False, '0', True),
             '--regression': ('_regression', self._lo_bool, False, '0', True),
             '--host': ('_host', self._lo_triplets, True, None, False),
             '--build': ('_build', self._lo_triplets, True, None, False),
@@ -266,6 +275,18 @@ class command_line:
         )
         print('--url url[,url]        : URL to look for source')
         print('--no-download          : Disable the source downloader')
+        print(
+            '--source-cache-dir dir : Path to the extracted source cache, default: ./source-cache'
+        )
+        print(
+            '--no-source-cache      : Extract and patch the source in every build'
+        )
+        print(
+            '--build-cache-dir dir  : Path to the package build cache, default: not used'
+        )
+        print(
+            '--no-build-cache       : Build every package even if it is cached'
+        )
         print(
             '--no-install           : Do not install the packages to the prefix'
         )
@@ -377,14 +398,19 @@ class command_line:
             self.defaults['_keep_going'] = '1'
             self.opts['always-clean'] = '1'
             self.defaults['_always_clean'] = '1'
+        # The Python running the builder runs the build's Python helpers
+        self.defaults['__python'] = sys.executable
         # Handle the jobs for make
         if '_ncpus' not in self.defaults:
             raise error.general('host number of CPUs not set')
+        # Handle the jobs for make and the tools that are not make. The
+        # jobserver replaces the make jobs if it runs.
         ncpus = self.jobs(self.defaults['_ncpus'])
         if ncpus > 1:
             self.defaults['_smp_mflags'] = '-j %d' % (ncpus)
         else:
             self.defaults['_smp_mflags'] = self.defaults['nil']
+        self.defaults['_smp_jobs'] = self.defaults['_smp_mflags']
         # Load user macro files
         um = self.user_macros()
         if um:
@@ -470,6 +496,12 @@ class command_line:
     def no_install(self):
         return self.opts['no-install'] != '0'
 
+    def no_source_cache(self):
+        return self.opts['no-source-cache'] != '0'
+
+    def no_build_cache(self):
+        return self.opts['no-build-cache'] != '0'
+
     def canadian_cross(self):
         _host = self.defaults.expand('%{_host}')
         _build = self.defaults.expand('%{_build}')
@@ -682,39 +714,24 @@ class command_line:
             self.args.append('--with-rtems-bsp=%s' % (ab[1]))
 
 
-def load(args, optargs=None, defaults='%{_sbdir}/defaults.mc', logfile=True):
-    """
-    Copy the defaults, get the host specific values and merge them overriding
-    any matching defaults, then create an options object to handle the command
-    line merging in any command line overrides. Finally post process the
-    command line.
-    """
+def _host_name():
+    if os.name == 'nt':
+        return 'Windows'
+    return os.uname()[0]
 
-    global host_windows
-    global host_posix
 
-    #
-    # The path to this command.
-    #
-    command_path = path.dirname(path.abspath(args[0]))
-    if len(command_path) == 0:
-        command_path = '.'
+def _host_module():
+    """Return the host support module and set the host state."""
 
-    #
-    # The command line contains the base defaults object all build objects copy
-    # and modify by loading a configuration.
-    #
-    o = command_line(args, optargs,
-                     macros.macros(name=defaults, sbdir=command_path),
-                     command_path)
+    global host_windows
+    global host_posix
 
-    overrides = None
     if os.name == 'nt':
         try:
             from . import windows
-            overrides = windows.load()
             host_windows = True
             host_posix = False
+            return windows
         except:
             raise error.general('failed to load Windows host support')
     elif os.name == 'posix':
@@ -722,26 +739,26 @@ def load(args, optargs=None, defaults='%{_sbdir}/defaults.mc', logfile=True):
         try:
             if uname[0].startswith('MINGW64_NT'):
                 from . import windows
-                overrides = windows.load()
                 host_windows = True
+                return windows
             elif uname[0].startswith('CYGWIN_NT'):
                 from . import windows
-                overrides = windows.load()
+                return windows
             elif uname[0] == 'Darwin':
                 from . import darwin
-                overrides = darwin.load()
+                return darwin
             elif uname[0] == 'FreeBSD':
                 from . import freebsd
-                overrides = freebsd.load()
+                return freebsd
             elif uname[0] == 'NetBSD':
                 from . import netbsd
-                overrides = netbsd.load()
+                return netbsd
             elif uname[0] == 'Linux':
                 from . import linux
-                overrides = linux.load()
+                return linux
             elif uname[0] == 'SunOS':
                 from . import solaris
-                overrides = solaris.load()
+                return solaris
         except error.general as ge:
             raise error.general('failed to load %s host support: %s' %
                                 (uname[0], ge))
@@ -749,6 +766,66 @@ def load(args, optargs=None, defaults='%{_sbdir}/defaults.mc', logfile=True):
             raise error.general('failed to load %s host support' % (uname[0]))
     else:
         raise error.general('unsupported host type; please add')
+    raise error.general('no hosts defaults found; please add')
+
+
+def load(args, optargs=None, defaults='%{_sbdir}/defaults.mc', logfile=True):
+    """
+    Copy the defaults, get the host specific values and merge them overriding
+    any matching defaults, then create an options object to handle the command
+    line merging in any command line overrides. Finally post process the
+    command line.
+    """
+
+    #
+    # The path to this command.
+    #
+    command_path = path.dirname(path.abspath(args[0]))
+    if len(command_path) == 0:
+        command_path = '.'
+
+    #
+    # The parsed defaults are the same for every command run in the same
+    # place. Use the snapshot of them if nothing they depend on has
+    # changed. The host defaults depend on the CPUs, the distribution and
+    # the tools installed so the host is probed each time.
+    #
+    defaults_file = macros.macros(sbdir=command_path).expand(defaults)
+    snapshot_key = cache.make_key(defaults_file, cache.module_key(macros),
+                                  command_path, os.getcwd(),
+                                  os.environ.get('PATH'))
+    snapshot = cache.load('defaults', snapshot_key)
+    if snapshot is not None:
+        for fk in snapshot['files']:
+            if cache.file_key(fk[0]) != fk:
+                snapshot = None
+                break
+
+    #
+    # The command line contains the base defaults object all build objects copy
+    # and modify by loading a configuration.
+    #
+    if snapshot is None:
+        _defaults = macros.macros(name=defaults, sbdir=command_path)
+        parsed = _defaults.snapshot()
+    else:
+        _defaults = macros.macros(sbdir=command_path)
+        _defaults.restore(snapshot['macros'])
+    o = command_line(args, optargs, _defaults, command_path)
+
+    if snapshot is None:
+        cache.save('defaults', snapshot_key, {
+            'files': [cache.file_key(f) for f in parsed[0]],
+            'macros': parsed
+        })
+    try:
+        overrides = _host_module().load()
+    except error.general as ge:
+        raise error.general('failed to load %s host support: %s' %
+                            (_host_name(), ge))
+    except:
+        raise error.general('failed to load %s host support' %
+                            (_host_name()))
     if overrides is None:
         raise error.general('no hosts defaults found; please add')
     for k in overrides:
@@ -25,11 +25,14 @@
 
 from __future__ import print_function
 
+import collections
+import errno
 import os
 import shutil
 import stat
 import string
 import sys
+import threading
 
 from . import error
 from . import log
@@ -202,7 +205,8 @@ def mkdir(path):
             except IOError as err:
                 raise error.general('cannot make directory: %s' % (path))
             except OSError as err:
-                raise error.general('cannot make directory: %s' % (path))
+                if not isdir(path):
+                    raise error.general('cannot make directory: %s' % (path))
             except WindowsError as err:
                 raise error.general('cannot make directory: %s' % (path))
         else:
@@ -211,7 +215,8 @@ def mkdir(path):
             except IOError as err:
                 raise error.general('cannot make directory: %s' % (path))
             except OSError as err:
-                raise error.general('cannot make directory: %s' % (path))
+                if not isdir(path):
+                    raise error.general('cannot make directory: %s' % (path))
 
 
 def chdir(path):
@@ -284,118 +289,496 @@ def copy(src, dst):
                                 (hsrc, hdst, str(why)))
 
 
-def copy_tree(src, dst):
-    trace = False
+#
+# The Linux ioctl to clone a file's extents, FICLONE.
+#
+_ficlone = 0x40049409
 
-    hsrc = host(src)
-    hdst = host(dst)
+#
+# The errors a kernel copy fails with if the kernel or file system cannot
+# do it. The next way of copying is tried.
+#
+_kernel_copy_errors = [
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY,
+    errno.EBADF
+]
 
-    if exists(src):
-        names = listdir(src)
+#
+# The number of threads copying the files of a tree.
+#
+try:
+    import multiprocessing
+    copy_tree_workers = min(multiprocessing.cpu_count(), 4)
+except (ImportError, NotImplementedError):
+    copy_tree_workers = 1
+
+
+class _file_copier:
+    """Copy a file's data in the kernel if the host can. A file is
+    reflinked, copied with copy_file_range or sendfile or read and written.
+    A way that fails because the kernel or file system cannot do it is not
+    tried again."""
+
+    def __init__(self):
+        linux = sys.platform.startswith('linux')
+        self.reflink = linux
+        self.copy_file_range = linux and hasattr(os, 'copy_file_range')
+        self.sendfile = linux and hasattr(os, 'sendfile')
+
+    def copy(self, hsrc, hdst):
+        with open(hsrc, 'rb') as s:
+            with open(hdst, 'wb') as d:
+                sfd = s.fileno()
+                dfd = d.fileno()
+                if self.reflink:
+                    try:
+                        import fcntl
+                        fcntl.ioctl(dfd, _ficlone, sfd)
+                        return 'reflink'
+                    except (IOError, OSError) as err:
+                        if err.errno not in _kernel_copy_errors:
+                            raise
+                        self.reflink = False
+                size = os.fstat(sfd).st_size
+                copied = 0
+                if self.copy_file_range:
+                    try:
+                        while copied < size:
+                            count = os.copy_file_range(sfd, dfd, size - copied)
+                            if count == 0:
+                                break
+                            copied += count
+                    except OSError as err:
+                        if copied > 0 or err.errno not in _kernel_copy_errors:
+                            raise
+                        self.copy_file_range = False
+                if self.sendfile and copied == 0:
+                    try:
+                        while copied < size:
+                            count = os.sendfile(dfd, sfd, copied,
+                                                size - copied)
+                            if count == 0:
+                                break
+                            copied += count
+                    except OSError as err:
+                        if copied > 0 or err.errno not in _kernel_copy_errors:
+                            raise
+                        self.sendfile = False
+                if copied > 0:
+                    os.lseek(sfd, copied, os.SEEK_SET)
+                    os.lseek(dfd, copied, os.SEEK_SET)
+                #
+                # Anything left, the file may have grown, is read and
+                # written.
+                #
+                shutil.copyfileobj(s, d, 1024 * 1024)
+        return 'copy'
+
+
+def _scandir(hpath):
+    """The names and types of a directory's entries. The type is 'link',
+    'dir', 'file' or 'other'. The scandir entries hold the types so a
+    directory entry is only stat'ed if the file system does not say."""
+    entries = []
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(hpath):
+            if entry.is_symlink():
+                kind = 'link'
+            elif entry.is_dir():
+                kind = 'dir'
+            elif entry.is_file(follow_symlinks=False):
+                kind = 'file'
+            else:
+                kind = 'other'
+            entries += [(entry.name, kind)]
     else:
-        names = []
-
-    if trace:
-        print('path.copy_tree:')
-        print('   src: "%s"' % (src))
-        print('  hsrc: "%s"' % (hsrc))
-        print('   dst: "%s"' % (dst))
-        print('  hdst: "%s"' % (hdst))
-        print(' names: %r' % (names))
-
-    if not os.path.isdir(hdst):
-        if trace:
-            print(' mkdir: %s' % (hdst))
-        try:
-            os.makedirs(hdst)
-        except OSError as why:
-            raise error.general('copying tree: cannot create target directory %s: %s' % \
-                                (hdst, str(why)))
-
-    for name in names:
-        srcname = host(os.path.join(hsrc, name))
-        dstname = host(os.path.join(hdst, name))
+        for name in os.listdir(hpath):
+            st = os.lstat(os.path.join(hpath, name))
+            if stat.S_ISLNK(st.st_mode):
+                kind = 'link'
+            elif stat.S_ISDIR(st.st_mode):
+                kind = 'dir'
+            elif stat.S_ISREG(st.st_mode):
+                kind = 'file'
+            else:
+                kind = 'other'
+            entries += [(name, kind)]
+    return sorted(entries)
+
+
+class _tree_copier:
+    """Copy a tree. The tree is walked and its directories and links are
+    created on the calling thread and the files are copied by a pool of
+    threads. The directories' modes and times are set once all the files
+    are copied."""
+
+    def __init__(self, mode, replace, workers):
+        self.mode = mode
+        self.replace = replace
+        self.workers = workers
+        self.files = _file_copier()
+        self.lock = threading.Condition()
+        self.queue = collections.deque()
+        self.threads = []
+        self.closing = False
+        self.error = None
+        self.dirs = []
+
+    def _failed(self, err):
+        with self.lock:
+            if self.error is None:
+                self.error = err
+
+    def _copy(self, srcname, dstname, kind):
+        if self.replace:
+            if os.path.lexists(dstname) and not os.path.isdir(dstname):
+                os.remove(dstname)
+            mode = clone_file(srcname, dstname, self.mode, self.files)
+            if mode != self.mode:
+                with self.lock:
+                    self.mode = mode
+        elif kind == 'file':
+            self.files.copy(srcname, dstname)
+            shutil.copystat(srcname, dstname)
+        else:
+            shutil.copyfile(srcname, dstname)
+            shutil.copystat(srcname, dstname)
+
+    def _run(self, job):
+        hsrc, hdst, srcname, dstname, kind = job
         try:
-            if os.path.islink(srcname):
-                linkto = os.readlink(srcname)
-                if exists(shell(dstname)):
-                    if os.path.islink(dstname):
-                        dstlinkto = os.readlink(dstname)
-                        if linkto != dstlinkto:
-                            log.warning('copying tree: link does not match: %s -> %s' % \
-                                            (dstname, dstlinkto))
+            self._copy(srcname, dstname, kind)
+        except shutil.Error as err:
+            self._failed(error.general('copying tree (2): %s -> %s: %s' % \
+                                       (hsrc, hdst, str(err))))
+        except EnvironmentError as why:
+            self._failed(error.general('copying tree (3): %s -> %s: %s' % \
+                                       (srcname, dstname, str(why))))
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while len(self.queue) == 0 and not self.closing:
+                    self.lock.wait()
+                if len(self.queue) == 0:
+                    return
+                job = self.queue.popleft()
+                if self.error is not None:
+                    continue
+            self._run(job)
+
+    def _add(self, job):
+        if self.workers <= 1:
+            self._run(job)
+            return
+        with self.lock:
+            self.queue.append(job)
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                self.threads += [thread]
+                thread.start()
+            self.lock.notify()
+
+    def walk(self, src, dst, entries):
+        hsrc = host(src)
+        hdst = host(dst)
+        if not os.path.isdir(hdst):
+            try:
+                os.makedirs(hdst)
+            except OSError as why:
+                raise error.general('copying tree: cannot create target directory %s: %s' % \
+                                    (hdst, str(why)))
+        for name, kind in entries:
+            if self.error is not None:
+                return
+            srcname = host(os.path.join(hsrc, name))
+            dstname = host(os.path.join(hdst, name))
+            try:
+                if kind == 'link':
+                    linkto = os.readlink(srcname)
+                    if os.path.lexists(dstname):
+                        if os.path.islink(dstname):
+                            dstlinkto = os.readlink(dstname)
+                            if linkto != dstlinkto:
+                                log.warning('copying tree: link does not match: %s -> %s' % \
+                                                (dstname, dstlinkto))
+                                os.remove(dstname)
+                        else:
+                            log.warning('copying tree: destination is not a link: %s' % \
+                                            (dstname))
                             os.remove(dstname)
                     else:
-                        log.warning('copying tree: destination is not a link: %s' % \
-                                        (dstname))
-                        os.remove(dstname)
+                        os.symlink(linkto, dstname)
+                elif kind == 'dir':
+                    self.walk(srcname, dstname, _scandir(srcname))
                 else:
-                    os.symlink(linkto, dstname)
-            elif os.path.isdir(srcname):
-                copy_tree(srcname, dstname)
-            else:
-                shutil.copyfile(host(srcname), host(dstname))
-                shutil.copystat(host(srcname), host(dstname))
-        except shutil.Error as err:
-            raise error.general('copying tree (2): %s -> %s: %s' % \
-                                (hsrc, hdst, str(err)))
-        except EnvironmentError as why:
-            raise error.general('copying tree (3): %s -> %s: %s' % \
-                                (srcname, dstname, str(why)))
+                    self._add((hsrc, hdst, srcname, dstname, kind))
+            except shutil.Error as err:
+                raise error.general('copying tree (2): %s -> %s: %s' % \
+                                    (hsrc, hdst, str(err)))
+            except EnvironmentError as why:
+                raise error.general('copying tree (3): %s -> %s: %s' % \
+                                    (srcname, dstname, str(why)))
+        self.dirs += [(hsrc, hdst)]
+
+    def stop(self):
+        """Wait for the files being copied."""
+        with self.lock:
+            self.closing = True
+            self.lock.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def finish(self):
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        for hsrc, hdst in self.dirs:
+            try:
+                shutil.copystat(hsrc, hdst)
+            except OSError as why:
+                if windows:
+                    if WindowsError is not None and isinstance(why, WindowsError):
+                        pass
+                else:
+                    raise error.general('copying tree (4): %s -> %s: %s' %
+                                        (hsrc, hdst, str(why)))
+
+
+def copy_tree(src, dst, mode='copy', workers=None):
+    """Copy a tree into a destination that may exist. The mode is the
+    clone_file mode of the files. Files are written in place when the mode
+    is 'copy' and replaced otherwise so a file linked or cloned into
+    another tree is never changed. The mode used is returned."""
+    if workers is None:
+        workers = copy_tree_workers
+    copier = _tree_copier(mode, mode != 'copy', workers)
+    hsrc = host(src)
+    if exists(src):
+        entries = _scandir(hsrc)
+    else:
+        entries = []
     try:
-        shutil.copystat(hsrc, hdst)
-    except OSError as why:
-        if windows:
-            if WindowsError is not None and isinstance(why, WindowsError):
-                pass
-        else:
-            raise error.general('copying tree (4): %s -> %s: %s' %
-                                (hsrc, hdst, str(why)))
+        copier.walk(src, dst, entries)
+    except:
+        copier.stop()
+        raise
+    copier.finish()
+    return copier.mode
 
 
-def get_size(path, depth=-1):
-    #
-    # Get the size the directory tree manually to the required depth.
-    # This makes sure on Windows the files are correctly encoded to avoid
-    # the file name size limit. On Windows the os.walk fails once we
-    # get to the max path length on Windows.
-    #
-    def _isdir(path):
-        hpath = host_encode(path)
-        return os.path.isdir(hpath) and not os.path.islink(hpath)
+def _reflink(hsrc, hdst):
+    import fcntl
+    with open(hsrc, 'rb') as s:
+        with open(hdst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _ficlone, s.fileno())
+    shutil.copystat(hsrc, hdst)
 
-    def _node_size(path):
-        hpath = host_encode(path)
-        size = 0
-        if not os.path.islink(hpath):
-            size = os.path.getsize(hpath)
-        return size
 
-    def _get_size(path, depth, level=0):
-        level += 1
+def clone_file(src, dst, mode='copy', copier=None):
+    """Clone a file. The mode can be 'reflink' to share the file's data
+    with copy-on-write, 'hardlink' to link to the same file or 'copy'. If
+    the file system cannot reflink or link the file is copied. The mode
+    used is returned so a caller can stop trying a mode that fails."""
+    hsrc = host(src)
+    hdst = host(dst)
+    if mode == 'hardlink' and not windows:
+        try:
+            os.link(hsrc, hdst)
+            return mode
+        except OSError:
+            pass
+    elif mode == 'reflink' and sys.platform.startswith('linux'):
+        try:
+            _reflink(hsrc, hdst)
+            return mode
+        except (IOError, OSError):
+            if os.path.exists(hdst):
+                os.unlink(hdst)
+    if copier is None:
+        copier = _file_copier()
+    if os.path.isfile(hsrc):
+        copier.copy(hsrc, hdst)
+    else:
+        shutil.copyfile(hsrc, hdst)
+    shutil.copystat(hsrc, hdst)
+    return 'copy'
+
+
+def clone_tree(src, dst, mode='copy'):
+    """Clone a directory tree to a destination that does not exist. Files
+    are cloned with clone_file, links are recreated and the modes and
+    times are kept. If a mode fails the rest of the tree is copied."""
+    hsrc = host(src)
+    hdst = host(dst)
+    try:
         dirs = []
-        size = 0
-        for name in listdir(path):
-            path_ = join(path, shell(name))
-            hname = host(path_)
-            if _isdir(path_):
-                dirs += [shell(name)]
-            else:
-                size += _node_size(path_)
-        if depth < 0 or level < depth:
-            for name in dirs:
-                dir = join(path, name)
-                size += _get_size(dir, depth, level)
-        return size
+        for root, dirnames, filenames in os.walk(hsrc):
+            droot = os.path.normpath(
+                os.path.join(hdst, os.path.relpath(root, hsrc)))
+            os.mkdir(droot)
+            dirs += [(root, droot)]
+            for name in dirnames + filenames:
+                srcname = os.path.join(root, name)
+                dstname = os.path.join(droot, name)
+                if os.path.islink(srcname):
+                    os.symlink(os.readlink(srcname), dstname)
+                elif name in filenames:
+                    mode = clone_file(srcname, dstname, mode)
+        for root, droot in reversed(dirs):
+            shutil.copystat(root, droot)
+    except (IOError, OSError, shutil.Error) as err:
+        raise error.general('cloning tree: %s -> %s: %s' % (src, dst, str(err)))
+    return mode
 
-    path = shell(path)
-    hpath = host_encode(path)
+
+#
+# The size of the files in a directory, not counting its sub-directories,
+# and its sub-directories by the directory's host path. An entry is used
+# while the directory's modification time is the same so it is only used
+# for trees files are added to and not changed in place. A writer that
+# changes a file in place forgets the directory's size.
+#
+_dir_sizes = {}
+_dir_sizes_lock = threading.Lock()
+
+#
+# The number of threads scanning directories when measuring trees. The
+# scans wait on the file system so there can be more than the host's CPUs.
+#
+get_size_workers = 4
+
+
+def _dir_stamp(hpath):
+    st = os.stat(hpath)
+    return (st.st_mtime, st.st_ino, st.st_dev)
+
+
+def _dir_size(hpath, cache):
+    """The size of the files in a directory and the host paths of its
+    sub-directories. Links are not counted or followed."""
+    if cache:
+        stamp = _dir_stamp(hpath)
+        with _dir_sizes_lock:
+            if hpath in _dir_sizes and _dir_sizes[hpath][0] == stamp:
+                return _dir_sizes[hpath][1:]
     size = 0
+    dirs = []
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(hpath):
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                dirs += [entry.path]
+            else:
+                size += entry.stat(follow_symlinks=False).st_size
+    else:
+        for name in os.listdir(hpath):
+            name = os.path.join(hpath, name)
+            st = os.lstat(name)
+            if stat.S_ISDIR(st.st_mode):
+                dirs += [name]
+            elif not stat.S_ISLNK(st.st_mode):
+                size += st.st_size
+    if cache:
+        with _dir_sizes_lock:
+            _dir_sizes[hpath] = (stamp, size, dirs)
+    return size, dirs
+
+
+def forget_size(path):
+    """Forget the cached sizes of a directory and the directories in it."""
+    hpath = host_encode(shell(path))
+    # The path with a separator, the path can be bytes
+    below = os.path.join(hpath, hpath[:0])
+    with _dir_sizes_lock:
+        for d in list(_dir_sizes.keys()):
+            if d == hpath or d.startswith(below):
+                del _dir_sizes[d]
+
+
+class _size_walker:
+    """Measure trees with a pool of threads scanning their directories so
+    the directories of a slow file system are read in parallel."""
+
+    def __init__(self, roots, depth, cache, workers):
+        self.sizes = [0] * len(roots)
+        self.depth = depth
+        self.cache = cache
+        self.workers = workers
+        self.lock = threading.Condition()
+        self.queue = collections.deque()
+        self.active = 0
+        self.error = None
+        for r in range(0, len(roots)):
+            self.queue.append((r, roots[r], 1))
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while len(self.queue) == 0 and self.active > 0:
+                    self.lock.wait()
+                if len(self.queue) == 0 or self.error is not None:
+                    self.lock.notify_all()
+                    return
+                root, hpath, level = self.queue.popleft()
+                self.active += 1
+            try:
+                size, dirs = _dir_size(hpath, self.cache)
+            except Exception as err:
+                size = 0
+                dirs = []
+                with self.lock:
+                    if self.error is None:
+                        self.error = err
+            with self.lock:
+                self.sizes[root] += size
+                if self.depth < 0 or level < self.depth:
+                    for d in dirs:
+                        self.queue.append((root, d, level + 1))
+                self.active -= 1
+                self.lock.notify_all()
+
+    def run(self):
+        threads = []
+        for w in range(1, self.workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            threads += [thread]
+            thread.start()
+        self._worker()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.sizes
+
+
+def get_sizes(paths, depth=-1, cache=False):
+    """The sizes of the trees of the paths measured at the same time. A
+    path that does not exist has no size. The sizes of the source and
+    patch trees can be cached."""
+    roots = []
+    for p in paths:
+        hpath = host_encode(shell(p))
+        if os.path.isdir(hpath):
+            roots += [hpath]
+        else:
+            roots += [None]
+    walked = [r for r in roots if r is not None]
+    sizes = _size_walker(walked, depth, cache, get_size_workers).run()
+    results = []
+    for r in roots:
+        if r is None:
+            results += [0]
+        else:
+            results += [sizes.pop(0)]
+    return results
 
-    if os.path.exists(hpath):
-        size = _get_size(path, depth)
 
-    return size
+def get_size(path, depth=-1):
+    return get_sizes([path], depth)[0]
 
 
 def get_humanize_size(path, depth=-1):
@@ -25,10 +25,8 @@
 from __future__ import print_function
 
 import argparse
-import base64
 import copy
 import datetime
-import hashlib
 import os
 import sys
 
@@ -263,17 +261,10 @@ def config_patch(macros, mconfigdir, pkg_config, pkg_package, version_label,
 
 
 def checksum_sha512_base64(tarball):
-    hasher = hashlib.new('sha512')
     try:
-        with open(path.host(tarball), 'rb') as f:
-            hasher.update(f.read())
-    except IOError as err:
-        log.notice('hash: %s: read error: %s' % (file_, str(err)))
-    except:
-        raise
-        raise error.general('cannot hash the tar file')
-    hash_hex = hasher.hexdigest()
-    hash_base64 = base64.b64encode(hasher.digest()).decode('utf-8')
+        hash_hex, hash_base64 = download.file_digest('sha512', tarball)
+    except (IOError, OSError) as err:
+        raise error.general('hash: %s: read error: %s' % (tarball, str(err)))
     return hash_base64
 
 
@@ -31,21 +31,27 @@ import operator
 import os
 import sys
 import tarfile
+import threading
 
 import textwrap
 
 try:
+    from . import archive
     from . import build
     from . import check
     from . import config
     from . import error
+    from . import jobserver
     from . import log
+    from . import macros
     from . import mailer
     from . import options
     from . import path
     from . import reports
     from . import shell
     from . import sources
+    from . import sourcecache
+    from . import trash
     from . import version
 except KeyboardInterrupt:
     print('abort: user terminated', file=sys.stderr)
@@ -54,6 +60,19 @@ except:
     raise
 
 
+#
+# Copies into the staging areas and the prefix are made one at a time as
+# packages built in parallel can finish together.
+#
+_copy_lock = threading.Lock()
+
+#
+# The number of packages that can build at the same time across all the
+# build sets. None if packages are built one at a time.
+#
+_build_slots = None
+
+
 def macro_expand(macros, _str):
     cstr = None
     while cstr != _str:
@@ -82,19 +101,151 @@ class log_capture(object):
         self.log = []
 
 
+class node:
+    """A configuration or nested build set of a build set and the result of
+    building it."""
+
+    def __init__(self, index, config, group):
+        self.index = index
+        self.config = config
+        self.group = group
+        self.opts = None
+        self.macros = None
+        self.chain = None
+        self.parallel = False
+        self.started = False
+        self.done = False
+        self.held = None
+        self.bset = None
+        self.build = None
+        self.fingerprint = None
+        self.collect = []
+        self.stagingroot = None
+        self.error = None
+        self.exception = None
+
+
+class scheduler:
+    """Build the configurations of a build set. The configurations in a
+    parallel group are built at the same time when the first of the group
+    is needed and the others are built when they are needed. The results
+    are taken in the build set's order and the output of a configuration
+    built in parallel is held and output when it is taken so the output is
+    the same as building one at a time. A parallel group is taken once all
+    of it has built."""
+
+    def __init__(self, bset, configs, groups, jobs, work):
+        self.bset = bset
+        self.nodes = [node(n, configs[n], groups[n])
+                      for n in range(0, len(configs))]
+        self.jobs = jobs
+        self.work = work
+        self.lock = threading.Condition()
+        self.queue = []
+        self.threads = []
+        self.stopped = False
+
+    def _prepare(self, _node, parallel):
+        _node.opts = copy.copy(self.bset.opts)
+        _node.macros = copy.copy(self.bset.macros)
+        _node.chain = self.bset.fingerprint
+        _node.parallel = parallel
+        _node.started = True
+
+    def _start_group(self, group):
+        nodes = [n for n in self.nodes if n.group == group]
+        workers = min(self.jobs, len(nodes))
+        log.trace('_bset:   : %s: parallel group: %d configs, %d workers',
+                  self.bset.bset, len(nodes), workers)
+        smp_jobs = self.bset.smp_jobs(workers)
+        for n in nodes:
+            self._prepare(n, True)
+            if smp_jobs is not None:
+                n.macros['_smp_jobs'] = smp_jobs
+                if not jobserver.running():
+                    n.macros['_smp_mflags'] = smp_jobs
+            if n.config.endswith('.bset'):
+                self.bset.stage_apart(n)
+        self.lock.acquire()
+        try:
+            self.queue += nodes
+        finally:
+            self.lock.release()
+        for w in range(0, workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            self.threads += [thread]
+            thread.start()
+
+    def _worker(self):
+        while True:
+            self.lock.acquire()
+            try:
+                if self.stopped or len(self.queue) == 0:
+                    return
+                _node = self.queue.pop(0)
+            finally:
+                self.lock.release()
+            log.hold()
+            try:
+                self.work(_node)
+            except BaseException as e:
+                _node.exception = e
+            finally:
+                _node.held = log.release()
+            self.lock.acquire()
+            try:
+                _node.done = True
+                self.lock.notify_all()
+            finally:
+                self.lock.release()
+
+    def run(self, index):
+        """Return the node of the configuration once it is built."""
+        _node = self.nodes[index]
+        if _node.group is None or self.jobs <= 1:
+            self._prepare(_node, False)
+            self.work(_node)
+            return _node
+        if not _node.started:
+            self._start_group(_node.group)
+        group = [n for n in self.nodes if n.group == _node.group]
+        self.lock.acquire()
+        try:
+            while len([n for n in group if not n.done]) != 0:
+                self.lock.wait(1)
+        finally:
+            self.lock.release()
+        log.replay(_node.held)
+        _node.held = None
+        if _node.exception is not None:
+            raise _node.exception
+        return _node
+
+    def stop(self):
+        """Stop starting builds and wait for the running builds."""
+        self.lock.acquire()
+        try:
+            self.stopped = True
+        finally:
+            self.lock.release()
+        for thread in self.threads:
+            thread.join()
+
+
 class buildset:
     """Build a set builds a set of packages."""
 
     def __init__(self, bset, _configs, opts, macros=None):
-        log.trace('_bset:   : %s: init' % (bset))
+        log.trace('_bset:   : %s: init', bset)
         self.configs = _configs
         self.opts = opts
         if macros is None:
             self.macros = copy.copy(opts.defaults)
         else:
             self.macros = copy.copy(macros)
-        log.trace('_bset:   : %s: macro defaults' % (bset))
-        log.trace(str(self.macros))
+        log.trace('_bset:   : %s: macro defaults', bset)
+        log.trace('%s', self.macros)
         self.bset = bset
         _target = macro_expand(self.macros, '%{_target}')
         if len(_target):
@@ -109,6 +260,18 @@ class buildset:
         self._sources = []
         self._patches = []
         self._hashes = []
+        #
+        # The build fingerprint of the last package built. Each package's
+        # fingerprint includes the one before it so a change to a package
+        # rebuilds it and the packages after it.
+        #
+        self.fingerprint = None
+        #
+        # The parallel group of each configuration loaded or None.
+        #
+        self.config_groups = []
+        self._group = None
+        self._groups = 0
 
     def write_mail_header(self, text='', prepend=False):
         if type(text) is list:
@@ -160,10 +323,18 @@ class buildset:
             body += (os.linesep * 2).join(mail['reports'])
             mail['mail'].send(mail['to'], mail_subject, body)
 
-    def copy(self, src, dst):
+    def copy(self, src, dst, clone='%{_staging_clone}'):
         log.output('copy: %s => %s' % (path.host(src), path.host(dst)))
         if not self.opts.dry_run():
-            path.copy_tree(src, dst)
+            clone = macro_expand(self.macros, clone)
+            if clone not in ['hardlink', 'reflink', 'copy']:
+                raise error.general('invalid clone mode: %s' % (clone))
+            _copy_lock.acquire()
+            try:
+                used = path.copy_tree(src, dst, clone)
+            finally:
+                _copy_lock.release()
+            log.trace('_bset:   : copy: %s: %s', clone, used)
 
     def report(self, _config, _build, opts, macros, format=None, mail=None):
         if len(_build.main_package().name()) > 0 \
@@ -223,13 +394,16 @@ class buildset:
     def root_copy(self, src, dst):
         what = '%s -> %s' % \
             (os.path.relpath(path.host(src)), os.path.relpath(path.host(dst)))
-        log.trace('_bset:   : %s: collecting: %s' % (self.bset, what))
+        log.trace('_bset:   : %s: collecting: %s', self.bset, what)
         self.copy(src, dst)
 
     def install(self, mode, name, src, dst):
-        log.trace('_bset:   : %s: copy %s -> %s' % (mode, src, dst))
+        log.trace('_bset:   : %s: copy %s -> %s', mode, src, dst)
         log.notice('%s: %s -> %s' % (mode, name, path.host(dst)))
-        self.copy(src, dst)
+        if mode == 'staging':
+            self.copy(src, dst)
+        else:
+            self.copy(src, dst, '%{_install_clone}')
 
     def install_mode(self):
         return macro_expand(self.macros, '%{install_mode}')
@@ -256,7 +430,7 @@ class buildset:
                           ('%{_builddir}', '%{_buildcxcdir}')]
         cxc_macros = _build.copy_init_macros()
         for m in macros_to_copy:
-            log.trace('_bset:   : Cxc: %s <= %s' % (m[0], cxc_macros[m[1]]))
+            log.trace('_bset:   : Cxc: %s <= %s', m[0], cxc_macros[m[1]])
             cxc_macros[m[0]] = cxc_macros[m[1]]
         _build.set_macros(cxc_macros)
         _build.reload()
@@ -267,14 +441,47 @@ class buildset:
         _build.set_macros(_build.copy_init_macros())
         _build.reload()
 
-    def build_package(self, _config, _build):
+    def build_package(self, _config, _build, collect=None):
+        """Build the package and copy its buildroot into the temporary root.
+        The copy is added to collect if it is a list to be made later."""
         if not _build.disabled():
             if _build.canadian_cross():
                 self.canadian_cross(_build)
             _build.make()
             if not _build.macros.get('%{_disable_collecting}'):
-                self.root_copy(_build.config.expand('%{buildroot}'),
-                               _build.config.expand('%{_tmproot}'))
+                buildroot = _build.config.expand('%{buildroot}')
+                tmproot = _build.config.expand('%{_tmproot}')
+                if collect is None:
+                    self.root_copy(buildroot, tmproot)
+                else:
+                    collect += [(buildroot, tmproot)]
+
+    def stage_apart(self, _node):
+        """A nested build set built in a parallel group stages into its own
+        staging root so the others in the group cannot see what it staged.
+        The build set's staging root stays on the path."""
+        stagingroot = macro_expand(self.macros, '%{stagingroot}')
+        _node.stagingroot = '%s-%d' % (stagingroot, _node.index)
+        _node.macros['stagingroot'] = _node.stagingroot
+        _node.macros['_pathprepend'] = \
+            '%s/bin:%s' % (_node.stagingroot,
+                           macro_expand(self.macros, '%{_pathprepend}'))
+
+    def collect(self, _node):
+        """Copy what a node built in a parallel group kept apart into the
+        temporary and staging roots. This is done as the nodes are taken in
+        the build set's order after the group has built."""
+        if _node.error is None:
+            for src, dst in _node.collect:
+                self.root_copy(src, dst)
+        _node.collect = []
+        if _node.stagingroot is not None and path.exists(_node.stagingroot):
+            if _node.error is None:
+                self.copy(_node.stagingroot,
+                          macro_expand(self.macros, '%{stagingroot}'))
+            if not self.opts.dry_run():
+                trash.remove(_node.stagingroot, self.macros, self.opts)
+        _node.stagingroot = None
 
     def bset_tar(self, stagingroot):
         if self.opts.get_arg('--bset-tar-file') or self.opts.canadian_cross():
@@ -284,23 +491,24 @@ class buildset:
             prefix = cfg.expand('%{_prefix}')
             tardir = cfg.expand('%{_tardir}')
             path.mkdir(tardir)
+            fmt, command, mtime = build.archive_settings(cfg)
             tarname = path.join(tardir,
-                                path.basename('%s.tar.bz2' % (self.bset)))
+                                path.basename('%s.tar.%s' % (self.bset, fmt)))
             log.notice('tarfile: %s' % (os.path.relpath(path.host(tarname))))
             if not self.opts.dry_run():
-                tar = None
+                roots = []
+                for filedir in sorted(path.listdir(stagingroot)):
+                    src = path.join(stagingroot, filedir)
+                    dst = path.join(prefix, filedir)
+                    log.trace('tar: %s -> %s', src, dst)
+                    roots += [(path.host(src), dst)]
                 try:
-                    tar = tarfile.open(tarname, 'w:bz2')
-                    for filedir in sorted(path.listdir(stagingroot)):
-                        src = path.join(stagingroot, filedir)
-                        dst = path.join(prefix, filedir)
-                        log.trace('tar: %s -> %s' % (src, dst))
-                        tar.add(src, dst)
-                except OSError as oe:
+                    size, seconds = archive.write(path.host(tarname), roots,
+                                                  fmt, command, mtime)
+                except (tarfile.TarError, IOError, OSError) as oe:
                     raise error.general('tarfile: %s: %s' % (self.bset, oe))
-                finally:
-                    if tar is not None:
-                        tar.close()
+                log.notice(
+                    archive.report(path.host(tarname), size, seconds, command))
 
     def parse(self, bset):
 
@@ -334,7 +542,7 @@ class buildset:
             if bsetname is None:
                 raise error.general('no build set file found: %s' % (bset))
         try:
-            log.trace('_bset:   : %s: open: %s' % (self.bset, bsetname))
+            log.trace('_bset:   : %s: open: %s', self.bset, bsetname)
             bset = open(path.host(bsetname), 'r')
         except IOError as err:
             raise error.general('error opening bset file: %s' % (bsetname))
@@ -353,7 +561,7 @@ class buildset:
                     ll = l[0:-1]
                     continue
                 ll = ''
-                log.trace('_bset:   : %s: %03d: %s' % (self.bset, lc, l))
+                log.trace('_bset:   : %s: %03d: %s', self.bset, lc, l)
                 ls = l.split()
                 if ls[0][-1] == ':' and ls[0][:-1] == 'package':
                     self.bset_pkg = ls[1].strip()
@@ -388,6 +596,21 @@ class buildset:
                     elif ls[0] == '%hash':
                         sources.hash(ls[1:], self.macros, err)
                         self.hashes += [ls[1:]]
+                    #
+                    # The configurations and build sets from a %parallel
+                    # to a %barrier, another %parallel or the end of the
+                    # file are a group that can build at the same time.
+                    # The members of a group must not depend on each
+                    # other. A group's packages are collected into the
+                    # temporary root and its build sets' staging is
+                    # copied once the whole group has built, in the
+                    # file's order, so no member sees another's output.
+                    #
+                    elif ls[0] == '%parallel':
+                        self._group = self._groups
+                        self._groups += 1
+                    elif ls[0] == '%barrier':
+                        self._group = None
                 else:
                     l = macro_expand(self.macros, l.strip())
                     c = build.find_config(l, self.configs)
@@ -395,6 +618,7 @@ class buildset:
                         raise error.general('%s:%d: cannot find file: %s' %
                                             (self.bset, lc, l))
                     configs += [c]
+                    self.config_groups += [self._group]
         except:
             bset.close()
             raise
@@ -409,8 +633,12 @@ class buildset:
         # If the build set file ends with .cfg the user has passed to the
         # buildset builder a configuration so we just return it.
         #
+        self.config_groups = []
+        self._group = None
+        self._groups = 0
         if self.bset.endswith('.cfg'):
             configs = [self.bset]
+            self.config_groups = [None]
         else:
             exbset = macro_expand(self.macros, self.bset)
             self.macros['_bset'] = exbset
@@ -426,6 +654,77 @@ class buildset:
             configs = self.parse(bset)
         return configs
 
+    def parallel_jobs(self, deps, mail):
+        """The number of packages in a parallel group that can build at the
+        same time. Dependency listing, dry runs and mailed reports build one
+        at a time."""
+        if deps is not None or mail is not None or self.opts.dry_run():
+            return 1
+        jobs = macro_expand(self.macros, '%{_bset_jobs}')
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            raise error.general('invalid build set jobs: %s' % (jobs))
+        return max(1, jobs)
+
+    def smp_jobs(self, builds):
+        """The jobs flags of each of the builds running at the same time so
+        they share the jobs. The jobserver shares the make jobs if it is
+        running."""
+        ncpus = int(self.opts.jobs(macro_expand(self.macros, '%{_ncpus}')))
+        if ncpus <= 1:
+            return None
+        ncpus = max(1, ncpus // builds)
+        if ncpus > 1:
+            return '-j %d' % (ncpus)
+        return macro_expand(self.macros, '%{nil}')
+
+    def build_node(self, _node, deps, nesting_count, mail):
+        """Build a node's configuration or nested build set. An error is held
+        in the node and raised when the node is taken."""
+        config = _node.config
+        _node.fingerprint = _node.chain
+        if config.endswith('.bset'):
+            log.trace('_bset: %2d: %s %s', nesting_count, config,
+                      '=' * (74 - len(config)))
+            bs = buildset(config, self.configs, _node.opts, _node.macros)
+            bs.fingerprint = _node.chain
+            _node.bset = bs
+            try:
+                bs.build(deps, nesting_count, mail)
+            except error.general as gerr:
+                _node.error = gerr
+            _node.fingerprint = bs.fingerprint
+        else:
+            log.trace('_bset: %2d: %s %s', nesting_count, config,
+                      '=' * (74 - len(config)))
+            try:
+                b = build.build(config, self.opts.get_arg('--pkg-tar-files'),
+                                _node.opts, _node.macros)
+            except error.general as gerr:
+                _node.error = gerr
+                return
+            _node.build = b
+            if deps is None:
+                b.fingerprint = _node.chain
+                slots = _build_slots
+                if slots is not None:
+                    slots.acquire()
+                token = jobserver.acquire()
+                if _node.parallel:
+                    collect = _node.collect
+                else:
+                    collect = None
+                try:
+                    self.build_package(config, b, collect)
+                except error.general as gerr:
+                    _node.error = gerr
+                finally:
+                    jobserver.release(token)
+                    if slots is not None:
+                        slots.release()
+                _node.fingerprint = b.fingerprint
+
     def build(self, deps=None, nesting_count=0, mail=None):
 
         build_error = False
@@ -438,10 +737,18 @@ class buildset:
             mail['reports'] = []
             mail['failure'] = None
 
-        log.trace('_bset: %2d: %s: make' % (nesting_count, self.bset))
+        log.trace('_bset: %2d: %s: make', nesting_count, self.bset)
         log.notice('Build Set: %s' % (self.bset))
 
-        current_path = os.environ['PATH']
+        #
+        # A build's path is set in its script from %{_pathprepend} so the
+        # process environment is not changed. Only the top level build set
+        # restores the path as nested build sets can build at the same time.
+        #
+        if nesting_count == 1:
+            current_path = os.environ['PATH']
+        else:
+            current_path = None
 
         start = datetime.datetime.now()
 
@@ -459,8 +766,8 @@ class buildset:
         try:
             configs = self.load()
 
-            log.trace('_bset: %2d: %s: configs: %s' %
-                      (nesting_count, self.bset, ', '.join(configs)))
+            log.trace('_bset: %2d: %s: configs: %s',
+                      nesting_count, self.bset, ', '.join(configs))
 
             if nesting_count == 1:
                 #
@@ -478,108 +785,130 @@ class buildset:
 
             sizes_valid = False
             builds = []
-            for s in range(0, len(configs)):
-                b = None
-                try:
-                    #
-                    # Each section of the build set gets a separate set of
-                    # macros so we do not contaminate one configuration with
-                    # another.
-                    #
-                    opts = copy.copy(self.opts)
-                    macros = copy.copy(self.macros)
-                    if configs[s].endswith('.bset'):
-                        log.trace('_bset: %2d: %s %s' %
-                                  (nesting_count, configs[s], '=' *
-                                   (74 - len(configs[s]))))
-                        bs = buildset(configs[s], self.configs, opts, macros)
-                        bs.build(deps, nesting_count, mail)
-                        self._sources += bs._sources
-                        self._patches += bs._patches
-                        self._hashes += bs._hashes
-                        del bs
-                    elif configs[s].endswith('.cfg'):
-                        if mail:
+            jobs = self.parallel_jobs(deps, mail)
+            if nesting_count == 1:
+                global _build_slots
+                if jobs > 1:
+                    _build_slots = threading.Semaphore(jobs)
+                else:
+                    _build_slots = None
+
+            def work(_node):
+                self.build_node(_node, deps, nesting_count, mail)
+
+            schedule = scheduler(self, configs, self.config_groups, jobs,
+                                 work)
+            try:
+                for s in range(0, len(configs)):
+                    b = None
+                    try:
+                        if not configs[s].endswith('.bset') and \
+                           not configs[s].endswith('.cfg'):
+                            raise error.general('invalid config type: %s' %
+                                                (configs[s]))
+                        if configs[s].endswith('.cfg') and mail:
                             mail_report = True
-                        log.trace('_bset: %2d: %s %s' %
-                                  (nesting_count, configs[s], '=' *
-                                   (74 - len(configs[s]))))
-                        try:
-                            b = build.build(
-                                configs[s],
-                                self.opts.get_arg('--pkg-tar-files'), opts,
-                                macros)
-                        except:
-                            build_error = True
-                            raise
-                        if b.macros.get('%{_disable_reporting}'):
-                            mail_report = False
-                        if deps is None:
-                            self.build_package(configs[s], b)
-                            self.report(configs[s],
-                                        b,
-                                        copy.copy(self.opts),
-                                        copy.copy(self.macros),
-                                        mail=mail)
-                            # Always produce an XML report.
-                            self.report(configs[s],
-                                        b,
-                                        copy.copy(self.opts),
-                                        copy.copy(self.macros),
-                                        format='xml',
-                                        mail=mail)
+                        _node = schedule.run(s)
+                        self.collect(_node)
+                        b = _node.build
+                        if _node.parallel:
+                            self.fingerprint = sourcecache.make_key(
+                                self.fingerprint, _node.fingerprint)
                         else:
-                            deps += b.config.includes()
-                        builds += [b]
-                        #
-                        # Dump post build macros.
-                        #
-                        log.trace('_bset:   : macros post-build')
-                        log.trace(str(b.macros))
-                    else:
-                        raise error.general('invalid config type: %s' %
-                                            (configs[s]))
-                except error.general as gerr:
-                    have_errors = True
-                    if b is not None:
-                        if self.build_failure is None:
-                            self.build_failure = b.name()
-                        self.write_mail_header('')
-                        self.write_mail_header('= ' * 40)
-                        self.write_mail_header('Build FAILED: %s' % (b.name()))
-                        self.write_mail_header('- ' * 40)
-                        self.write_mail_header(str(log.default))
-                        self.write_mail_header('- ' * 40)
-                        if self.opts.keep_going():
-                            log.notice(str(gerr))
-                            if self.opts.always_clean():
-                                builds += [b]
+                            self.fingerprint = _node.fingerprint
+                        if _node.bset is not None:
+                            bs = _node.bset
+                            self._sources += bs._sources
+                            self._patches += bs._patches
+                            self._hashes += bs._hashes
+                            _node.bset = None
+                            del bs
+                            if _node.error is not None:
+                                raise _node.error
+                        else:
+                            if b is None:
+                                build_error = True
+                                raise _node.error
+                            if b.macros.get('%{_disable_reporting}'):
+                                mail_report = False
+                            if _node.error is not None:
+                                raise _node.error
+                            if deps is None:
+                                self.report(configs[s],
+                                            b,
+                                            copy.copy(self.opts),
+                                            copy.copy(self.macros),
+                                            mail=mail)
+                                # Always produce an XML report.
+                                self.report(configs[s],
+                                            b,
+                                            copy.copy(self.opts),
+                                            copy.copy(self.macros),
+                                            format='xml',
+                                            mail=mail)
+                            else:
+                                deps += b.config.includes()
+                            builds += [b]
+                            #
+                            # Dump post build macros.
+                            #
+                            log.trace('_bset:   : macros post-build')
+                            log.trace('%s', b.macros)
+                        _node.build = None
+                    except error.general as gerr:
+                        have_errors = True
+                        if b is not None:
+                            if self.build_failure is None:
+                                self.build_failure = b.name()
+                            self.write_mail_header('')
+                            self.write_mail_header('= ' * 40)
+                            self.write_mail_header('Build FAILED: %s' %
+                                                   (b.name()))
+                            self.write_mail_header('- ' * 40)
+                            self.write_mail_header(str(log.default))
+                            self.write_mail_header('- ' * 40)
+                            if self.opts.keep_going():
+                                log.notice(str(gerr))
+                                if self.opts.always_clean():
+                                    builds += [b]
+                            else:
+                                raise
                         else:
                             raise
-                    else:
-                        raise
+            finally:
+                schedule.stop()
             #
             # Installing or staging ...
             #
-            log.trace('_bset: %2d: mode: %s: deps:%r no-install:%r' % \
-                      (nesting_count, self.install_mode(),
-                       deps is None, self.opts.no_install()))
-            log.trace('_bset: %2d: mode: %s: builds: %s' % \
-                      (nesting_count, self.install_mode(),
-                       ', '.join([b.name() for b in builds])))
+            log.trace('_bset: %2d: mode: %s: deps:%r no-install:%r',
+                      nesting_count, self.install_mode(),
+                      deps is None, self.opts.no_install())
+            log.trace('_bset: %2d: mode: %s: builds: %s',
+                      nesting_count, self.install_mode(),
+                      ', '.join([b.name() for b in builds]))
             if deps is None and not have_errors:
                 for b in builds:
-                    log.trace('_bset:   : %s: installable=%r build-installable=%r' % \
-                              (self.install_mode(), self.installable(), b.installable()))
+                    log.trace('_bset:   : %s: installable=%r build-installable=%r',
+                              self.install_mode(), self.installable(), b.installable())
                     if b.installable():
                         prefix = b.config.expand('%{_prefix}')
                         buildroot = path.join(b.config.expand('%{buildroot}'),
                                               prefix)
+                        stagingroot = b.config.expand('%{stagingroot}')
                         self.install('staging', b.name(), buildroot,
-                                     b.config.expand('%{stagingroot}'))
+                                     stagingroot)
+                        #
+                        # The staging root is installed into the prefix
+                        # once the build set has built so only install
+                        # the package if nothing was staged.
+                        #
                         if self.installable():
-                            self.install('installing', b.name(), buildroot,
-                                         prefix)
+                            if path.exists(stagingroot):
+                                log.trace('_bset:   : installing: %s: staged',
+                                          b.name())
+                            else:
+                                self.install('installing', b.name(),
+                                             buildroot, prefix)
             #
             # Sizes ...
             #
@@ -593,12 +922,15 @@ class buildset:
                     if s > size_build_max:
                         size_build_max = s
                     size_installed += b.get_installed_size()
-                size_sources = 0
-                for p in builds[0].config.expand('%{_sourcedir}').split(':'):
-                    size_sources += path.get_size(p)
-                size_patches = 0
-                for p in builds[0].config.expand('%{_patchdir}').split(':'):
-                    size_patches += path.get_size(p)
+                #
+                # The source and patch directories are only added to so
+                # their directories' sizes are cached between build sets.
+                #
+                sourcedirs = builds[0].config.expand('%{_sourcedir}').split(':')
+                patchdirs = builds[0].config.expand('%{_patchdir}').split(':')
+                dir_sizes = path.get_sizes(sourcedirs + patchdirs, cache=True)
+                size_sources = sum(dir_sizes[:len(sourcedirs)])
+                size_patches = sum(dir_sizes[len(sourcedirs):])
                 size_total = size_sources + size_patches + size_installed
                 build_max_size_human = build.humanize_number(
                     size_build_max + size_installed, 'B')
@@ -646,8 +978,8 @@ class buildset:
                 have_stagingroot = path.exists(stagingroot)
                 do_install = not self.opts.no_install()
                 if do_install:
-                    log.trace('_bset: %2d: install staging, present: %s' % \
-                              (nesting_count, have_stagingroot))
+                    log.trace('_bset: %2d: install staging, present: %s',
+                              nesting_count, have_stagingroot)
                 if have_stagingroot:
                     prefix = macro_expand(self.macros, '%{_prefix}')
                     if do_install:
@@ -657,10 +989,11 @@ class buildset:
                     staging_size = path.get_size(stagingroot)
                     if not self.opts.no_clean() or self.opts.always_clean():
                         log.notice('clean staging: %s' % (self.bset))
-                        log.trace('removing: %s' % (stagingroot))
+                        log.trace('removing: %s', stagingroot)
                         if not self.opts.dry_run():
                             if path.exists(stagingroot):
-                                path.removeall(stagingroot)
+                                trash.remove(stagingroot, self.macros,
+                                             self.opts)
                     log.notice('Staging Size: %s' % \
                                (build.humanize_number(staging_size, 'B')))
         except error.general as gerr:
@@ -676,7 +1009,8 @@ class buildset:
             raise
         finally:
             end = datetime.datetime.now()
-            os.environ['PATH'] = current_path
+            if current_path is not None:
+                os.environ['PATH'] = current_path
             build_time = str(end - start)
             if self.mail_single_report() and nesting_count == 1:
                 mail_report = True
@@ -823,12 +1157,26 @@ def run():
                 raise error.general('prefix is not writable: %s' %
                                     (path.host(prefix)))
 
-            for bset in opts.params():
-                setbuilder_error = True
-                b = buildset(bset, configs, opts)
-                b.build(deps, mail=mail)
-                b = None
-                setbuilder_error = False
+            #
+            # The make jobs of all the packages come from one jobserver.
+            #
+            if deps is None and not mail and \
+               jobserver.start(opts, opts.defaults):
+                opts.defaults['_smp_mflags'] = jobserver.mflags()
+            try:
+                for bset in opts.params():
+                    setbuilder_error = True
+                    b = buildset(bset, configs, opts)
+                    b.build(deps, mail=mail)
+                    b = None
+                    setbuilder_error = False
+            finally:
+                jobserver.stop()
+                trash_errors = trash.drain()
+            if len(trash_errors) > 0 and opts.always_clean():
+                raise error.general('cleaning failed: %d trees not removed' %
+                                    (len(trash_errors)))
+            log.trace('macro expansions: %s', macros.expansions)
 
         if deps is not None:
             c = 0
@@ -25,6 +25,7 @@
 from __future__ import print_function
 
 try:
+    from . import config
     from . import error
     from . import execute
     from . import log
@@ -43,14 +44,14 @@ def expand(macros, line):
     def _exec(shell_macro):
         output = ''
         if len(shell_macro) > 3:
-            e = execute.capture_execution()
             if options.host_windows:
                 cmd = '%s -c "%s"' % (macros.expand('%{__sh}'),
                                       shell_macro[2:-1])
             else:
                 cmd = shell_macro[2:-1]
-            exit_code, proc, output = e.shell(cmd)
-            log.trace('shell-output: %d %s' % (exit_code, output))
+            exit_code, output = execute.shell_macro(
+                cmd, config.shell_pure(macros, cmd))
+            log.trace('shell-output: %d %s', exit_code, output)
             if exit_code != 0:
                 raise error.general('shell macro failed: %s: %d: %s' %
                                     (cmd, exit_code, output))
@@ -31,6 +31,7 @@ import os
 try:
     from . import build
     from . import check
+    from . import configindex
     from . import error
     from . import git
     from . import log
@@ -181,9 +182,9 @@ def find_bset_config(bset_config, macros):
         for cp in macros.expand('%{_configdir}').split(':'):
             configdir = path.abspath(cp)
             name = path.join(configdir, bset_config)
-            if path.exists(name):
+            if configindex.exists(name):
                 break
-            elif path.exists(name + '.binc'):
+            elif configindex.exists(name + '.binc'):
                 name += '.binc'
                 break
             name = None
@@ -426,7 +427,7 @@ class buildset:
             self.macros = copy.copy(macros)
         self.macros.define('_rsb_getting_source', '1')
         log.trace('_bset: %s: macro defaults' % (bset))
-        log.trace(str(self.macros))
+        log.trace('%s', self.macros)
         self.bset = bset
         _target = self.macros.expand('%{_target}')
         if len(_target):
@@ -705,7 +706,7 @@ class buildset:
                         #
                         log.trace('_bset: %2d: macros post-build' %
                                   (nesting_count))
-                        log.trace(str(macros))
+                        log.trace('%s', macros)
                     else:
                         raise error.general('invalid config type: %s' %
                                             (config))
@@ -0,0 +1,203 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# A cache of extracted and patched source trees. A tree is stored under a
+# key made from the hashes of the source and patch files and the commands
+# used to extract and patch them. A build with the same key clones the
+# tree into its build directory rather than extracting and patching the
+# source again.
+#
+# Each entry is a directory named by its key holding the tree and a file
+# with the tree's size. The entry directory's modification time is the
+# last time it was used and the least recently used entries are removed
+# when the cache is bigger than its size budget.
+#
+
+from __future__ import print_function
+
+import hashlib
+import os
+import threading
+
+from . import error
+from . import log
+from . import path
+
+#
+# Bump if the layout of an entry changes.
+#
+version = 1
+
+#
+# The open caches by directory.
+#
+_caches = {}
+
+
+def _parse_size(size):
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    size = size.strip().upper()
+    if size.endswith('B'):
+        size = size[:-1]
+    scale = 1
+    if size[-1:] in units:
+        scale = units[size[-1]]
+        size = size[:-1]
+    try:
+        return int(float(size) * scale)
+    except ValueError:
+        raise error.general('invalid cache size: %s' % (size))
+
+
+def _tree_size(tree):
+    size = 0
+    for root, dirs, files in os.walk(path.host(tree)):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def make_key(*items):
+    key = repr((version, ) + items).encode('utf-8')
+    return hashlib.sha256(key).hexdigest()
+
+
+class cache:
+    """A size limited cache of source trees."""
+
+    label = 'source cache'
+
+    def __init__(self, directory, size, clone):
+        self.directory = directory
+        self.size = size
+        self.clone = clone
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _entry(self, key):
+        return path.join(self.directory, key)
+
+    def _tmp(self, entry):
+        """A temporary name for an entry being added. Builds in other
+        threads can add the same key at once so each add has its own."""
+        with self.lock:
+            self.count += 1
+            count = self.count
+        return '%s.tmp-%d-%d' % (entry, os.getpid(), count)
+
+    def get(self, key, dst):
+        """Clone the tree of the key to the destination. Return False if
+        the key is not in the cache."""
+        entry = self._entry(key)
+        tree = path.join(entry, 'tree')
+        if not path.isdir(tree):
+            return False
+        try:
+            os.utime(path.host(entry), None)
+            if path.exists(dst):
+                path.removeall(dst)
+            mode = path.clone_tree(tree, dst, self.clone)
+        except (error.general, OSError) as err:
+            #
+            # Another build may have removed the entry.
+            #
+            log.output('%s: %s: get failed: %s' % (self.label, key, err))
+            if path.exists(dst):
+                path.removeall(dst)
+            return False
+        log.output('%s: %s: hit: %s (%s)' % (self.label, key, dst, mode))
+        return True
+
+    def put(self, key, src):
+        """Add a copy of the tree to the cache. Failing to add a tree is not
+        an error."""
+        entry = self._entry(key)
+        if path.exists(entry):
+            return
+        tmp = self._tmp(entry)
+        try:
+            if path.exists(tmp):
+                path.removeall(tmp)
+            path.mkdir(tmp)
+            mode = path.clone_tree(src, path.join(tmp, 'tree'), self.clone)
+            size = _tree_size(src)
+            with open(path.host(path.join(tmp, 'size')), 'w') as f:
+                f.write('%d\n' % (size))
+            os.rename(path.host(tmp), path.host(entry))
+            log.output('%s: %s: added: %s (%s)' %
+                       (self.label, key, src, mode))
+        except (error.general, IOError, OSError) as err:
+            log.output('%s: %s: put failed: %s' % (self.label, key, err))
+            if path.exists(tmp):
+                path.removeall(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        its size budget."""
+        entries = []
+        total = 0
+        for name in path.listdir(self.directory):
+            entry = path.join(self.directory, name)
+            if '.tmp-' in name or not path.isdir(entry):
+                continue
+            try:
+                with open(path.host(path.join(entry, 'size'))) as f:
+                    size = int(f.read())
+                used = os.stat(path.host(entry)).st_mtime
+            except (IOError, OSError, ValueError):
+                continue
+            entries += [(used, size, entry)]
+            total += size
+        for used, size, entry in sorted(entries):
+            if total <= self.size:
+                break
+            log.output('%s: evict: %s' % (self.label, path.basename(entry)))
+            try:
+                path.removeall(entry)
+                total -= size
+            except (IOError, OSError):
+                pass
+
+
+def open_cache(config, opts):
+    """Return the source cache or None if it is disabled."""
+    if opts.no_source_cache() or opts.dry_run():
+        return None
+    directory = config.expand('%{_source_cache_dir}')
+    if len(directory) == 0:
+        return None
+    directory = path.abspath(directory)
+    if directory not in _caches:
+        path.mkdir(directory)
+        clone = config.expand('%{_source_cache_clone}')
+        if clone not in ['reflink', 'hardlink', 'copy']:
+            raise error.general('invalid source cache clone mode: %s' %
+                                (clone))
+        _caches[directory] = \
+            cache(directory,
+                  _parse_size(config.expand('%{_source_cache_size}')),
+                  clone)
+        _caches[directory].evict()
+    return _caches[directory]
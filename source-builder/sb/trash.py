@@ -0,0 +1,206 @@
+#
+# RTEMS Tools Project (http://www.rtems.org/)
+# Copyright 2026 Chris Johns (chrisj@rtems.org)
+# All rights reserved.
+#
+# This file is part of the RTEMS Tools package in 'rtems-tools'.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+#
+# Remove build trees in the background. A tree is renamed into the trash
+# directory, which is atomic so the tree's path can be used again at once,
+# and a pool of threads removes it while the build continues. A tree that
+# cannot be renamed into the trash, for example it is on another file
+# system, is removed before the builder continues so nothing is left for
+# a purge to find.
+#
+# The number of trees waiting to be removed is limited. A removal that
+# takes the trash over its limit waits for a tree to be removed. A tree is
+# not measured as that takes as long as removing it. The trash is drained
+# before the builder exits and anything left in the trash by a builder that
+# did not exit cleanly is removed when the trash is opened. The trees that
+# could not be removed are reported when the trash is drained.
+#
+
+from __future__ import print_function
+
+import atexit
+import collections
+import errno
+import os
+import threading
+
+from . import error
+from . import log
+from . import path
+
+#
+# The number of threads removing trees.
+#
+workers = 2
+
+#
+# The open trash or None.
+#
+_trash = None
+_trash_lock = threading.Lock()
+
+
+class trash:
+    """A directory of trees waiting to be removed."""
+
+    def __init__(self, directory, trees):
+        self.directory = directory
+        self.trees = trees
+        self.lock = threading.Condition()
+        self.queue = collections.deque()
+        self.pending = 0
+        self.count = 0
+        self.threads = []
+        self.errors = []
+
+    def _name(self, tree):
+        with self.lock:
+            self.count += 1
+            count = self.count
+        return path.join(self.directory,
+                         '%s.trash-%d-%d' % (path.basename(tree), os.getpid(),
+                                             count))
+
+    def _add(self, tree):
+        with self.lock:
+            self.queue.append(tree)
+            self.pending += 1
+            if len(self.threads) < workers:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                self.threads += [thread]
+                thread.start()
+            self.lock.notify()
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while len(self.queue) == 0:
+                    self.lock.wait()
+                tree = self.queue.popleft()
+            try:
+                path.removeall(tree)
+            except (error.general, IOError, OSError) as err:
+                with self.lock:
+                    self.errors += ['%s: %s' % (tree, err)]
+            with self.lock:
+                self.pending -= 1
+                self.lock.notify_all()
+
+    def remove(self, tree):
+        """Move the tree into the trash to be removed. If the tree cannot be
+        moved it is removed before returning."""
+        name = self._name(tree)
+        try:
+            os.rename(path.host(tree), path.host(name))
+        except OSError as err:
+            log.trace('trash: %s: cannot move: %s', tree, err)
+            path.removeall(tree)
+            return
+        log.trace('trash: %s -> %s', tree, name)
+        self._add(name)
+        with self.lock:
+            while self.pending > self.trees and len(self.queue) > 0:
+                self.lock.wait()
+
+    def drain(self):
+        """Wait for the trees in the trash to be removed. The trees that
+        could not be removed are returned."""
+        with self.lock:
+            if self.pending > 0:
+                log.trace('trash: draining: %d trees', self.pending)
+            while self.pending > 0 or len(self.queue) > 0:
+                self.lock.wait()
+            errors = self.errors
+            self.errors = []
+        for e in errors:
+            log.warning('trash: removing failed: %s' % (e))
+        return errors
+
+    def purge(self):
+        """Remove the trees left in the trash by a builder that did not
+        finish. The trees of a builder still running are its to remove."""
+        for name in path.listdir(self.directory):
+            if not _running(name):
+                self._add(path.join(self.directory, name))
+
+
+def _running(name):
+    """Is the builder that put the tree in the trash running?"""
+    try:
+        pid = int(name.split('.trash-')[-1].split('-')[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False
+    if path.windows:
+        #
+        # A signal terminates a Windows process so assume it is running.
+        #
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def open_trash(config, opts):
+    """Return the trash or None if trees are removed when cleaned."""
+    global _trash
+    if opts.dry_run():
+        return None
+    directory = config.expand('%{_trash_dir}')
+    if len(directory) == 0:
+        return None
+    directory = path.abspath(directory)
+    with _trash_lock:
+        if _trash is None or _trash.directory != directory:
+            errors = drain()
+            trees = config.expand('%{_trash_trees}')
+            try:
+                trees = int(trees)
+            except ValueError:
+                raise error.general('invalid trash trees: %s' % (trees))
+            path.mkdir(directory)
+            _trash = trash(directory, max(1, trees))
+            _trash.errors = errors
+            _trash.purge()
+        return _trash
+
+
+def remove(tree, config, opts):
+    """Remove a tree in the background if there is a trash."""
+    t = open_trash(config, opts)
+    if t is None:
+        path.removeall(tree)
+    else:
+        t.remove(tree)
+
+
+def drain():
+    """Wait for the trash to be removed and return the trees that could
+    not be removed."""
+    if _trash is not None:
+        return _trash.drain()
+    return []
+
+
+atexit.register(drain)